@@ -0,0 +1,261 @@
+################################################
+# Packages
+################################################
+import os
+import time
+
+import pandas as pd
+import panel as pn
+from panel.viewable import Viewer
+
+from app_utils import styles, metrics, routes
+
+
+################################################
+# Initialize Panel
+################################################
+pn.extension('tabulator', design = styles.THEMES['page_design'])
+pn.config.theme = styles.THEMES['page_theme']
+
+
+################################################
+# Admin Page
+################################################
+# Note: this page is served by the same server process as the app (i.e. 'panel serve app.py admin.py --setup server_setup.py'),
+    # so it can see every live session of the app (see 'metrics.SESSIONS').
+    # Slow updates and cache hit rates are only recorded if metrics are enabled (see 'app_utils.metrics').
+
+# Note: the admin actions (ending a session and evicting the session caches) affect every user of the server process, so they are off by default.
+    # They are turned on with the 'BAGLE_ADMIN_ACTIONS' environment variable (e.g. 'BAGLE_ADMIN_ACTIONS=1 panel serve app.py admin.py ...'),
+    # and are then only shown to logged-in users (e.g. with '--basic-auth') or to admin pages opened from the server's own machine.
+    # Behind a proxy, every page is opened from the proxy's address unless the server is run with '--use-xheaders'.
+ACTIONS_ENABLED = os.environ.get('BAGLE_ADMIN_ACTIONS', '0') not in ['', '0']
+
+# Addresses of pages opened from the server's own machine
+LOCAL_ADDRESSES = ['127.0.0.1', '::1']
+
+
+def is_action_allowed():
+    '''
+    Returns whether the admin actions can be used by the current admin page session (see 'ACTIONS_ENABLED').
+    '''
+    if ACTIONS_ENABLED == False:
+        return False
+
+    # Note: panel's user is 'guest' for guest logins, and None without a login
+    if pn.state.user not in [None, 'guest']:
+        return True
+
+    doc = pn.state.curdoc
+    if (doc == None) or (doc.session_context == None) or (doc.session_context.request == None):
+        return False
+    return doc.session_context.request.remote_ip in LOCAL_ADDRESSES
+
+
+class AdminPage(Viewer):
+    # Time (in milliseconds) between refreshes of the page
+    REFRESH_PERIOD = 2000
+
+    # Number of the slowest recent updates that are listed
+    NUM_SLOW_UPDATES = 20
+
+    def __init__(self, **params):
+        super().__init__(**params)
+
+        self.page_title = pn.pane.HTML(
+            object = f'''
+                <span style="color:{styles.CLRS['txt_primary']};font-size:{styles.FONTSIZES['page_title']}; font-weight:600;">
+                    BAGLE Calculator Admin
+                </span>
+            '''
+        )
+
+        self.status_text = pn.widgets.StaticText(value = '')
+
+        # Tables
+        self.tables = {}
+        for table_name, selectable in [('sessions', 1), ('slow_updates', False), ('caches', False), ('pools', False)]:
+            self.tables[table_name] = pn.widgets.Tabulator(
+                value = pd.DataFrame(),
+                disabled = True,
+                selectable = selectable,
+                show_index = False,
+                text_align = 'left',
+                layout = 'fit_data_table',
+                stylesheets = [styles.TABLTR_STYLESHEET]
+            )
+
+        # Actions
+            # Note: the request of a session doesn't change, so this is only checked once per admin page
+        self.actions_allowed = is_action_allowed()
+        if self.actions_allowed == True:
+            self.end_session_btn = pn.widgets.Button(name = 'End Selected Session', button_type = 'danger')
+            self.end_session_btn.on_click(self._end_selected_session)
+
+            self.evict_btn = pn.widgets.Button(name = 'Evict Session Caches', button_type = 'warning')
+            self.evict_btn.on_click(self._evict_caches)
+
+            self.actions_row = pn.Row(self.end_session_btn, self.evict_btn)
+        else:
+            self.actions_row = pn.widgets.StaticText(
+                value = 'Actions are off (set BAGLE_ADMIN_ACTIONS=1, and log in or open this page from the server\'s machine).'
+            )
+
+        self.page_layout = pn.Column(
+            self.page_title,
+            self.status_text,
+            pn.pane.Markdown('### Live Sessions'),
+            self.tables['sessions'],
+            self.actions_row,
+            pn.pane.Markdown(f'### Slowest Recent Updates (top {self.NUM_SLOW_UPDATES})'),
+            self.tables['slow_updates'],
+            pn.pane.Markdown('### Caches'),
+            self.tables['caches'],
+            pn.pane.Markdown('### Worker Pools'),
+            self.tables['pools'],
+            styles = {'padding-left':'2%', 'padding-right':'2%'}
+        )
+
+        self.refresh()
+
+
+    def get_sessions_df(self):
+        session_rows = []
+        for session_id, (start_time, app, session_context) in list(metrics.SESSIONS.items()):
+            dashboard = app.dashboard
+            cache_bytes = sum(num_bytes for num_entries, num_bytes in dashboard.get_cache_info().values())
+            server_session = session_context.session
+            session_rows.append({
+                'Session': session_id,
+                'Age (min)': round((time.time() - start_time) / 60, 1),
+                'Paramztn': app.paramztn_row.selected_paramztn,
+                'Num_pts': dashboard.settings_tabs.param_sliders['Num_pts'].value,
+                'Enabled': ', '.join(dashboard.settings_tabs.dashboard_checkbox.value),
+                'Cache (MB)': round(cache_bytes / 1e6, 2),
+                'Connections': server_session.connection_count if server_session != None else 0
+            })
+
+        return pd.DataFrame(session_rows, columns = ['Session', 'Age (min)', 'Paramztn', 'Num_pts', 'Enabled', 'Cache (MB)', 'Connections'])
+
+
+    def get_slow_updates_df(self):
+        update_rows = []
+        for update_span in metrics.get_slowest_updates(self.NUM_SLOW_UPDATES):
+            # Note: stages inside of the update are listed from slowest to fastest
+            breakdown = sorted(update_span['breakdown'].items(), key = lambda item: -item[1])
+            update_rows.append({
+                'Time': time.strftime('%H:%M:%S', time.localtime(update_span['time'])),
+                'Stage': update_span['stage'],
+                'Duration (ms)': round(1000 * update_span['duration'], 1),
+                'Paramztn': update_span['tags'].get('paramztn'),
+                'Num_pts': update_span['tags'].get('num_pts'),
+                'Breakdown (ms)': ', '.join(f'{stage}: {1000 * duration:.1f}' for stage, duration in breakdown)
+            })
+
+        return pd.DataFrame(update_rows, columns = ['Time', 'Stage', 'Duration (ms)', 'Paramztn', 'Num_pts', 'Breakdown (ms)'])
+
+
+    def get_caches_df(self):
+        cache_requests = {}
+        for (counter_name, labels), val in list(metrics.COUNTERS.items()):
+            if counter_name == 'cache_requests':
+                labels = dict(labels)
+                cache_requests.setdefault(labels['cache'], {'hit': 0, 'miss': 0})
+                cache_requests[labels['cache']][labels['result']] += val
+
+        cache_rows = []
+        for cache_name, (num_entries, num_bytes) in routes.get_cache_totals().items():
+            requests = cache_requests.get(cache_name, {'hit': 0, 'miss': 0})
+            num_requests = requests['hit'] + requests['miss']
+            cache_rows.append({
+                'Cache': cache_name,
+                'Entries': num_entries,
+                'Memory (MB)': round(num_bytes / 1e6, 2),
+                'Hits': requests['hit'],
+                'Misses': requests['miss'],
+                'Hit Rate': f'{100 * requests["hit"] / num_requests:.1f}%' if num_requests != 0 else '-'
+            })
+
+        return pd.DataFrame(cache_rows, columns = ['Cache', 'Entries', 'Memory (MB)', 'Hits', 'Misses', 'Hit Rate'])
+
+
+    def get_pools_df(self):
+        # Note: the queue and threads of a ThreadPoolExecutor aren't public, so they are read from '_work_queue', '_threads', and '_max_workers'
+        pool_rows = []
+        for pool_name, pool in routes.WORKER_POOLS.items():
+            pool_rows.append({
+                'Pool': pool_name,
+                'Threads': len(pool._threads),
+                'Max Threads': pool._max_workers,
+                'Queued Tasks': pool._work_queue.qsize()
+            })
+
+        return pd.DataFrame(pool_rows, columns = ['Pool', 'Threads', 'Max Threads', 'Queued Tasks'])
+
+
+    def refresh(self):
+        selected_session = self.get_selected_session()
+
+        self.tables['sessions'].value = self.get_sessions_df()
+        self.tables['slow_updates'].value = self.get_slow_updates_df()
+        self.tables['caches'].value = self.get_caches_df()
+        self.tables['pools'].value = self.get_pools_df()
+
+        # Keep the selected session selected (if it's still live)
+        session_ids = list(self.tables['sessions'].value['Session'])
+        if selected_session in session_ids:
+            self.tables['sessions'].selection = [session_ids.index(selected_session)]
+        else:
+            self.tables['sessions'].selection = []
+
+        metrics_str = 'on' if metrics.ENABLED == True else 'off (set BAGLE_METRICS=1 to record slow updates and cache hit rates)'
+        self.status_text.value = (f'{len(session_ids)} live session(s). Metrics are {metrics_str}. '
+                                  f'Updated at {time.strftime("%H:%M:%S")}.')
+
+
+    def get_selected_session(self):
+        sessions_table = self.tables['sessions']
+        if (len(sessions_table.selection) == 0) or (len(sessions_table.value) == 0):
+            return None
+        return sessions_table.value['Session'].iloc[sessions_table.selection[0]]
+
+
+    def _end_selected_session(self, event):
+        if self.actions_allowed == False:
+            return
+
+        session_id = self.get_selected_session()
+        if session_id != None:
+            # Note: the caches are cleared right away, since the session's app isn't freed until the server discards the session
+            if session_id in metrics.SESSIONS:
+                metrics.SESSIONS[session_id][1].dashboard.clear_caches()
+            metrics.end_session(session_id)
+
+        self.refresh()
+
+
+    def _evict_caches(self, event):
+        '''
+        Empties the caches of every live session (i.e. trace states, derived parameters, and code segments).
+        Note: the parameterization catalog is left alone, since it's shared by the live sessions (see 'app_utils.catalog').
+        '''
+        if self.actions_allowed == False:
+            return
+
+        for start_time, app, session_context in list(metrics.SESSIONS.values()):
+            app.dashboard.clear_caches()
+
+        self.refresh()
+
+
+    def __panel__(self):
+        return self.page_layout
+
+
+################################################
+# Serve Admin Page
+################################################
+# Used to serve with panel serve in command line
+admin_page = AdminPage()
+pn.state.add_periodic_callback(admin_page.refresh, period = AdminPage.REFRESH_PERIOD)
+admin_page.servable(title = 'BAGLE Calculator Admin')
@@ -4,7 +4,7 @@
 import panel as pn
 from panel.viewable import Viewer
 
-from app_utils import styles, traces, indicators, logos
+from app_utils import styles, traces, indicators, logos, updates, warm_pool, lazy_imports, metrics, recorder
 from app_components import mod_select, paramztn_select, settings_tabs, param_summary, color_panel, plots, code_display
 
 
@@ -16,19 +16,31 @@ pn.extension('tabulator', 'plotly', 'codeeditor', 'floatpanel', design = styles.
 pn.config.theme = styles.THEMES['page_theme']
 pn.config.raw_css.append(styles.PAGE_RAW_CSS)
 
+# Import BAGLE, celerite, and plotly in the background (only once per server process, see 'app_utils.lazy_imports')
+lazy_imports.start_warmup()
+
 
 ################################################
 # Dashboard - Layout
 ################################################
 class Dashboard(Viewer):
     def __init__(self, paramztn_info, **params):
-        # Note: the order in which the components are instantiated will determine precedence for updates that have the same dependency
+        # Note: the update scheduler determines the order of updates that are triggered by the same change (see 'app_utils.updates')
+        self.scheduler = updates.UpdateScheduler()
 
         # Parameter section
         self.paramztn_info = paramztn_info
         self.settings_tabs = settings_tabs.SettingsTabs(paramztn_info = self.paramztn_info)
         super().__init__(**params)
-        self.param_summary = param_summary.ParamSummary(paramztn_info = self.paramztn_info, settings_info = self.settings_tabs)
+
+        # Trace information
+            # Note: this is made before the parameter summary, since the summary reuses the model made by the trace updates
+        self.trace_info = traces.AllTraceInfo(paramztn_info = self.paramztn_info, settings_info = self.settings_tabs, 
+                                              scheduler = self.scheduler)
+
+        # Parameter summary
+        self.param_summary = param_summary.ParamSummary(paramztn_info = self.paramztn_info, settings_info = self.settings_tabs, 
+                                                        trace_info = self.trace_info, scheduler = self.scheduler)
         self.param_row = pn.FlexBox(
             self.param_summary, 
             self.settings_tabs, 
@@ -37,19 +49,17 @@ class Dashboard(Viewer):
             styles = {'height':'35%'}
         )
 
-        # Trace information
-        self.trace_info = traces.AllTraceInfo(paramztn_info = self.paramztn_info, settings_info = self.settings_tabs)
-
         # Color information
-        self.color_panel = color_panel.ColorPanel(settings_info = self.settings_tabs, trace_info = self.trace_info)
+        self.color_panel = color_panel.ColorPanel(settings_info = self.settings_tabs, trace_info = self.trace_info, 
+                                                  scheduler = self.scheduler)
 
         # Plot section
         self.plot_panel = plots.PlotPanel(paramztn_info = self.paramztn_info, settings_info = self.settings_tabs, 
-                                          trace_info = self.trace_info, clr_info = self.color_panel)
+                                          trace_info = self.trace_info, clr_info = self.color_panel, scheduler = self.scheduler)
         
         # Code section
         self.code_panel = code_display.CodePanel(paramztn_info = self.paramztn_info, settings_info = self.settings_tabs, 
-                                                 trace_info = self.trace_info, clr_info = self.color_panel)
+                                                 trace_info = self.trace_info, clr_info = self.color_panel, scheduler = self.scheduler)
         
         self.main_content = pn.FlexBox(
             self.plot_panel,
@@ -69,6 +79,9 @@ class Dashboard(Viewer):
                       'width':'100%'}
         )
 
+        # Indicator shown while a selected parameterization is loading (reused every time it's shown)
+        self.startup_indicator = indicators.get_indicator('startup')
+
         # Entire dashboard layout
         self.db_components = self.set_db_components()
         self.dashboard_layout = pn.FlexBox(
@@ -77,6 +90,10 @@ class Dashboard(Viewer):
             align_content = 'center'
         )
 
+        # Define dependencies
+        self.scheduler.register('layout', self._update_layout)
+        self.scheduler.subscribe(self.settings_tabs.dashboard_checkbox, 'value', ['layout'])
+
 
     def set_db_components(self):
         db_components = {}
@@ -90,9 +107,26 @@ class Dashboard(Viewer):
         db_components['code'] = self.code_panel.code_layout
         
         return db_components
+
+
+    def get_cache_info(self):
+        '''
+        Returns a dictionary of cache name to (number of entries, estimated bytes) for all caches of this dashboard.
+        '''
+        return {**self.trace_info.get_cache_info(), **self.param_summary.get_cache_info(), **self.code_panel.get_cache_info()}
+
+
+    def clear_caches(self):
+        '''
+        Empties all caches of this dashboard (e.g. to free memory from the admin page). The caches are refilled by later updates.
+        '''
+        self.trace_info.clear_caches()
+        self.param_summary.clear_caches()
+        self.code_panel.clear_caches()
     
 
     @pn.depends('paramztn_info.selected_paramztn', watch = True)
+    @updates.hold_updates
     def _hide_show(self):
         '''
         Note: Use .clear() and populate the dashboard instead of .visible = True/False. 
@@ -107,7 +141,7 @@ class Dashboard(Viewer):
             # Note: 'set_default_tabs' leads to 'trigger_param_change', which will update everything else (e.g. plots, summary table, etc.)
             # Note: 'selected_paramztn' dependency of set_default_tabs could also be put in settings_tabs.py, 
                 # but I chose to put it here to update everything before dashboard gets populated. This is the same with 'set_loading_layout' and 'reset_scroll'.
-            self.dashboard_layout.objects = [indicators.get_indicator('startup')]
+            self.dashboard_layout.objects = [self.startup_indicator]
             self.param_summary.reset_scroll()
             self.code_panel.reset_scroll()
             self.plot_panel.set_loading_layout()
@@ -120,7 +154,7 @@ class Dashboard(Viewer):
             self.dashboard_layout.objects = [self.main_row, self.param_row]
 
 
-    @pn.depends('settings_tabs.dashboard_checkbox.value', watch = True)
+    @updates.hold_updates
     def _update_layout(self, *event):
         self.plot_panel.set_loading_layout()
         unchecked_components = set(self.db_components.keys()) - set(self.settings_tabs.dashboard_checkbox.value)
@@ -147,9 +181,8 @@ class Dashboard(Viewer):
                     for box in self.plot_panel.plot_boxes.values():
                         box.styles = styles.EXPANDED_PLOTBOX_STYLES
 
-                    # This is a makeshift way to reset the scroll on the plot_layout flexbox
-                        # There may be a better way to do this without JS
-                    self.plot_panel.plot_layout.append(None)
+                    # Reset the scroll on the plot_layout flexbox
+                    self.plot_panel.reset_scroll()
 
                 # At least 1 plot, and code not displayed
                 case [True, False]:
@@ -286,6 +319,10 @@ class BAGLECalc(Viewer):
                       'overflow-x':'scroll'}
         )
 
+        # Hidden inputs used to measure the client-observed latency of the plot updates (see 'app_utils.client_latency')
+        if self.dashboard.plot_panel.render_tracker != None:
+            self.page_layout.append(self.dashboard.plot_panel.render_tracker.layout)
+
     def __panel__(self):
         # Center content
         return self.page_layout
@@ -295,4 +332,9 @@ class BAGLECalc(Viewer):
 # Serve App
 ################################################
 # Used to serve with panel serve in command line
-BAGLECalc().servable(title = 'BAGLE Calculator')
+    # Note: if the warm pool is enabled, a pre-built app instance is used for this session (see 'app_utils.warm_pool')
+    # If recording is turned on, the session's widget changes are recorded (see 'app_utils.recorder')
+bagle_calc = warm_pool.APP_POOL.get(BAGLECalc)
+metrics.register_session(bagle_calc)
+recorder.record_session(bagle_calc)
+bagle_calc.servable(title = 'BAGLE Calculator')
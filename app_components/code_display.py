@@ -1,14 +1,16 @@
 ################################################
 # Packages
 ################################################
+import string
 import textwrap
+import collections
 import numpy as np
 
 import panel as pn
 from panel.viewable import Viewer
 import param
 
-from app_utils import indicators, styles, traces
+from app_utils import indicators, styles, traces, updates, metrics, profiling
 from app_components import paramztn_select, settings_tabs, color_panel
 
 
@@ -20,10 +22,51 @@ class CodePanel(Viewer):
     settings_info = param.ClassSelector(class_ = settings_tabs.SettingsTabs)
     trace_info = param.ClassSelector(class_ = traces.AllTraceInfo)
     clr_info = param.ClassSelector(class_ = color_panel.ColorPanel)
+    scheduler = param.ClassSelector(class_ = updates.UpdateScheduler)
+
+    # Time (in milliseconds) without changes before the code is remade. This keeps code generation out of slider drags.
+    CODE_DEBOUNCE_INTERVAL = 300
+
+    # Maximum number of cached photometry/astrometry code segments
+    CODE_CACHE_SIZE = 16
+
+    # Code to import packages
+    PACKAGE_CODE = textwrap.dedent('''
+        ################################################
+        # Packages
+        ################################################
+        import numpy as np
+        import itertools
+        import plotly.graph_objects as go
+        
+        from bagle import model
+        
+        # Note: celerite is only used for Gaussian Process
+        import celerite
+    ''')
+
+    # Small note on where data and figures are stored
+    ACCESS_CODE = textwrap.dedent('''
+                               
+        ################################################
+        # Accessing Data and Figures
+        ################################################
+        # Data can be accessed through the dictionary: data_dict
+        # Figures can be accessed through the dictionary: fig_dict
+                               
+        # To see the what data and figures are available, use the .keys() method of dictionaries.
+    ''')
 
     
     def __init__(self, **params):
         super().__init__(**params)
+        # Cached code templates and segments (see 'get_mod_time_template' and 'get_plot_code')
+        self.mod_time_templates = {}
+        self.code_segments = collections.OrderedDict()
+
+        # Pending debounced code update
+        self.render_callback = None
+
         # Dictionary to store extra astrometry trace code functions
         self.extra_ast_code_fns = {
             'ps_res_len': self.get_ps_res_len_code,
@@ -34,9 +77,6 @@ class CodePanel(Viewer):
             'lens': self.get_lens_code
         }
 
-        # Variable to store 'Num_samps' slider watcher for wasy unwatching
-        self.samps_watcher = None
-
         self.code_display = pn.widgets.CodeEditor(
             name = 'code_display',
             sizing_mode = 'stretch_both', 
@@ -47,6 +87,9 @@ class CodePanel(Viewer):
             readonly = True
         )
 
+        # Indicator shown when the code can't be updated (reused every time it's shown)
+        self.error_indicator = indicators.get_indicator('error')
+
         self.code_layout = pn.FlexBox(
             self.code_display,
             sizing_mode = 'stretch_both',
@@ -57,40 +100,32 @@ class CodePanel(Viewer):
         )
         
         # Set dependencies
-        self.settings_info.param_sliders['Num_pts'].param.watch(self._update_code_str, 'value', precedence = 10)
+        # Note: the code is generated after the plots so that errors are caught by the plots first
+        self.scheduler.register('code', self._update_code_str, 
+                                after = ['layout', 'selected_plots', 'extra_ast_traces', 'gp_samps', 'plot_theme', 'all_plots'])
+
+        code_sources = [
+            (self.settings_info, 'trigger_param_change'),
+            (self.settings_info.dashboard_checkbox, 'value'),
+            (self.settings_info.phot_checkbox, 'value'),
+            (self.settings_info.ast_checkbox, 'value'),
+            (self.settings_info.param_sliders['Num_pts'], 'value'),
+            (self.settings_info.param_sliders['Num_samps'], 'value'),
+            (self.clr_info.theme_dropdown, 'value'),
+            (self.clr_info, 'fig_clrs'),
+            (self.clr_info, 'trace_clr_change')
+        ]
+
+        for obj, parameter_name in code_sources:
+            self.scheduler.subscribe(obj, parameter_name, ['code'])
 
         for error_bool in self.settings_info.errored_state.values():
             error_bool.param.watch(self.set_errored_layout, 'value', precedence = 10)
 
-        for clr_picker in self.clr_info.fig_clr_pickers.values():
-            clr_picker.param.watch(self._update_code_str, 'value', precedence = 10)
-        
-        for trace_key in self.clr_info.trace_clr_pickers.keys():
-            for clr_key in self.clr_info.trace_clr_pickers[trace_key].keys():
-                # Note: secondary color has a no dependency because I am only plotting the full time trace
-                if clr_key == 'pri_clr':
-                    clr_picker = self.clr_info.trace_clr_pickers[trace_key]['pri_clr']
-                    clr_picker.param.watch(self._update_code_str, 'value', precedence = 10)
-                elif clr_key == 'clr_cycle':
-                    for clr_picker in self.clr_info.trace_clr_pickers[trace_key]['clr_cycle']:
-                        clr_picker.param.watch(self._update_code_str, 'value', precedence = 10)
-        
-        self.clr_info.theme_dropdown.param.watch(self._update_code_str, 'value', precedence = 10)
-
-    @pn.depends('paramztn_info.selected_paramztn', watch = True)
-    def set_samps_dependency(self):
-        # Unwatch first if exists
-        if self.samps_watcher != None:
-            self.settings_info.param_sliders['Num_samps'].param.unwatch(self.samps_watcher)
-            self.samps_watcher = None
-
-        if (self.paramztn_info.selected_paramztn != None) and ('GP' in self.paramztn_info.selected_paramztn):
-            self.samps_watcher = self.settings_info.param_sliders['Num_samps'].param.watch(self._update_code_str, 'value')
-
 
     def set_errored_layout(self, *event):
         if event[0].obj.value == True:
-            self.code_layout.objects = [indicators.get_indicator('error')]
+            self.code_layout.objects = [self.error_indicator]
 
 
     def reset_scroll(self):
@@ -618,104 +653,145 @@ class CodePanel(Viewer):
     ################################################
     # Main Code
     ################################################
-    @pn.depends('settings_info.trigger_param_change', 'settings_info.dashboard_checkbox.value',
-                'settings_info.phot_checkbox.value', 'settings_info.ast_checkbox.value', watch = True)
-    def _update_code_str(self, *event):
-        # Check if code panel is displayed.
-        # Check if lock is on.
-        if 'code' in self.settings_info.dashboard_checkbox.value:
-            if (self.settings_info.lock_trigger == False) and (self.clr_info.lock_trigger == False):
-                # Code to import packages
-                package_code = '''
-                    ################################################
-                    # Packages
-                    ################################################
-                    import numpy as np
-                    import itertools
-                    import plotly.graph_objects as go
-                    
-                    from bagle import model
-                    
-                    # Note: celerite is only used for Gaussian Process
-                    import celerite
+    def get_mod_time_template(self):
+        '''
+        Returns the code to instantiate the BAGLE model and time points, with '$' placeholders for the values (see 'string.Template').
+        Note: the template only depends on the parameterization, so it is cached and only the values are substituted on a parameter change.
+        '''
+        selected_paramztn = self.paramztn_info.selected_paramztn
+        if selected_paramztn in self.mod_time_templates:
+            return self.mod_time_templates[selected_paramztn]
+
+        mod_params_str = ''''''
+        param_keys = self.paramztn_info.selected_params
+
+        for i, key in enumerate(param_keys):
+            if i != len(param_keys) - 1:
+                comma = ','
+            else:
+                comma = ''
+
+            if key in self.paramztn_info.selected_phot_params:
+                key_value = f''''{key}': np.array(${{{key}}}){comma}
                 '''
-                
-                # Code to instantiate the BAGLE model
-                mod_params_str = ''''''
-                mod_param_values = self.settings_info.mod_param_values
+            else:
+                key_value = f''''{key}': ${{{key}}}{comma}
+                '''
+            mod_params_str += key_value
 
-                for i, key in enumerate(mod_param_values.keys()):
-                    value = np.round(mod_param_values[key], 5)
+        mod_time_code = f'''
 
-                    if i != len(mod_param_values.keys()) - 1:
-                        comma = ','
-                    else:
-                        comma = ''
+            ################################################
+            # Model and Time
+            ################################################
+            paramztn_str = '{selected_paramztn}'
+            mod_params = {{
+                {mod_params_str}}}  
 
-                    if key in self.paramztn_info.selected_phot_params:
-                        key_value = f''''{key}': np.array({value}){comma}
-                        '''
-                    else:
-                        key_value = f''''{key}': {value}{comma}
-                        '''
-                    mod_params_str += key_value
+            # Instantiate BAGLE model
+            mod = getattr(model, paramztn_str)(**mod_params)
 
+            # Dictionary to store data
+            data_dict = {{}}
 
-                min_t = self.settings_info.param_sliders['Time'].start
-                max_t = self.settings_info.param_sliders['Time'].end
-                num_pts = self.settings_info.param_sliders['Num_pts'].value
+            # Dictionary to store figures
+            fig_dict = {{}}
 
-                mod_time_code = f'''
+            # Time points
+            data_dict['time'] = np.linspace(${{min_t}}, ${{max_t}}, ${{num_pts}})
+        '''
 
-                    ################################################
-                    # Model and Time
-                    ################################################
-                    paramztn_str = '{self.paramztn_info.selected_paramztn}'
-                    mod_params = {{
-                        {mod_params_str}}}  
+        self.mod_time_templates[selected_paramztn] = string.Template(textwrap.dedent(mod_time_code))
+        return self.mod_time_templates[selected_paramztn]
 
-                    # Instantiate BAGLE model
-                    mod = getattr(model, paramztn_str)(**mod_params)
 
-                    # Dictionary to store data
-                    data_dict = {{}}
+    def get_cache_info(self):
+        '''
+        Returns a dictionary of cache name to (number of entries, estimated bytes) for the caches of this code panel.
+        '''
+        return {'code_segments': (len(self.code_segments), metrics.estimate_bytes(list(self.code_segments.values())))}
 
-                    # Dictionary to store figures
-                    fig_dict = {{}}
 
-                    # Time points
-                    data_dict['time'] = np.linspace({min_t}, {max_t}, {num_pts})
-                '''
+    def clear_caches(self):
+        self.code_segments.clear()
 
-                code_list = [package_code, mod_time_code]
-                
+
+    def get_plot_code(self, plot_type, fig_clr_dict):
+        '''
+        Returns the cached code of a plot type ('phot' or 'ast'). The code is only remade if the parameterization, checked traces, 
+        number of GP samples, or colors changed.
+        '''
+        trace_clrs = tuple((trace_key, getattr(trace, 'pri_clr', None), tuple(getattr(trace, 'clr_cycle', None) or ())) 
+                           for trace_key, trace in self.trace_info.all_traces.items())
+        segment_key = (plot_type, self.paramztn_info.selected_paramztn, tuple(self.trace_info.extra_ast_keys), 
+                       self.settings_info.param_sliders['Num_samps'].value, tuple(fig_clr_dict.items()), trace_clrs)
+
+        metrics.count_cache('code_segments', segment_key in self.code_segments)
+        if segment_key in self.code_segments:
+            self.code_segments.move_to_end(segment_key)
+        else:
+            if plot_type == 'phot':
+                self.code_segments[segment_key] = textwrap.dedent(self.get_phot_code(fig_clr_dict))
+            else:
+                self.code_segments[segment_key] = textwrap.dedent(self.get_ast_code(fig_clr_dict))
+
+            while len(self.code_segments) > self.CODE_CACHE_SIZE:
+                self.code_segments.popitem(last = False)
+
+        return self.code_segments[segment_key]
+
+
+    def _update_code_str(self):
+        # Check if code panel is displayed. If not, the code is made when the code panel is checked again.
+        if 'code' in self.settings_info.dashboard_checkbox.value:
+            doc = pn.state.curdoc
+
+            # Note: without a server session there are no bursts of changes to debounce, so the code is made right away
+            if (doc == None) or (doc.session_context == None):
+                self._render_code_str()
+
+            else:
+                if self.render_callback != None:
+                    doc.remove_timeout_callback(self.render_callback)
+                self.render_callback = doc.add_timeout_callback(self._render_code_str, self.CODE_DEBOUNCE_INTERVAL)
+
+
+    @profiling.profiled('_render_code_str')
+    @metrics.timed_update('code')
+    def _render_code_str(self):
+        self.render_callback = None
+
+        # Check if code panel is displayed.
+        # Check if lock is on.
+        if 'code' in self.settings_info.dashboard_checkbox.value:
+            if (self.settings_info.lock_trigger == False) and (self.clr_info.lock_trigger == False):
+                # Code to instantiate the BAGLE model
+                template_values = {
+                    'min_t': self.settings_info.param_sliders['Time'].start,
+                    'max_t': self.settings_info.param_sliders['Time'].end,
+                    'num_pts': self.settings_info.param_sliders['Num_pts'].value
+                }
+
+                mod_param_values = self.settings_info.mod_param_values
+                for key in mod_param_values.keys():
+                    template_values[key] = np.round(mod_param_values[key], 5)
+
+                code_list = [self.PACKAGE_CODE, self.get_mod_time_template().substitute(template_values)]
 
                 # Create figure color dictionary
-                fig_clr_dict = {key:self.clr_info.fig_clr_pickers[key].value for key in self.clr_info.fig_clr_pickers.keys()}
+                fig_clr_dict = dict(self.clr_info.fig_clrs)
 
                 # Check if photometry is selected in dashboard
                 if (len(self.trace_info.selected_phot_plots) != 0):
-                    code_list.append(self.get_phot_code(fig_clr_dict))
+                    code_list.append(self.get_plot_code('phot', fig_clr_dict))
 
                 # Check if astrometry is selected in dashboard
                 if (len(self.trace_info.selected_ast_plots) != 0):
-                    code_list.append(self.get_ast_code(fig_clr_dict))
+                    code_list.append(self.get_plot_code('ast', fig_clr_dict))
 
-                py_code = ''
-                for code in code_list:
-                    py_code += textwrap.dedent(code)
-                
                 # Add small note on where data and figrues are stored
-                py_code += textwrap.dedent('''
-                                           
-                    ################################################
-                    # Accessing Data and Figures
-                    ################################################
-                    # Data can be accessed through the dictionary: data_dict
-                    # Figures can be accessed through the dictionary: fig_dict
-                                           
-                    # To see the what data and figures are available, use the .keys() method of dictionaries.
-                ''')
+                code_list.append(self.ACCESS_CODE)
+                py_code = ''.join(code_list)
 
                 # Check if loading/error indicator is displayed
                 if self.code_layout.objects[0].name != self.code_display.name:
@@ -6,12 +6,19 @@ import param
 from panel.viewable import Viewer
 
 from app_components import settings_tabs
-from app_utils import styles, traces
+from app_utils import styles, traces, updates
 
 
 class ColorPanel(Viewer):
     settings_info = param.ClassSelector(class_ = settings_tabs.SettingsTabs)
     trace_info = param.ClassSelector(class_ = traces.AllTraceInfo)
+    scheduler = param.ClassSelector(class_ = updates.UpdateScheduler)
+
+    # Current figure colors. Note: these are set by themes and the figure color pickers, so they are known before the color pickers are made
+    fig_clrs = param.Dict(default = {})
+
+    # Latest trace color picker change, in the form (color picker id, color). See 'make_trace_clrs_layout' for the color picker ids
+    trace_clr_change = param.Tuple(default = None, length = 2, allow_None = True)
 
     # This is a dictionary to label the figure-related color pickers
     FIG_CLR_LABELS = {
@@ -37,17 +44,9 @@ class ColorPanel(Viewer):
         )
 
         super().__init__(**params)
-        self.pri_clr_label, self.sec_clr_label = self.make_clr_type_labels()
-
-        self.fig_clr_pickers, self.fig_clrs_layout = self.make_fig_clrs_layout()
-        self.trace_clr_pickers, self.clr_cycle_tools, self.phot_clr_rows, self.ast_clr_rows, self.phot_clr_layout, self.ast_clr_layout = self.make_trace_clrs_layout()
-
-        self.all_widgets = list(self.fig_clr_pickers.values()) + list(self.clr_cycle_tools.values()) + [self.theme_dropdown]
-        for trace_key in self.trace_clr_pickers.keys():
-            if 'clr_cycle' not in self.trace_clr_pickers[trace_key].keys():
-                self.all_widgets += list(self.trace_clr_pickers[trace_key].values())
-            else:
-                self.all_widgets += self.trace_clr_pickers[trace_key]['clr_cycle']
+        # Note: the color pickers and their layouts are only made when the color panel is first opened (see 'make_clr_pickers')
+        self.clr_pickers_made = False
+        self.all_widgets = [self.theme_dropdown]
 
         self.set_clr_picker_theme()
 
@@ -97,17 +96,16 @@ class ColorPanel(Viewer):
         # Define dependencies
         self.settings_info.genrl_plot_checkbox.param.watch(self.hide_show_floatpanel, 'value')
 
-        for clr_picker in self.fig_clr_pickers.values():
-            clr_picker.param.watch(self.clear_theme, 'value', precedence = 10)
+        self.scheduler.register('clr_cards', self.hide_show_cards, after = ['selected_plots'])
+        self.scheduler.register('clr_pickers', self.hide_show_clr_pickers, after = ['selected_plots', 'extra_ast_traces'])
 
-        for trace_key in self.trace_clr_pickers.keys():
-            if 'clr_cycle' not in self.trace_clr_pickers[trace_key].keys():
-                all_clr_pickers = self.trace_clr_pickers[trace_key].values()
-            else:
-                all_clr_pickers = self.trace_clr_pickers[trace_key]['clr_cycle']
+        # Note: the color picker changes made by a theme are added to the same flush, so dependent tasks only run once per theme change
+        self.scheduler.register('clr_picker_theme', self.set_clr_picker_theme)
+        self.scheduler.subscribe(self.theme_dropdown, 'value', ['clr_picker_theme'])
 
-            for clr_picker in all_clr_pickers:
-                clr_picker.param.watch(self.clear_theme, 'value', precedence = 10)
+        self.scheduler.subscribe(self.settings_info.dashboard_checkbox, 'value', ['clr_cards'])
+        for checkbox in [self.settings_info.genrl_plot_checkbox, self.settings_info.phot_checkbox, self.settings_info.ast_checkbox]:
+            self.scheduler.subscribe(checkbox, 'value', ['clr_pickers'])
 
         for error_bool in self.settings_info.errored_state.values():
             error_bool.param.watch(self.set_errored_layout, 'value')
@@ -128,10 +126,49 @@ class ColorPanel(Viewer):
         return main_clr_types
     
 
-    @pn.depends('theme_dropdown.value', watch = True)
+    def make_clr_pickers(self):
+        '''
+        Makes the color pickers, their layouts, and their watchers. The color pickers start with the current figure and trace colors.
+        Note: this is only done once, since the color pickers of all traces are reused for every parameterization (see 'hide_show_clr_pickers').
+        '''
+        self.pri_clr_label, self.sec_clr_label = self.make_clr_type_labels()
+
+        self.fig_clr_pickers, self.fig_clrs_layout = self.make_fig_clrs_layout()
+        self.trace_clr_pickers, self.clr_cycle_tools, self.phot_clr_rows, self.ast_clr_rows, self.phot_clr_layout, self.ast_clr_layout = self.make_trace_clrs_layout()
+
+        trace_clr_pickers = []
+        for trace_key in self.trace_clr_pickers.keys():
+            if 'clr_cycle' not in self.trace_clr_pickers[trace_key].keys():
+                trace_clr_pickers += list(self.trace_clr_pickers[trace_key].values())
+            else:
+                trace_clr_pickers += self.trace_clr_pickers[trace_key]['clr_cycle']
+
+        # Set dependencies
+        for clr_picker in self.fig_clr_pickers.values():
+            clr_picker.param.watch(self.set_fig_clrs, 'value')
+            clr_picker.param.watch(self.clear_theme, 'value', precedence = 10)
+
+        for clr_picker in trace_clr_pickers:
+            clr_picker.param.watch(self.set_trace_clr_change, 'value')
+            clr_picker.param.watch(self.clear_theme, 'value', precedence = 10)
+
+        # Disable new widgets if there is an error
+        new_widgets = list(self.fig_clr_pickers.values()) + list(self.clr_cycle_tools.values()) + trace_clr_pickers
+        errored_bool = True in [error_bool.value for error_bool in self.settings_info.errored_state.values()]
+        for widget in new_widgets:
+            widget.disabled = errored_bool
+
+        self.all_widgets += new_widgets
+        self.clr_pickers_made = True
+
+
     def set_clr_picker_theme(self):
         theme_dict = self.theme_dropdown.value
         if theme_dict != 'None':
+            self.fig_clrs = {fig_key: theme_dict[fig_key] for fig_key in self.FIG_CLR_LABELS.keys()}
+
+        # Note: the trace colors of a theme are set in 'plots.PlotPanel.set_plot_theme'
+        if (theme_dict != 'None') and (self.clr_pickers_made == True):
             self.lock_trigger = True
             # Change value of figure color pickers
             for fig_key in self.fig_clr_pickers.keys():
@@ -167,6 +204,7 @@ class ColorPanel(Viewer):
             # Make color picker and set dependency
             fig_clr_pickers[key] = pn.widgets.ColorPicker(
                 name = '', 
+                value = self.fig_clrs[key],
                 styles = styles.COLOR_PICKER_STYLES,
                 stylesheets = [styles.COLOR_PICKER_STYLESHEET],
             )
@@ -210,6 +248,7 @@ class ColorPanel(Viewer):
                     clr_picker_id = f"('{trace_key}', '{clr_type}')"
                     clr_picker = pn.widgets.ColorPicker(
                         name = '',
+                        value = getattr(self.trace_info.all_traces[trace_key], clr_type),
                         description = clr_picker_id,
                         sizing_mode = 'stretch_width',
                         margin = 0,
@@ -241,6 +280,7 @@ class ColorPanel(Viewer):
                     clr_picker_id = f"('{trace_key}', 'clr_cycle', {i})"
                     clr_picker = pn.widgets.ColorPicker(
                         name = '',
+                        value = self.trace_info.all_traces[trace_key].clr_cycle[i],
                         description = clr_picker_id,
                         styles = styles.COLOR_PICKER_STYLES,
                         stylesheets = [styles.COLOR_PICKER_STYLESHEET]
@@ -307,6 +347,22 @@ class ColorPanel(Viewer):
                 widget.disabled = True
 
 
+    def set_fig_clrs(self, *event):
+        if self.lock_trigger == False:
+            self.fig_clrs = {fig_key: self.fig_clr_pickers[fig_key].value for fig_key in self.fig_clr_pickers.keys()}
+
+
+    def set_trace_clr_change(self, *event):
+        if self.lock_trigger == False:
+            clr_change = (event[0].obj.description, event[0].obj.value)
+
+            # Note: the same change can be made again (e.g. after a theme changed the color picker), so watchers are triggered either way
+            if self.trace_clr_change == clr_change:
+                self.param.trigger('trace_clr_change')
+            else:
+                self.trace_clr_change = clr_change
+
+
     def clear_theme(self, *event):
         '''
         This is a function to change theme button to None whenever a color picker is used
@@ -315,8 +371,6 @@ class ColorPanel(Viewer):
             self.theme_dropdown.value = 'None'
 
 
-    @pn.depends('settings_info.genrl_plot_checkbox.value',
-                'settings_info.phot_checkbox.value', 'settings_info.ast_checkbox.value', watch = True)
     def hide_show_clr_pickers(self):
         if (self.settings_info.lock_trigger == False) and ('color' in self.settings_info.genrl_plot_checkbox.value):
             # Disable secondary color picker if no full traces
@@ -340,7 +394,6 @@ class ColorPanel(Viewer):
                     self.ast_clr_rows[trace_key].visible = False
 
 
-    @pn.depends('settings_info.dashboard_checkbox.value', watch = True)
     def hide_show_cards(self):
         if (self.settings_info.lock_trigger == False) and ('color' in self.settings_info.genrl_plot_checkbox.value):
             content_cards = [self.fig_clrs_layout]
@@ -357,8 +410,11 @@ class ColorPanel(Viewer):
     def hide_show_floatpanel(self, *event):
         match ['color' in event[0].old, 'color' in event[0].new]:
             case [False, True]:
-                self.hide_show_cards()
-                self.hide_show_clr_pickers()
+                if self.clr_pickers_made == False:
+                    self.make_clr_pickers()
+
+                # Note: the cards and color pickers are updated by the scheduler at the end of the checkbox change
+                self.scheduler.invalidate('clr_cards', 'clr_pickers')
                 self.color_panel_layout.objects = [self.color_floatpanel]
 
             case [_, False]:
@@ -1,16 +1,20 @@
 # Packages
 ################################################
 import numpy as np
-
-from bagle import model
+import pandas as pd
+import collections
 
 import panel as pn
 from panel.viewable import Viewer
 import param
+from bokeh.models.widgets.tables import HTMLTemplateFormatter
 
-from app_utils import constants, styles, indicators
+from app_utils import constants, styles, indicators, updates, traces, lazy_imports, metrics, profiling
 from app_components import paramztn_select, settings_tabs
 
+# Note: BAGLE is only imported when first used (see 'app_utils.lazy_imports')
+model = lazy_imports.lazy_import('bagle.model')
+
 
 ################################################
 # Dashboard - Parameter Summary
@@ -18,17 +22,58 @@ from app_components import paramztn_select, settings_tabs
 class ParamSummary(Viewer):
     paramztn_info = param.ClassSelector(class_ = paramztn_select.ParamztnSelect)
     settings_info = param.ClassSelector(class_ = settings_tabs.SettingsTabs)
+    trace_info = param.ClassSelector(class_ = traces.AllTraceInfo)
+    scheduler = param.ClassSelector(class_ = updates.UpdateScheduler)
+
+    # Maximum number of parameter states with cached derived parameters
+    DERIVED_CACHE_SIZE = 32
+
+    # Minimum time (in milliseconds) between summary table patches. This keeps summary changes out of the plot updates while a slider is dragged.
+        # Note: set this to None to send summary changes together with the plot updates
+    SUMMARY_PATCH_INTERVAL = 150
+
+    # Columns of the summary tables. Note: 'Vector' is a hidden column used to color vector values (see 'VALUE_TEMPLATE')
+    SUMMARY_COLUMNS = ['Units', 'Value', 'Vector']
+
+    # Template of the 'Value' column formatter
+        # Note: each table gets its own formatter (see '__init__'), since tabulator adds a callback to its formatters that is never removed,
+        # so a shared formatter would keep the tables of every session alive
+    VALUE_TEMPLATE = f'''<span style="color:<%= Vector ? '{styles.CLRS['summary_vector']}' : 'inherit' %>"><%= value %></span>'''
 
 
     def __init__(self, **params):
-        # Box for parameter summaries (model and derived)
-        self.mod_pane = pn.pane.HTML(styles = {'color':styles.CLRS['txt_primary'],
-                                               'max-height':'min-content', 
-                                               'padding':'0.5rem'})
-        self.derived_pane = pn.pane.HTML(styles = {'color':styles.CLRS['txt_primary'],
-                                                   'max-height':'min-content', 
-                                                   'padding':'0.5rem'})
+        # Dictionary of model keys (see 'traces.AllTraceInfo.get_model_key') to derived parameter rows
+        self.derived_cache = collections.OrderedDict()
+
+        # Dictionaries of the last displayed rows of each table. Each row is stored as param: (units, value, vector bool).
+        self.summary_rows = {'mod': {}, 'derived': {}}
+
+        # Tables for parameter summaries (model and derived)
+            # Note: the whole table value is only replaced when the displayed parameters change (e.g. a parameterization change).
+            # Otherwise, only the changed values are patched into the table (see 'set_table_rows')
+        self.summary_tables = {}
+        self.table_patchers = {}
+        for table_name, title in [('mod', 'Model Parameters'), ('derived', 'Derived Parameters')]:
+            self.summary_tables[table_name] = pn.widgets.Tabulator(
+                value = self.get_table_df({}),
+                name = title,
+                disabled = True,
+                sortable = False,
+                selectable = False,
+                hidden_columns = ['Vector'],
+                formatters = {'Value': HTMLTemplateFormatter(template = self.VALUE_TEMPLATE)},
+                text_align = 'left', 
+                layout = 'fit_data_table',
+                stylesheets = [styles.TABLTR_STYLESHEET]
+            )
+            self.table_patchers[table_name] = updates.TablePatcher(self.summary_tables[table_name], self.SUMMARY_PATCH_INTERVAL)
+
+        self.mod_pane = self.get_table_pane('mod')
+        self.derived_pane = self.get_table_pane('derived')
         
+        # Indicator shown when the summary can't be updated (reused every time it's shown)
+        self.error_indicator = indicators.get_indicator('error')
+
         # Layout for summary pane
         self.summary_content = pn.FlexBox(
             self.mod_pane, 
@@ -52,10 +97,44 @@ class ParamSummary(Viewer):
         for error_bool in self.settings_info.errored_state.values():
             error_bool.param.watch(self.set_errored_layout, 'value')
 
+        # Note: the summary is updated after the plots so that errors are caught by the plots first
+        self.scheduler.register('summary', self._update_summary, after = ['layout', 'all_plots'])
+        self.scheduler.subscribe(self.settings_info.dashboard_checkbox, 'value', ['summary'])
+        self.scheduler.subscribe(self.settings_info, 'trigger_param_change', ['summary'])
+
+
+    def get_cache_info(self):
+        '''
+        Returns a dictionary of cache name to (number of entries, estimated bytes) for the caches of this summary.
+        '''
+        return {'derived_rows': (len(self.derived_cache), metrics.estimate_bytes(list(self.derived_cache.values())))}
+
+
+    def clear_caches(self):
+        self.derived_cache.clear()
+
+
+    def get_table_pane(self, table_name):
+        table_header = pn.pane.HTML(
+            object = f'''
+                <span style="font-size:{styles.FONTSIZES['page_header']}; font-family:{styles.HTML_FONTFAMILY}">
+                    <u><b>{self.summary_tables[table_name].name}</b></u>
+                </span>
+            ''',
+            styles = {'color':styles.CLRS['txt_primary']}
+        )
+
+        return pn.Column(
+            table_header,
+            self.summary_tables[table_name],
+            styles = {'max-height':'min-content', 
+                      'padding':'0.5rem'}
+        )
+
 
     def set_errored_layout(self, *event):
         if event[0].obj.value == True:
-            self.summary_layout.objects = [indicators.get_indicator('error')]
+            self.summary_layout.objects = [self.error_indicator]
 
 
     def reset_scroll(self):
@@ -63,76 +142,120 @@ class ParamSummary(Viewer):
         self.summary_layout.objects = [self.summary_content]
         
 
-    @pn.depends('settings_info.dashboard_checkbox.value', 'settings_info.trigger_param_change', watch = True)
-    def _update_summary(self):
-        if (self.settings_info.lock_trigger == False) and ('summary' in self.settings_info.dashboard_checkbox.value):
-            # Model parameter summary
-            mod_html = ''''''
-            for param in self.paramztn_info.selected_params:
-                if constants.DEFAULT_RANGES[param][0] == None:
-                    label = param
-                else:
-                    label = f'{param} [{constants.DEFAULT_RANGES[param][0]}]'
-                
-                if param in self.paramztn_info.selected_phot_params:
-                    val = self.settings_info.mod_param_values[param][0]
-                else:
-                    val = self.settings_info.mod_param_values[param]
+    def get_units(self, param):
+        if constants.DEFAULT_RANGES[param][0] == None:
+            return ''
+        else:
+            return constants.DEFAULT_RANGES[param][0]
+
+
+    def get_table_df(self, rows):
+        table_df = pd.DataFrame.from_dict(rows, orient = 'index', columns = self.SUMMARY_COLUMNS)
+        table_df.index.name = 'Parameter'
+        return table_df
+
+
+    def get_mod_rows(self, mod_param_values):
+        mod_rows = {}
+        for param in self.paramztn_info.selected_params:
+            if param in self.paramztn_info.selected_phot_params:
+                val = mod_param_values[param][0]
+            else:
+                val = mod_param_values[param]
+
+            mod_rows[param] = (self.get_units(param), round(val, 5), False)
+
+        return mod_rows
+
+
+    def get_derived_rows(self, mod):
+        all_params_dict = vars(mod)
+        printed_param_keys = [key for key in all_params_dict.keys() if key in constants.DEFAULT_RANGES.keys()]
+
+        derived_rows = {}
+        for param in printed_param_keys:
+            if (param not in self.paramztn_info.selected_params + ['raL', 'decL']):
+                vector_bool = False
                 
-                mod_html += f'''
-                    <span style="font-size:{styles.FONTSIZES['summary_txt']};">
-                        <b>{label}</b>:  {round(val, 5)}
-                    </span>'''
-            mod_html = f'''
-                <div style="display:flex; flex-direction:column; align-items:start;font-family:{styles.HTML_FONTFAMILY}">
-                    <span style="font-size:{styles.FONTSIZES['page_header']}"><u><b>Model Parameters</b></u></span>
-                    {mod_html}
-                </div>           
-            '''
-            self.mod_pane.object = mod_html
-
-            # Derived parameter summary 
-            mod = getattr(model, self.paramztn_info.selected_paramztn)(**self.settings_info.mod_param_values)
-            all_params_dict = vars(mod)
-            printed_param_keys = [key for key in all_params_dict.keys() if key in constants.DEFAULT_RANGES.keys()]
-
-            derived_html = ''''''
-            for param in printed_param_keys:
-                if (param not in self.paramztn_info.selected_params + ['raL', 'decL']):
-                    clr = styles.CLRS['txt_primary']
-                    if constants.DEFAULT_RANGES[param][0] == None:
-                        label = param
-                    else:
-                        label = f'{param} [{constants.DEFAULT_RANGES[param][0]}]'
+                # Check if value type is a dictionary, np.ndarray, or float/integer
+                if isinstance(all_params_dict[param], dict):
+                    val = round(all_params_dict[param][0], 5)
                     
-                    # Check if value type is a dictionary, np.ndarray, or float/integer
-                    if isinstance(all_params_dict[param], dict):
-                        val = round(all_params_dict[param][0], 5)
-                        
-                    elif isinstance(all_params_dict[param], np.ndarray):
-                        # Check if np.ndarray is a vector
-                        if len(all_params_dict[param]) > 1:
-                            clr = styles.CLRS['summary_vector']
-                            round_arr = np.around(all_params_dict[param], 5)
-                            val = np.array2string(round_arr, separator = ', ')
-                        else:
-                            val = round(all_params_dict[param][0], 5)
+                elif isinstance(all_params_dict[param], np.ndarray):
+                    # Check if np.ndarray is a vector
+                    if len(all_params_dict[param]) > 1:
+                        vector_bool = True
+                        round_arr = np.around(all_params_dict[param], 5)
+                        val = np.array2string(round_arr, separator = ', ')
                     else:
-                        val = round(all_params_dict[param], 5)
-                    
-                    derived_html += f'''
-                        <span style="font-size:{styles.FONTSIZES['summary_txt']}">
-                            <b style="color:{clr}">{label}</b>:  {val}
-                        </span>
-                    '''
+                        val = round(all_params_dict[param][0], 5)
+                else:
+                    val = round(all_params_dict[param], 5)
+
+                derived_rows[param] = (self.get_units(param), val, vector_bool)
+
+        return derived_rows
+
+
+    def set_table_rows(self, table_name, rows):
+        '''
+        Displays the rows in a summary table. If the table already has the same parameters (and units/vector types), 
+        only the changed values are patched into the table. Otherwise, the whole table value is replaced.
+        '''
+        old_rows = self.summary_rows[table_name]
+        same_rows = (list(rows.keys()) == list(old_rows.keys())) and all(
+            (row[0], row[2]) == (old_rows[param][0], old_rows[param][2]) for param, row in rows.items()
+        )
+
+        if same_rows == True:
+            changed_values = {param: row[1] for param, row in rows.items() if row[1] != old_rows[param][1]}
+            if len(changed_values) != 0:
+                self.table_patchers[table_name].set_cells('Value', changed_values)
+        else:
+            self.table_patchers[table_name].clear()
+            self.summary_tables[table_name].value = self.get_table_df(rows)
+
+        self.summary_rows[table_name] = rows
+
+
+    @profiling.profiled('_update_summary')
+    @metrics.timed_update('summary')
+    async def _update_summary(self):
+        # Check for locks, if summary is displayed, and if there is a bad parameter combination
+        if ((self.settings_info.lock_trigger == False) and ('summary' in self.settings_info.dashboard_checkbox.value) and 
+            (self.settings_info.errored_state['params'].value == False)):
+            selected_paramztn = self.paramztn_info.selected_paramztn
+            mod_param_values = dict(self.settings_info.mod_param_values)
+            mod_key = self.trace_info.get_model_key(selected_paramztn, mod_param_values)
+
+            # Derived parameter rows
+            derived_rows = self.derived_cache.get(mod_key)
+            metrics.count_cache('derived_rows', derived_rows != None)
+            if derived_rows != None:
+                self.derived_cache.move_to_end(mod_key)
+
+            else:
+                # Note: the model made by the last trace update is reused if it has the same parameters (e.g. right after the plots are updated).
+                    # Otherwise, the model is made in the model pool, so that the event loop can handle other sessions in the meantime
+                mod = self.trace_info.get_shared_model(mod_key)
+                if mod == None:
+                    with metrics.span('summary.model'):
+                        mod = await updates.run_in_executor(getattr(model, selected_paramztn), **mod_param_values)
+
+                    # Check if a newer change was made while the model was being made. If so, this summary is already stale
+                    if self.scheduler.is_dirty('summary'):
+                        return
+
+                with metrics.span('summary.derived_rows'):
+                    derived_rows = self.get_derived_rows(mod)
+                self.derived_cache[mod_key] = derived_rows
+                while len(self.derived_cache) > self.DERIVED_CACHE_SIZE:
+                    self.derived_cache.popitem(last = False)
                     
-            derived_html = f'''
-                <div style="display:flex; flex-direction:column; align-items:start; font-family:{styles.HTML_FONTFAMILY}">
-                    <span style="font-size:{styles.FONTSIZES['page_header']}"><u><b>Derived Parameters</b></u></span>
-                    {derived_html}
-                </div>           
-            '''     
-            self.derived_pane.object = derived_html
+            # Note: during slider drags, only the changed values are sent to the browser
+            with metrics.span('summary.tables'):
+                self.set_table_rows('mod', self.get_mod_rows(mod_param_values))
+                self.set_table_rows('derived', derived_rows)
 
             if self.summary_layout.objects[0].name != self.summary_content.name:
                 self.summary_layout.objects = [self.summary_content]
@@ -1,18 +1,13 @@
 ################################################
 # Packages
 ################################################
-import re
-from functools import partial
-
-from bagle import model
-
 import panel as pn
 from panel.viewable import Viewer
 from bokeh.models import Tooltip
 from bokeh.models.dom import HTML
 import param
 
-from app_utils import constants, styles
+from app_utils import styles, catalog
 from app_components import mod_select
     
 
@@ -67,14 +62,9 @@ class ParamztnSelect(Viewer):
         # Clear selected parameterization
         self.selected_paramztn = None
         
-        # Get paramaterizations for selected model   
-        if mod_types['gp'] == '':
-            mod_regex = '_'.join([mod_types[key] for key in mod_types.keys() 
-                                  if key != 'gp']) + '_Param'
-        elif mod_types['gp'] == 'GP':
-            mod_regex = '_'.join(list(mod_types.values())) + '_Param'
-
-        mod_paramztns = [mod for mod in constants.ALL_MODS if re.match(mod_regex, mod)]
+        # Get paramaterizations for selected model (see 'app_utils.catalog')
+        mod_type_key = (mod_types['srclens'], mod_types['data'], mod_types['par'], mod_types['gp'])
+        mod_paramztns = catalog.MOD_PARAMZTNS.get(mod_type_key, ())
             
         # No parameterizations found for selected model
         if len(mod_paramztns) == 0:
@@ -89,58 +79,23 @@ class ParamztnSelect(Viewer):
                     self.paramztn_btns[paramztn].stylesheets = [styles.BASE_BTN_STYLESHEET]
 
                 else:
-                    # Write HTML for button tooltip
-                    all_param_names = self.get_param_names(paramztn, mod_types)
-
-                    tooltip_html = ''.join([f'''<span>{param}</span>''' for param in all_param_names])
-                    tooltip_html = HTML(f'''
-                        <div style = "display:flex; align-items:center; flex-direction:column; 
-                                      padding:0.25rem; border:0.04rem black solid; color:{styles.CLRS['page_primary']};
-                                      font-size:{styles.FONTSIZES['tooltip']}; font-weight:bold;">
-                            {tooltip_html}
-                        </div>
-                    ''')
-
-                    # Create parameterization button
+                    # Note: the tooltip HTML is shared by all sessions, but the Bokeh models are made per session
+                    tooltip_html = HTML(catalog.get_paramztn_info(paramztn)['tooltip_html'])
+
+                    # Create parameterization button and set on-click action
                     self.paramztn_btns[paramztn] = pn.widgets.Button(
                         name = paramztn, button_type = 'primary', 
                         description = (Tooltip(content = tooltip_html, position = 'bottom')),
                         stylesheets = [styles.BASE_BTN_STYLESHEET]
                     )
-
-                # Add/Update on-click action for button
-                self.paramztn_btns[paramztn].on_click(partial(self._change_selected_btn, mod_types = mod_types))
+                    self.paramztn_btns[paramztn].on_click(self._change_selected_btn)
 
             # Get relevant buttons and update paramztn_box
             self.paramztn_box.objects = [self.paramztn_btns[key] for key in mod_paramztns]
             self.paramztn_layout.objects = [self.paramztn_box]
 
 
-    def get_param_names(self, paramztn, mod_types, return_phot_names = False):
-        # Get paramaterization class
-        class_num = re.search('Param.*', paramztn).group()
-        if mod_types['gp'] == 'GP':
-            param_class_str = '_'.join([mod_types['srclens'], 'GP', mod_types['data'] + class_num])
-        else:
-            param_class_str = '_'.join([mod_types['srclens'], mod_types['data'] + class_num])
-
-        param_class = getattr(model, param_class_str)
-        
-        # Get required parameters for paramaterization
-        all_param_names = (param_class.fitter_param_names + param_class.phot_param_names + 
-                           param_class.phot_optional_param_names + param_class.ast_optional_param_names)
-        
-        if mod_types['par'] == 'Par':
-            all_param_names += ['raL', 'decL']
-        
-        # Check if phot_names should be returned
-        if return_phot_names == True:
-            return param_class.phot_param_names, all_param_names
-        else:
-            return all_param_names
-    
-
-    def _change_selected_btn(self, event, mod_types): 
+    def _change_selected_btn(self, event): 
         if (event.obj.name != self.selected_paramztn):
 
             # Change CSS of new selected button
@@ -152,7 +107,9 @@ class ParamztnSelect(Viewer):
 
             # Update selected parameters and parameterization
                 # Note: the selected parameters needs to be updated first
-            self.selected_phot_params, self.selected_params = self.get_param_names(event.obj.name, mod_types, return_phot_names = True)
+                # Also, the parameter names are copied from the shared catalog, so that the catalog can't be changed by this session
+            paramztn_info = catalog.get_paramztn_info(event.obj.name)
+            self.selected_phot_params, self.selected_params = list(paramztn_info['phot_params']), list(paramztn_info['params'])
             self.selected_paramztn = event.obj.name
 
 
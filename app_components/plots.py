@@ -2,17 +2,28 @@
 # Packages
 ################################################
 import numpy as np
-import plotly.graph_objects as go
-import threading
 import traceback
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 
 import panel as pn
 from panel.viewable import Viewer
 import param
 
-from app_utils import indicators, traces, styles
+from app_utils import indicators, traces, styles, updates, lazy_imports, metrics, profiling, client_latency
 from app_components import paramztn_select, settings_tabs, color_panel
 
+# Note: plotly is only imported when first used (see 'app_utils.lazy_imports')
+go = lazy_imports.lazy_import('plotly.graph_objects', warmup_attrs = ['Figure', 'Scatter', 'Scattergl'])
+
+
+################################################
+# Plotting Pool
+################################################
+# A bounded pool shared by all sessions to build astrometry figures concurrently
+    # Note: the pool only builds figures. Panes are always updated from the session's own thread.
+AST_PLOT_POOL = ThreadPoolExecutor(max_workers = len(styles.AST_PLOT_NAMES), thread_name_prefix = 'ast_plot')
+
 
 ################################################
 # Dashboard - Plot Panel
@@ -22,6 +33,7 @@ class PlotPanel(Viewer):
     settings_info = param.ClassSelector(class_ = settings_tabs.SettingsTabs)
     trace_info = param.ClassSelector(class_ = traces.AllTraceInfo)
     clr_info = param.ClassSelector(class_ = color_panel.ColorPanel)
+    scheduler = param.ClassSelector(class_ = updates.UpdateScheduler)
 
     ########################
     # General Methods
@@ -35,12 +47,26 @@ class PlotPanel(Viewer):
             'functions': [self._update_plot_time] # List of functions with time slider dependency
         }
 
-        # Set up initial figure formats with default theme
+        # Trace keys whose colors still need to be changed in the displayed figures (see '_restyle_figs')
+        self.restyle_trace_keys = set()
+
+        # Number of astrometry figure builds started. A build is only shown if no newer build was started while it ran (see 'build_ast_figs')
+        self.ast_build_count = 0
+
+        # Initial figure formats with default theme
+            # Note: these are first made by the first plot update (i.e. after a parameterization is selected), 
+            # so that plotly isn't needed to build the page (see 'app_utils.lazy_imports')
         self.base_figs = {}
-        self._update_base_figs()
+        self.scheduler.invalidate('base_figs')
 
         # Make plotly panes, and plot flexboxes
-        self.plotly_panes, self.plot_boxes = self.make_plot_components()
+        self.plotly_panes, self.plot_boxes, self.plot_indicators = self.make_plot_components()
+
+        # Client-observed latency of the plot updates (see 'app_utils.client_latency')
+        if client_latency.ENABLED == True:
+            self.render_tracker = client_latency.RenderTracker(self.settings_info)
+        else:
+            self.render_tracker = None
 
         # Plot row layout
         self.plot_layout = pn.FlexBox(
@@ -56,32 +82,41 @@ class PlotPanel(Viewer):
     
         # Define dependencies
         self.set_time_slider_throttle()
-        self.settings_info.param_sliders['Num_pts'].param.watch(self._update_all_plots, 'value_throttled')
+        self.settings_info.param_sliders['Num_pts'].param.watch(self.set_num_pts_loading_layout, 'value_throttled')
         self.settings_info.param_sliders['Num_pts'].param.watch(self.set_time_slider_throttle, 'value')
+        self.settings_info.param.watch(self.set_time_slider_throttle, 'slow_client')
 
-        # Note: precedence here makes sure that 'self._update_phot_plots' happens after 'self.trace_info._update_gp_samps'
-        self.settings_info.param_sliders['Num_samps'].param.watch(self._update_phot_plots, 'value', precedence = 10)
+        # Note: 'all_plots' already updates all traces and plots, so it covers the tasks that only update some of them
+        plot_deps = ['layout', 'selected_plots', 'base_figs']
+        self.scheduler.register('plot_theme', self.set_plot_theme, after = ['clr_picker_theme'])
+        self.scheduler.register('base_figs', self._update_base_figs, after = ['plot_theme'])
+        self.scheduler.register('fig_restyle', self._restyle_figs, after = plot_deps + ['plot_theme'])
+        self.scheduler.register('phot_plots', self._update_phot_plots, after = plot_deps + ['gp_samps'])
+        self.scheduler.register('ast_plots', self._update_ast_plots, after = plot_deps + ['extra_ast_traces'])
+        self.scheduler.register('all_plots', self._update_all_plots, after = plot_deps + ['gp_samps', 'extra_ast_traces'],
+                                covers = ['phot_plots', 'ast_plots', 'gp_samps', 'extra_ast_traces'])
 
-        for clr_picker in self.clr_info.fig_clr_pickers.values():
-            clr_picker.param.watch(self._update_base_figs, 'value')
+        self.scheduler.subscribe(self.settings_info, 'trigger_param_change', ['all_plots'])
+        self.scheduler.subscribe(self.settings_info.param_sliders['Num_pts'], 'value_throttled', ['all_plots'])
+        self.scheduler.subscribe(self.settings_info.param_sliders['Num_samps'], 'value', ['phot_plots'])
+        self.scheduler.subscribe(self.settings_info.dashboard_checkbox, 'value', ['phot_plots', 'ast_plots'])
+        self.scheduler.subscribe(self.settings_info.phot_checkbox, 'value', ['phot_plots'])
+        self.scheduler.subscribe(self.settings_info.ast_checkbox, 'value', ['ast_plots'])
+
+        # Note: the figure layouts don't need to be changed separately here, since both plots are updated
+        self.scheduler.subscribe(self.settings_info.genrl_plot_checkbox, 'value', ['base_figs', 'phot_plots', 'ast_plots'])
+        self.scheduler.subscribe(self.clr_info.theme_dropdown, 'value', ['plot_theme'])
+
+        self.scheduler.subscribe(self.clr_info, 'fig_clrs', ['base_figs', 'fig_restyle'])
+        self.clr_info.param.watch(self._update_trace_clrs, 'trace_clr_change')
 
-        for trace_key in self.clr_info.trace_clr_pickers.keys():
-            if 'clr_cycle' not in self.clr_info.trace_clr_pickers[trace_key].keys():
-                all_clr_pickers = self.clr_info.trace_clr_pickers[trace_key].values()
-            else:
-                all_clr_pickers = self.clr_info.trace_clr_pickers[trace_key]['clr_cycle']
-            
-            for clr_picker in all_clr_pickers:
-                clr_picker.param.watch(self._update_trace_clrs, 'value')
-        
-        self.clr_info.theme_dropdown.param.watch(self.set_plot_theme, 'value')
 
         for error_bool in self.settings_info.errored_state.values():
             error_bool.param.watch(self.set_errored_layout, 'value')
 
 
     def make_plot_components(self):
-        plotly_panes, plot_boxes = {}, {}
+        plotly_panes, plot_boxes, plot_indicators = {}, {}, {}
         for name in styles.ALL_PLOT_NAMES:
             # Make plotly pane
             plotly_configs = {
@@ -97,19 +132,23 @@ class PlotPanel(Viewer):
             )
             plotly_panes[name] = pane
 
+            # Make loading and error indicators (reused every time they are shown, see 'set_loading_layout')
+            plot_indicators[name] = {key: indicators.get_indicator(key) for key in ['obj_loading', 'error']}
+
             # Make flexbox for plotly pane
             plot_boxes[name] = pn.FlexBox(
-                indicators.get_indicator('obj_loading'),
+                plot_indicators[name]['obj_loading'],
                 justify_content = 'center',
                 align_content = 'center',
                 styles = styles.BASE_PLOTBOX_STYLES
             )
 
-        return plotly_panes, plot_boxes
+        return plotly_panes, plot_boxes, plot_indicators
         
 
     def set_time_slider_throttle(self, *event):
-        if self.settings_info.param_sliders['Num_pts'].value >= 10000:
+        # Note: the time slider is also throttled while the browser is slow to show plot updates (see 'app_utils.client_latency')
+        if (self.settings_info.param_sliders['Num_pts'].value >= 10000) or (self.settings_info.slow_client == True):
             self.time_fn_dependency['throttled'] = True
             dependency = 'value_throttled'
         else:
@@ -132,25 +171,33 @@ class PlotPanel(Viewer):
     def set_errored_layout(self, *event):
         if event[0].obj.value == True:
             for name in styles.ALL_PLOT_NAMES:
-                self.plot_boxes[name].objects = [indicators.get_indicator('error')]
+                self.plot_boxes[name].objects = [self.plot_indicators[name]['error']]
 
 
     def set_loading_layout(self):
         for name in styles.ALL_PLOT_NAMES:
-            self.plot_boxes[name].objects = [indicators.get_indicator('obj_loading')]
+            self.plot_boxes[name].objects = [self.plot_indicators[name]['obj_loading']]
+
+
+    def reset_scroll(self):
+        self.plot_layout.clear()
+        self.plot_layout.objects = list(self.plot_boxes.values())
+
+
+    def set_num_pts_loading_layout(self, *event):
+        # Note: the plots themselves are updated by the 'all_plots' task at the end of the 'Num_pts' change
+        if self.settings_info.lock_trigger == False:
+            self.set_loading_layout()
 
 
     ########################
     # Coloring Methods
     ######################## 
-    @pn.depends('settings_info.genrl_plot_checkbox.value', watch = True)
-    def _update_base_figs(self, *event):
-        # Note: '*event' is used for the dependencies of the color pickers in 'clr_info.fig_clr_pickers'
-
+    def _update_base_figs(self):
         if self.clr_info.lock_trigger == False:
 
             # Create color dictionary
-            clr_dict = {key:self.clr_info.fig_clr_pickers[key].value for key in self.clr_info.fig_clr_pickers.keys()}
+            clr_dict = dict(self.clr_info.fig_clrs)
 
             # Create new base figures
             for name in styles.ALL_PLOT_NAMES:
@@ -160,29 +207,20 @@ class PlotPanel(Viewer):
                 fig.update_xaxes(
                     title = styles.ALL_FORMATS[name][1][0],
                     title_font_size = styles.FONTSIZES['plot_axes_labels'],
-                    ticks = 'outside', tickformat = '000', 
-                    tickcolor = clr_dict['ticks'], 
-                    tickfont_color = clr_dict['ticks'], 
-                    color = clr_dict['labels'], 
-                    gridcolor = clr_dict['gridlines'], zeroline = False
+                    ticks = 'outside', tickformat = '000', zeroline = False
                 )
                 fig.update_yaxes(
                     title = styles.ALL_FORMATS[name][1][1],
                     title_font_size = styles.FONTSIZES['plot_axes_labels'],
-                    ticks = 'outside', tickformat = '000',
-                    tickcolor = clr_dict['ticks'], 
-                    tickfont_color = clr_dict['ticks'], 
-                    color = clr_dict['labels'], 
-                    gridcolor = clr_dict['gridlines'], zeroline = False
+                    ticks = 'outside', tickformat = '000', zeroline = False
                 )
                 fig.update_layout(
-                    plot_bgcolor = clr_dict['plot_bg'], 
-                    paper_bgcolor = clr_dict['paper_bg'], 
                     font_size = styles.FONTSIZES['plot_axes_ticks'],
-                    legend = dict(grouptitlefont_color = clr_dict['labels'], itemsizing = 'constant'),
+                    legend = dict(itemsizing = 'constant'),
                     margin = dict(l = 75, r = 5, t = 30, b = 55),
-                    title = dict(y = 0.98, font = dict(color = clr_dict['labels'], size = styles.FONTSIZES['plot_title']))
+                    title = dict(y = 0.98, font = dict(size = styles.FONTSIZES['plot_title']))
                 )
+                fig.update_layout(self.get_layout_clrs(clr_dict))
                 self.base_figs[name] = fig
 
                 # Check if title/gridlines should be shown
@@ -197,24 +235,104 @@ class PlotPanel(Viewer):
             for name in styles.PHOT_PLOT_NAMES:
                 self.base_figs[name].update_yaxes(autorange = 'reversed')
 
-            # Change layout of currently displayed figures to new base figures
-                # Note: 'settings_info.lock_trigger' is used here to guard against 'settings_info.genrl_plot_checkbox' reset, which will lead to a change before any figures are displayed
-            if self.settings_info.lock_trigger == False:
-                for plot_name in (self.trace_info.selected_phot_plots + self.trace_info.selected_ast_plots):
-                    self.plotly_panes[plot_name].object['layout'] = self.base_figs[plot_name]['layout']
 
+    def get_layout_clrs(self, clr_dict):
+        '''
+        Returns the figure layout properties that are set by the figure colors (see 'clr_info.fig_clrs')
+        '''
+        axis_clrs = dict(tickcolor = clr_dict['ticks'], tickfont = dict(color = clr_dict['ticks']), 
+                         color = clr_dict['labels'], gridcolor = clr_dict['gridlines'])
+        
+        return dict(
+            plot_bgcolor = clr_dict['plot_bg'], 
+            paper_bgcolor = clr_dict['paper_bg'], 
+            xaxis = axis_clrs,
+            yaxis = axis_clrs,
+            legend = dict(grouptitlefont = dict(color = clr_dict['labels'])),
+            title = dict(font = dict(color = clr_dict['labels']))
+        )
+
+
+    def get_relayout_data(self, layout_dict, parent_path = ''):
+        '''
+        Flattens nested layout properties into the property paths used by a relayout (e.g. 'xaxis.tickfont.color'), 
+        so that only those properties are changed.
+        '''
+        relayout_data = {}
+        for key, val in layout_dict.items():
+            if isinstance(val, dict):
+                relayout_data.update(self.get_relayout_data(val, f'{parent_path}{key}.'))
+            else:
+                relayout_data[f'{parent_path}{key}'] = val
+
+        return relayout_data
+    
+
+    @updates.hold_updates
+    def restyle_figs(self, plot_names, trace_keys, clr_dict = None):
+        '''
+        Changes the colors of the displayed figures to the current colors of the given traces (and figure colors if 'clr_dict' is given).
+        Each figure gets a single style-only update, so no trace data is resent and the loading indicator isn't needed.
+        Note: traces are matched with their uid (see the uid note in app_utils.traces). Color cycle traces are matched by their order instead, 
+            since their uid only has the index of the first matching color in the color cycle.
+        '''
+        for plot_name in plot_names:
+            fig = self.plotly_panes[plot_name].object
+            if fig == None:
+                continue
+
+            # Note: the update is made with 'plotly_update' on only the restyled traces, since a 'batch_update' fills the skipped traces 
+                # with plotly's 'Undefined' sentinel, which can't be serialized into the Bokeh document
+            cycle_counts = {} # Dictionary of trace key to the number of color cycle traces already restyled
+            trace_idxs, trace_clrs = [], []
+            for trace_idx, fig_trace in enumerate(fig.data):
+                if fig_trace.uid == None:
+                    continue
+
+                trace_key, clr_type = fig_trace.uid.split('-')[:2]
+                if trace_key not in trace_keys:
+                    continue
 
+                trace = self.trace_info.all_traces[trace_key]
+                if clr_type == 'clr_cycle':
+                    cycle_idx = cycle_counts.get(trace_key, 0)
+                    cycle_counts[trace_key] = cycle_idx + 1
+                    clr = trace.clr_cycle[cycle_idx % len(trace.clr_cycle)]
+                else:
+                    clr = getattr(trace, clr_type)
+
+                trace_idxs.append(trace_idx)
+                trace_clrs.append(clr)
+
+            restyle_data = {'line.color': trace_clrs, 'marker.color': trace_clrs} if len(trace_idxs) != 0 else None
+            relayout_data = self.get_relayout_data(self.get_layout_clrs(clr_dict)) if clr_dict != None else None
+            if (restyle_data != None) or (relayout_data != None):
+                fig.plotly_update(restyle_data = restyle_data, relayout_data = relayout_data, trace_indexes = trace_idxs or None)
+
+
+    def _restyle_figs(self):
+        # Change colors of currently displayed figures to the current figure colors and theme trace colors
+            # Note: 'settings_info.lock_trigger' is used here to guard against 'settings_info.genrl_plot_checkbox' reset, which will lead to a change before any figures are displayed
+        if (self.clr_info.lock_trigger == False) and (self.settings_info.lock_trigger == False):
+            self.restyle_figs(
+                plot_names = self.trace_info.selected_phot_plots + self.trace_info.selected_ast_plots,
+                trace_keys = self.restyle_trace_keys,
+                clr_dict = self.clr_info.fig_clrs
+            )
+            self.restyle_trace_keys = set()
+
+
+    @updates.hold_updates
     def _update_trace_clrs(self, *event):
         '''
-        This function is always triggered by a single color picker
+        This function is always triggered by a single color picker (see 'set_trace_clr_change' in app_components.color_panel)
         '''
         if self.clr_info.lock_trigger == False:
             # This should be a tuple of the form (trace key, color type, ...), where ... is the color cycle index if color type is color cycle
                 # See the 'make_trace_clrs_layout' in app_components.color_panel
-            clr_picker_id = eval(event[0].obj.description)
-
+            clr_picker_id, clr = eval(event[0].new[0]), event[0].new[1]
             trace_key, clr_type = clr_picker_id[0], clr_picker_id[1]
-            trace_uid_list = [] # This is a list to store all unique ids of traces whose colors are to be changed
+            trace = self.trace_info.all_traces[trace_key]
 
             # Check if the trace is in a photometry or an astrometry plot
             if trace_key in self.trace_info.main_phot_keys + self.trace_info.extra_phot_keys:
@@ -224,11 +342,10 @@ class PlotPanel(Viewer):
             
             # Check if color type is pri_clr, sec_clr, or clr_cycle
                 # clr_cycle is a special case currently used for only GP samples
+                # Note: the attribute of the trace is changed to keep the color change when updating plot.
+                    # The color cycle is replaced instead of changed in place, since it may still be the list of a theme.
             if clr_type != 'clr_cycle':
-                trace_uid_list.append(f'{trace_key}-{clr_type}')
-
-                # Change the attribute of the trace to keep the color change when updating plot
-                setattr(self.trace_info.all_traces[trace_key], clr_type, event[0].obj.value)
+                setattr(trace, clr_type, clr)
 
             else:
                 # Check if color pickers for the color cycle are linked
@@ -237,57 +354,42 @@ class PlotPanel(Viewer):
                     self.clr_info.lock_trigger = True
                     
                     # Change value of each color picker
-                    for cycle_idx, clr_picker in enumerate(self.clr_info.trace_clr_pickers[trace_key]['clr_cycle']):
-                        clr_picker.value = event[0].obj.value
-                        trace_uid_list.append(f'{trace_key}-clr_cycle-{cycle_idx}')
+                    for clr_picker in self.clr_info.trace_clr_pickers[trace_key]['clr_cycle']:
+                        clr_picker.value = clr
 
                     self.clr_info.lock_trigger = False
-
-                    # Change the attribute of the trace to keep the color change when updating plot
-                    self.trace_info.all_traces[trace_key].clr_cycle = [event[0].obj.value] * len(self.trace_info.all_traces[trace_key].clr_cycle)
+                    trace.clr_cycle = [clr] * len(trace.clr_cycle)
 
                 else:
                     # Index for which part of the color cycle was changed
-                    cycle_idx = clr_picker_id[2]    
-                    trace_uid_list.append(f'{trace_key}-clr_cycle-{cycle_idx}')
-
-                    # Change the attribute of the trace to keep the color change when updating plot
-                    self.trace_info.all_traces[trace_key].clr_cycle[cycle_idx] = event[0].obj.value
+                    cycle_idx = clr_picker_id[2]
+                    clr_cycle = list(trace.clr_cycle)
+                    clr_cycle[cycle_idx] = clr
+                    trace.clr_cycle = clr_cycle
 
             # Change color of relevant traces that are currently displayed
-            for plot_name in trace_plot_names:
-                fig = self.plotly_panes[plot_name].object
-                for trace_uid in trace_uid_list:
-                    fig.update_traces(line_color = event[0].obj.value, marker_color = event[0].obj.value, selector = dict(uid = trace_uid))
+            self.restyle_figs(plot_names = trace_plot_names, trace_keys = [trace_key])
 
                 
-    # @pn.depends('clr_info.theme_dropdown.value', watch = True)
-    def set_plot_theme(self, *event):
+    def set_plot_theme(self):
         theme_dict = self.clr_info.theme_dropdown.value
         if theme_dict != 'None':
             # Change theme of traces
             self.trace_info.set_trace_theme(theme_dict)
 
-            # Change theme of the figure
-                # Note: the figure color pickers should have already been changed through styles
-                # Also, the lock here is used to prevent repeated patches. Although, this isn't too much of a problem since Panel knows to drop repeated patches.
-            self.settings_info.lock_trigger = True
-            self._update_base_figs()
-            self.settings_info.lock_trigger = False
-
-            # Replot everything
-            self.set_loading_layout()
-            self._update_phot_plots()
-            self._update_ast_plots()
+            # Change theme of the base figures (used by later plot updates) and restyle the displayed figures
+                # Note: the figure colors should have already been changed through 'clr_info.set_clr_picker_theme'
+                # Also, the displayed figures aren't replotted, since only their colors change
+            self.restyle_trace_keys.update(self.trace_info.all_traces.keys())
+            self.scheduler.invalidate('base_figs', 'fig_restyle')
 
 
     ########################
     # Plotting Methods
     ######################## 
-    @pn.depends('settings_info.trigger_param_change', watch = True)
-    def _update_all_plots(self, *event):
-        # Note: '*event' is needed for 'Num_pts' watcher
-    
+    @profiling.profiled('_update_all_plots')
+    @metrics.timed_update('all_plots')
+    async def _update_all_plots(self):
         # Note: lock needed to guard against Num_pts slider reset because trigger_param_change also triggers the update
             # See chain: set_default_tabs => _update_sliders => _update_param_values in settings_tabs.SettingsTabs class
         if self.settings_info.lock_trigger == False:
@@ -296,41 +398,69 @@ class PlotPanel(Viewer):
             try:
                 self.settings_info.set_param_errored_layout(undo = True)
 
-                # Check if throttled Num_pts was the event
-                if (event != ()) and (event[0].obj.name == self.settings_info.param_sliders['Num_pts'].name):
-                    self.set_loading_layout()
-
                 # Check if parameter sliders are throttled
-                elif self.settings_info.throttled == True:
+                    # Note: the loading layout for a throttled 'Num_pts' change is set by 'set_num_pts_loading_layout'
+                if self.settings_info.throttled == True:
                     self.set_loading_layout()
                 
                 # Update traces
                 # Note: It's possible to set the 'trigger_param_change' and 'Num_pts' dependency directly in trace.py for this function.
                     # However, I chose to put it here to make error catching easier.
-                self.trace_info.update_all_traces()
+                    # The traces are updated in the model pool, so that the event loop can handle other sessions in the meantime.
+                    # Their inputs are read here first, since this session's widgets can change while the pool thread runs.
+                trace_inputs = self.trace_info.get_trace_inputs()
+                await updates.run_in_executor(self.trace_info.update_all_traces, trace_inputs)
+
+                # Check if a newer change was made while the traces were updating. If so, these traces are already stale
+                if self.scheduler.is_dirty('all_plots'):
+                    return
+
+                # Build astrometry figures in the plotting pool
+                ast_figs = await self.build_ast_figs()
+                if self.scheduler.is_dirty('all_plots'):
+                    return
 
                 # Update plots
-                self._update_phot_plots()
-                self._update_ast_plots()
+                with updates.held_document():
+                    self._update_phot_plots()
+                    if ast_figs != None:
+                        self.set_ast_figs(ast_figs)
     
             except:
-                print('AN ERROR HAS OCCURRED:\n', traceback.format_exc())
-                self.settings_info.set_param_errored_layout(undo = False)
-
-
-    def _update_plot_time(self, *event):
-        # Check if time slider is throttled
-        if self.time_fn_dependency['throttled'] == True:
-            self.set_loading_layout()
-
-        # Update plots
-        self._update_phot_plots()
-        self._update_ast_plots()       
+                # Note: errors from stale traces are ignored, since the newer change will update the plots (or error layout) again
+                if self.scheduler.is_dirty('all_plots') == False:
+                    print('AN ERROR HAS OCCURRED:\n', traceback.format_exc())
+                    self.settings_info.set_param_errored_layout(undo = False)
+
+
+    @profiling.profiled('_update_plot_time')
+    @metrics.timed_update('time_plots')
+    async def _update_plot_time(self, *event):
+        # Check if the traces are being updated. If so, the plots are updated at the end of the current flush instead
+        if self.scheduler.is_flushing():
+            self.scheduler.invalidate('phot_plots', 'ast_plots')
+            return
+
+        # Build astrometry figures in the plotting pool
+            # Note: if the time changed again while they were built, the newer change updates the plots instead
+        ast_figs = await self.build_ast_figs()
+        if ast_figs == None:
+            return
+
+        with updates.held_document():
+            # Check if time slider is throttled
+            if self.time_fn_dependency['throttled'] == True:
+                self.set_loading_layout()
+
+            # Update plots
+            self._update_phot_plots()
+            self.set_ast_figs(ast_figs)
 
 
-    @pn.depends('settings_info.dashboard_checkbox.value', 'settings_info.phot_checkbox.value', 'settings_info.genrl_plot_checkbox.value', watch = True)
+    @profiling.profiled('_update_phot_plots')
+    @updates.hold_updates
     def _update_phot_plots(self, *event):
-        # Note: '*event' is needed for 'Time' and 'Num_samps' watcher
+        # Note: '*event' is needed for 'Time' watcher
 
         # Check if photometry is selected in dashboard
         # Check for locks. This is needed to guard against checkbox resets
@@ -343,109 +473,187 @@ class PlotPanel(Viewer):
             # This part may need to be changed if we add more types of photometry plots
                 # e.g. we could loop through names in styles.PHOT_PLOT_NAMES
 
-            # Create photometry figure
-            phot_fig = go.Figure(self.base_figs['phot'])
+            with metrics.span('phot_fig'):
+                # Create photometry figure
+                phot_fig = go.Figure(self.base_figs['phot'])
 
-            selected_trace_keys = set(self.trace_info.main_phot_keys + self.trace_info.extra_phot_keys)
+                selected_trace_keys = set(self.trace_info.main_phot_keys + self.trace_info.extra_phot_keys)
 
-            # Get all keys with a time trace and plot them
-            selected_time_keys = [key for key in self.trace_info.trace_types['plot_time'] if key in selected_trace_keys]
-            all_phot = []
+                # Get all keys with a time trace and plot them
+                selected_time_keys = [key for key in self.trace_info.trace_types['plot_time'] if key in selected_trace_keys]
+                all_phot = []
             
-            for trace_key in selected_time_keys:
-                trace = self.trace_info.all_traces[trace_key]
-                trace.plot_time(fig = phot_fig, time_idx = time_idx)
-                all_phot += trace.get_phot_list()
-
-            # Get all keys with a full trace and plot them
-            if 'full_trace' in self.settings_info.genrl_plot_checkbox.value:
-                selected_full_keys = [key for key in self.trace_info.trace_types['plot_full'] if key in selected_trace_keys]
-
-                for trace_key in selected_full_keys:
-                    self.trace_info.all_traces[trace_key].plot_full(fig = phot_fig)
-
-            # Get all keys with a marker trace and plot them
-            if 'marker' in self.settings_info.genrl_plot_checkbox.value:
-                selected_marker_keys = [key for key in self.trace_info.trace_types['plot_marker'] if key in selected_trace_keys]
-
-                for trace_key in selected_marker_keys:
-                    self.trace_info.all_traces[trace_key].plot_marker(fig = phot_fig, marker_idx = time_idx[-1])
-
-            # Set up traces to fix axis limits
-            min_time, max_time = np.nanmin(time), np.nanmax(time)
-            min_phot, max_phot = np.nanmin(all_phot), np.nanmax(all_phot)
-
-            traces.add_limit_trace(
-                fig = phot_fig, 
-                x_limits = [min_time, max_time],
-                y_limits = [min_phot, max_phot]
-            )
+                for trace_key in selected_time_keys:
+                    trace = self.trace_info.all_traces[trace_key]
+                    with metrics.span('plot.' + trace_key):
+                        trace.plot_time(fig = phot_fig, time_idx = time_idx)
+                    all_phot += trace.get_phot_list()
+
+                # Get all keys with a full trace and plot them
+                if 'full_trace' in self.settings_info.genrl_plot_checkbox.value:
+                    selected_full_keys = [key for key in self.trace_info.trace_types['plot_full'] if key in selected_trace_keys]
+
+                    for trace_key in selected_full_keys:
+                        with metrics.span('plot.' + trace_key):
+                            self.trace_info.all_traces[trace_key].plot_full(fig = phot_fig)
+
+                # Get all keys with a marker trace and plot them
+                if 'marker' in self.settings_info.genrl_plot_checkbox.value:
+                    selected_marker_keys = [key for key in self.trace_info.trace_types['plot_marker'] if key in selected_trace_keys]
+
+                    for trace_key in selected_marker_keys:
+                        with metrics.span('plot.' + trace_key):
+                            self.trace_info.all_traces[trace_key].plot_marker(fig = phot_fig, marker_idx = time_idx[-1])
+
+                # Set up traces to fix axis limits
+                min_time, max_time = np.nanmin(time), np.nanmax(time)
+                min_phot, max_phot = np.nanmin(all_phot), np.nanmax(all_phot)
+
+                traces.add_limit_trace(
+                    fig = phot_fig, 
+                    x_limits = [min_time, max_time],
+                    y_limits = [min_phot, max_phot]
+                )
 
             # Update photometry pane with figure
-            self.plotly_panes['phot'].object = phot_fig
+                # Note: the pane converts the figure into its Bokeh model data here
+            with metrics.span('phot_pane'):
+                self.plotly_panes['phot'].object = phot_fig
 
             # Check if loading or error indicator is on
             if self.plot_boxes['phot'].objects[0].name != self.plotly_panes['phot'].name:
                 self.plot_boxes['phot'].objects = [self.plotly_panes['phot']]
 
+            # Stamp the update, so that the browser reports when it's drawn
+            if self.render_tracker != None:
+                self.render_tracker.stamp('phot')
+
+
+    async def _update_ast_plots(self, *event):
+        ast_figs = await self.build_ast_figs()
+        if (ast_figs != None) and (self.scheduler.is_dirty('ast_plots') == False):
+            self.set_ast_figs(ast_figs)
 
-    @pn.depends('settings_info.dashboard_checkbox.value', 'settings_info.ast_checkbox.value', 'settings_info.genrl_plot_checkbox.value', watch = True)
-    def _update_ast_plots(self, *event):
-        # Note: '*event' is needed for 'Time' watcher
 
+    async def build_ast_figs(self):
+        '''
+        Builds the selected astrometry figures concurrently in the shared plotting pool, and awaits them without blocking the event loop.
+        Returns a dictionary of plot name to figure, or None if a newer build was started while these figures were built (i.e. they are stale).
+        Note: everything the figures are built from is read here before they are submitted, since the widgets can change while they are built.
+        '''
         # Check if astrometry is selected in dashboard
         # Check for locks. This is needed to guard against checkbox resets
-        if (len(self.trace_info.selected_ast_plots) != 0) and (self.settings_info.lock_trigger == False):
-            time = self.trace_info.cache['time']
+        if (len(self.trace_info.selected_ast_plots) == 0) or (self.settings_info.lock_trigger == True):
+            return {}
+
+        self.ast_build_count += 1
+        build_count = self.ast_build_count
+
+        time = self.trace_info.cache['time']
+
+        # Get times that are less than or equal to Time slider
+        time_idx = np.where(time <= self.settings_info.param_sliders['Time'].value)[0]
+
+        # Get general plot settings once, so that every figure is built with the same settings
+        genrl_plot_value = tuple(self.settings_info.genrl_plot_checkbox.value)
+
+        # Get all trace keys that are to be plotted
+        selected_keys = {'time': [], 'full': [], 'marker': []}
+        selected_keys['all'] = set(self.trace_info.extra_ast_keys + self.trace_info.main_ast_keys)
+
+        # Get all selected keys with a time trace
+            # Note: putting selected_trace_keys first takes longer, but makes ordering much easier
+        selected_keys['time'] = [key for key in self.trace_info.trace_types['plot_time'] if key in selected_keys['all']]
+
+        # Get all selected keys with a full trace
+            # Note: putting selected_trace_keys first takes longer, but makes ordering much easier
+        if 'full_trace' in genrl_plot_value:
+            selected_keys['full'] = [key for key in self.trace_info.trace_types['plot_full'] if key in selected_keys['all']]
+
+        # Get all selected keys with a marker
+            # Note: putting selected_trace_keys first takes longer, but makes ordering much easier
+        if 'marker' in genrl_plot_value:
+            selected_keys['marker'] = [key for key in self.trace_info.trace_types['plot_marker'] if key in selected_keys['all']]
+
+        # Snapshot of the selected traces, so that later trace/color updates can't change a figure while it's being built
+        trace_snapshot = self.trace_info.get_trace_snapshot(selected_keys['all'])
+
+        # Build the astrometry figures concurrently in the shared plotting pool
+            # Note: each figure is built in a copy of the current context, so that it keeps the current metric tags
+        ast_futures = {}
+        for plot_name in self.trace_info.selected_ast_plots:
+            ast_futures[plot_name] = AST_PLOT_POOL.submit(
+                contextvars.copy_context().run,
+                self._update_single_ast, 
+                plot_name = plot_name, 
+                base_fig = self.base_figs[plot_name],
+                time_idx = time_idx, 
+                selected_keys = selected_keys, 
+                trace_snapshot = trace_snapshot
+            )
 
-            # Get times that are less than or equal to Time slider
-            time_idx = np.where(time <= self.settings_info.param_sliders['Time'].value)[0]
+        ast_figs = await updates.gather_futures(ast_futures)
+        if build_count != self.ast_build_count:
+            return None
 
-            # Get all trace keys that are to be plotted
-            selected_keys = {}
-            selected_keys['all'] = set(self.trace_info.extra_ast_keys + self.trace_info.main_ast_keys)
+        return ast_figs
 
-            # Get all selected keys with a time trace
-                # Note: putting selected_trace_keys first takes longer, but makes ordering much easier
-            selected_keys['time'] = [key for key in self.trace_info.trace_types['plot_time'] if key in selected_keys['all']]
 
-            # Get all selected keys with a full trace
-                # Note: putting selected_trace_keys first takes longer, but makes ordering much easier
-            if 'full_trace' in self.settings_info.genrl_plot_checkbox.value:
-                selected_keys['full'] = [key for key in self.trace_info.trace_types['plot_full'] if key in selected_keys['all']]
+    @updates.hold_updates
+    def set_ast_figs(self, ast_figs):
+        '''
+        Updates all astrometry panes in one batch with the figures from 'build_ast_figs'.
+        Note: this is only called from the event loop, so the panes are never updated from a pool thread.
+        '''
+        for plot_name in ast_figs.keys():
+            with metrics.span('ast_pane'):
+                self.plotly_panes[plot_name].object = ast_figs[plot_name]
+
+            # Check if loading or error indicator is on
+            if self.plot_boxes[plot_name].objects[0].name != self.plotly_panes[plot_name].name:
+                self.plot_boxes[plot_name].objects = [self.plotly_panes[plot_name]]
 
-            # Get all selected keys with a marker
-                # Note: putting selected_trace_keys first takes longer, but makes ordering much easier
-            if 'marker' in self.settings_info.genrl_plot_checkbox.value:
-                selected_keys['marker'] = [key for key in self.trace_info.trace_types['plot_marker'] if key in selected_keys['all']]
+            if self.render_tracker != None:
+                self.render_tracker.stamp(plot_name)
 
-            for plot_name in self.trace_info.selected_ast_plots:
-                plotting_thread = threading.Thread(target = self._update_single_ast, args = (plot_name, time_idx, selected_keys))
-                plotting_thread.start()
+    @staticmethod
+    @profiling.profiled('_update_single_ast')
+    def _update_single_ast(plot_name, base_fig, time_idx, selected_keys, trace_snapshot):
+        '''
+        This function only builds and returns the figure for a single astrometry plot. It may be run in a plotting pool thread.
 
-    def _update_single_ast(self, plot_name, time_idx, selected_keys):
+        base_fig: the base figure of the plot, which is copied and not changed
+        selected_keys: a dictionary of the trace keys for the time, full and marker traces (empty if not shown)
+        trace_snapshot: a dictionary of copied trace objects from 'AllTraceInfo.get_trace_snapshot'
+        '''
+        with metrics.span('ast_fig'):
+            return PlotPanel._build_single_ast(plot_name, base_fig, time_idx, selected_keys, trace_snapshot)
+
+    @staticmethod
+    def _build_single_ast(plot_name, base_fig, time_idx, selected_keys, trace_snapshot):
         # Create figure
-        ast_fig = go.Figure(self.base_figs[plot_name])
+        ast_fig = go.Figure(base_fig)
 
         all_x, all_y = [], []
 
         # Plot time traces
         for trace_key in selected_keys['time']:
-            trace = self.trace_info.all_traces[trace_key]
-            trace.plot_time(fig = ast_fig, plot_name = plot_name, time_idx = time_idx)
+            trace = trace_snapshot[trace_key]
+            with metrics.span('plot.' + trace_key):
+                trace.plot_time(fig = ast_fig, plot_name = plot_name, time_idx = time_idx)
             x_list, y_list = trace.get_xy_lists(plot_name = plot_name)
             all_x += x_list
             all_y += y_list
 
         # Plot full traces
-        if 'full_trace' in self.settings_info.genrl_plot_checkbox.value:
-            for trace_key in selected_keys['full']:
-                self.trace_info.all_traces[trace_key].plot_full(fig = ast_fig, plot_name = plot_name)
+        for trace_key in selected_keys['full']:
+            with metrics.span('plot.' + trace_key):
+                trace_snapshot[trace_key].plot_full(fig = ast_fig, plot_name = plot_name)
 
         # Plot markers
-        if 'marker' in self.settings_info.genrl_plot_checkbox.value:
-            for trace_key in selected_keys['marker']:
-                self.trace_info.all_traces[trace_key].plot_marker(fig = ast_fig, plot_name = plot_name, marker_idx = time_idx[-1])
+        for trace_key in selected_keys['marker']:
+            with metrics.span('plot.' + trace_key):
+                trace_snapshot[trace_key].plot_marker(fig = ast_fig, plot_name = plot_name, marker_idx = time_idx[-1])
 
         # Set up traces to fix axis limits
         min_x, max_x = np.nanmin(all_x), np.nanmax(all_x)
@@ -457,12 +665,7 @@ class PlotPanel(Viewer):
             y_limits = [min_y, max_y]
         )
 
-        # Update astrometry pane with figure
-        self.plotly_panes[plot_name].object = ast_fig
-
-        # Check if loading or error indicator is on
-        if self.plot_boxes[plot_name].objects[0].name != self.plotly_panes[plot_name].name:
-                self.plot_boxes[plot_name].objects = [self.plotly_panes[plot_name]]
+        return ast_fig
 
 
     ########################
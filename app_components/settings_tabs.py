@@ -10,7 +10,7 @@ import panel as pn
 from panel.viewable import Viewer
 import param
 
-from app_utils import constants, styles
+from app_utils import constants, styles, updates, profiling
 from app_components import paramztn_select
 
 
@@ -33,11 +33,18 @@ class SettingsTabs(Viewer):
     # Parameter to indicate whether sliders are throttled (e.g. when we have a BL model)
     throttled = param.Boolean(default = False)
 
+    # Parameter to indicate whether the browser is slow to show plot updates, so that sliders are also throttled
+        # Note: this is only set when client latency is measured (see 'app_utils.client_latency')
+    slow_client = param.Boolean(default = False)
+
     # Current parameter being changes
     current_param_change = param.String()
 
     # Dictionary for model parameter values
     mod_param_values = param.Dict(default = {})
+
+    # Minimum time (in milliseconds) between parameter table patches while a slider is being dragged
+    TABLE_PATCH_INTERVAL = 250
     
     # Checkbox for dashboard panes
     db_options_dict = {
@@ -178,6 +185,9 @@ class SettingsTabs(Viewer):
         # List containing all tables for easy disabling
         self.all_tables = [self.param_table, self.slider_table]
 
+        # Slider values that still need to be patched into the displayed parameter table
+        self.param_table_patcher = updates.TablePatcher(self.param_table, self.TABLE_PATCH_INTERVAL)
+
         # HTML message for errored slider range settings
         self.slider_error_msg = pn.pane.HTML(object = None, name = 'ERRORED SLIDERS')
 
@@ -372,10 +382,11 @@ class SettingsTabs(Viewer):
         super().__init__(**params)
         # set dependencies and on-edit functions
         self.param_sliders['Num_pts'].param.watch(self.set_mod_slider_throttle, 'value_throttled')
+        self.param.watch(self.set_mod_slider_throttle, 'slow_client')
         self.param_sliders['Time'].param.watch(self._update_param_values, 'value')
 
         self.param_table.on_edit(self._update_param_table_change)
-        self.slider_table.on_edit(self._update_sliders)
+        self.slider_table.on_edit(self._update_slider_table_change)
 
 
     def set_base_layout(self):
@@ -528,6 +539,8 @@ class SettingsTabs(Viewer):
         self.lock_trigger = False
         
         # Update tables
+            # Note: full table replacement is only done here. Slider changes are patched in with 'param_table_patcher'
+        self.param_table_patcher.clear()
         idx_list = ['Time'] + self.paramztn_info.selected_params
         self.slider_table.value = constants.DEFAULT_SLIDER_DF.loc[idx_list]
         self.param_table.value = constants.DEFAULT_PARAM_DF.loc[idx_list]
@@ -539,6 +552,8 @@ class SettingsTabs(Viewer):
         self._update_sliders()
 
 
+    @profiling.profiled('_update_sliders')
+    @updates.hold_updates
     def _update_sliders(self, *event):
         param_df = self.param_table.value
         slider_df = self.slider_table.value
@@ -618,9 +633,54 @@ class SettingsTabs(Viewer):
     def _update_param_table_change(self, *event):
         # Note: param_table_change happens from param_table edits
         self.current_param_change = self.param_table.value.index[event[0].row]
-        self._update_sliders()
+        self._update_single_slider(self.current_param_change)
+
+
+    def _update_slider_table_change(self, *event):
+        # Note: slider_table_change happens from slider_table edits
+        self._update_single_slider(self.slider_table.value.index[event[0].row])
+
+
+    @updates.hold_updates
+    def _update_single_slider(self, param):
+        '''
+        Applies the table rows of a single parameter to its slider, instead of updating all sliders with '_update_sliders'.
+        The model is only recomputed if the slider value actually changed (i.e. a Min/Max/Step-only edit doesn't recompute anything).
+        '''
+        # Check if any slider settings are errored. If so, update all sliders since the errored row may be a different one.
+        if self.errored_state['slider_settings'].value == True:
+            self._update_sliders()
+            return
+
+        current_val = self.param_table.value.loc[(param, 'Value')]
+        min_val = self.slider_table.value.loc[(param, 'Min')]
+        max_val = self.slider_table.value.loc[(param, 'Max')]
+        step_val = self.slider_table.value.loc[(param, 'Step')]
+
+        # Check for errors
+        try:
+            self._check_errors(param, current_val, min_val, max_val, step_val)             
+        except SystemExit:
+            return
 
+        value_changed = (self.param_sliders[param].value != current_val)
 
+        # Note: Lock is needed so that slider watchers don't trigger before all slider settings are updated
+        self.lock_trigger = True
+        self.param_sliders[param].param.update(
+            value = current_val, 
+            start = min_val, 
+            end = max_val,
+            step = step_val
+        )
+        self.lock_trigger = False
+
+        # Note: this also recomputes for a 'Time' change, since the time array needs to contain the 'Time' value
+        if value_changed:
+            self._update_param_values()
+
+
+    @updates.hold_updates
     def _update_param_values(self, *event):
         # Note: the '*event' argument is used to set dependency on sliders
 
@@ -635,10 +695,12 @@ class SettingsTabs(Viewer):
                 self.current_param_change = param_name
 
                 # Change data frame value and range table
+                    # Note: the data frame is changed right away, so that table edits always use the latest slider values.
+                    # However, the displayed table is only patched at a low rate, instead of resending the whole table on every slider tick.
                 param_df = self.param_table.value
                 param_df.loc[(param_name, 'Value')] = self.param_sliders[param_name].value
 
-                self.param_table.value = param_df
+                self.param_table_patcher.set_cells('Value', {param_name: self.param_sliders[param_name].value})
 
             if (event == ()) or (self.current_param_change != 'Time'):
                 # Update model parameter values
@@ -663,14 +725,21 @@ class SettingsTabs(Viewer):
     def set_mod_slider_throttle(self, *event):
         # Lock needed to prevent overlap with changing data table (the function is called after num_pts is changed)
         # BL check needed to prevent undoing throttle for binary-lens models
+        # Sliders are also throttled while the browser is slow to show plot updates (see 'app_utils.client_latency')
         if self.lock_trigger == False:
-            if (self.param_sliders['Num_pts'].value >= 10000) or ('BL' in self.paramztn_info.selected_paramztn):
+            if ((self.param_sliders['Num_pts'].value >= 10000) or ('BL' in self.paramztn_info.selected_paramztn) or 
+                (self.slow_client == True)):
                 self.throttled = True
                 dependency = 'value_throttled'
             else:
                 self.throttled = False
                 dependency = 'value'
 
+            # Unwatch the sliders that are no longer shown, so that only the selected parameters' sliders are watched
+            for param in list(self.slider_watchers.keys()):
+                if param not in self.paramztn_info.selected_params:
+                    self.param_sliders[param].param.unwatch(self.slider_watchers.pop(param))
+
             for param in self.paramztn_info.selected_params:
                 # Unwatch before updating to prevent multiple repeated watchers (memory leaks)
                 if param in self.slider_watchers:
@@ -679,6 +748,13 @@ class SettingsTabs(Viewer):
                 self.slider_watchers[param] = self.param_sliders[param].param.watch(self._update_param_values, dependency)
 
 
+    def get_metric_tags(self):
+        '''
+        Returns the tags given to the update stage spans of this dashboard (see 'app_utils.metrics').
+        '''
+        return {'paramztn': self.paramztn_info.selected_paramztn, 'num_pts': self.param_sliders['Num_pts'].value}
+
+
     def __panel__(self):
         return self.tabs_layout
 
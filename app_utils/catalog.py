@@ -0,0 +1,85 @@
+################################################
+# Packages
+################################################
+import re
+
+from app_utils import constants, styles, lazy_imports, metrics
+
+# Note: BAGLE is only imported when the first parameterization information is made (see 'app_utils.lazy_imports')
+model = lazy_imports.lazy_import('bagle.model')
+
+
+################################################
+# Parameterization Catalog
+################################################
+# Note: this catalog is made once per server process and is shared (read-only) by all sessions.
+    # Selecting a model or parameterization only does dictionary lookups, instead of regex matching and reflecting over 'bagle.model'.
+
+def get_mod_types(paramztn):
+    '''
+    Returns the model types of a parameterization, in the form (srclens, data, par, gp).
+    This is the same order as 'mod_select.ModSelect.type_dict', where gp is either '' or 'GP'.
+    '''
+    paramztn_split = paramztn.split('_')
+    if paramztn_split[3] == 'GP':
+        return tuple(paramztn_split[:3] + ['GP'])
+    else:
+        return tuple(paramztn_split[:3] + [''])
+
+
+# Dictionary of model types (srclens, data, par, gp) to a tuple of their parameterizations (in the order of 'constants.ALL_MODS')
+MOD_PARAMZTNS = {}
+for paramztn in constants.ALL_MODS:
+    mod_types = get_mod_types(paramztn)
+    MOD_PARAMZTNS[mod_types] = MOD_PARAMZTNS.get(mod_types, ()) + (paramztn,)
+
+
+# Dictionary of parameterization to its information (see 'get_paramztn_info')
+PARAMZTN_INFO = {}
+
+
+def get_paramztn_info(paramztn):
+    '''
+    Returns a dictionary with the parameter names ('params'), photometry parameter names ('phot_params'),
+    and the tooltip HTML of the parameterization button ('tooltip_html').
+    Note: the information of a parameterization is only made the first time it's needed by any session, and is then reused.
+        The parameter names are tuples, so that sessions can't change the shared catalog.
+    '''
+    metrics.count_cache('paramztn_info', paramztn in PARAMZTN_INFO)
+    if paramztn in PARAMZTN_INFO:
+        return PARAMZTN_INFO[paramztn]
+
+    srclens, data, par, gp = get_mod_types(paramztn)
+
+    # Get paramaterization class
+    class_num = re.search('Param.*', paramztn).group()
+    if gp == 'GP':
+        param_class_str = '_'.join([srclens, 'GP', data + class_num])
+    else:
+        param_class_str = '_'.join([srclens, data + class_num])
+
+    param_class = getattr(model, param_class_str)
+
+    # Get required parameters for paramaterization
+    all_param_names = (param_class.fitter_param_names + param_class.phot_param_names +
+                       param_class.phot_optional_param_names + param_class.ast_optional_param_names)
+
+    if par == 'Par':
+        all_param_names += ['raL', 'decL']
+
+    # Write HTML for button tooltip
+    tooltip_html = ''.join([f'''<span>{param}</span>''' for param in all_param_names])
+    tooltip_html = f'''
+        <div style = "display:flex; align-items:center; flex-direction:column;
+                      padding:0.25rem; border:0.04rem black solid; color:{styles.CLRS['page_primary']};
+                      font-size:{styles.FONTSIZES['tooltip']}; font-weight:bold;">
+            {tooltip_html}
+        </div>
+    '''
+
+    PARAMZTN_INFO[paramztn] = {
+        'params': tuple(all_param_names),
+        'phot_params': tuple(param_class.phot_param_names),
+        'tooltip_html': tooltip_html
+    }
+    return PARAMZTN_INFO[paramztn]
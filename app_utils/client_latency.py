@@ -0,0 +1,170 @@
+################################################
+# Packages
+################################################
+import os
+import json
+import time
+from collections import deque
+
+import numpy as np
+import panel as pn
+
+from app_utils import metrics
+
+
+################################################
+# Client-Observed Plot Latency
+################################################
+# Note: client latency is off by default. It's turned on with the 'BAGLE_CLIENT_LATENCY' environment variable
+    # (e.g. 'BAGLE_CLIENT_LATENCY=1 BAGLE_METRICS=1 panel serve app.py').
+    # Every plot update is then stamped with an update ID, and the browser reports back once plotly has drawn that update.
+    # The input-to-pixel latency of each update (from the start of the update's outermost span to the browser's report)
+    # is recorded in the update metrics, and also used to throttle the sliders of sessions whose browser can't keep up.
+    # Without 'BAGLE_METRICS', there are no spans, so the latency only starts when the plot's pane is updated.
+ENABLED = os.environ.get('BAGLE_CLIENT_LATENCY', '0') not in ['', '0']
+
+# Median input-to-pixel latency (in seconds) over the recent updates of a session, above which its sliders are throttled
+    # Note: the sliders are unthrottled again once the median is below half of this, so that the throttle doesn't flip on every update
+SLOW_LATENCY = float(os.environ.get('BAGLE_SLOW_LATENCY', 0.5))
+
+# Number of recent updates of a session used for the median latency (at least half of them are needed to change the throttle)
+NUM_RECENT_LATENCIES = 8
+
+# Longest time (in milliseconds) the browser waits for a stamped update to be drawn before it's dropped (e.g. a plot that was hidden)
+MAX_WAIT_MS = 10000
+
+# Number of recent reports the browser resends with every report
+    # Note: panel can merge changes of the same widget value that arrive together, so a report can be dropped if it's only sent once
+NUM_RESENT_REPORTS = 8
+
+# Dictionary of plot name to the histogram of its input-to-pixel latencies, over all sessions of the server process
+PLOT_HISTOGRAMS = {}
+
+# Note: this runs in the browser whenever the stamps change. The stamps are a dictionary of plot name to update ID.
+    # Each new stamp waits (once per frame) until the plotly view of its plot exists and isn't drawing (i.e. 'Plotly.react' is done).
+    # Views are found by their model's name, which is the name of their pane (i.e. the plot name).
+    # The stamps are sent in the same patch as the figures, so by the next frame, a view that already exists has started drawing the update.
+    # The render time is measured with the browser's clock from the stamp's arrival, so the server and browser clocks don't need to match.
+REPORT_CODE = f'''
+const stamps = JSON.parse(source.value || '{{}}')
+if (source._bagle_reports == null) {{
+    source._bagle_reports = []
+    source._bagle_max_update_id = 0
+}}
+
+const max_update_id = source._bagle_max_update_id
+for (const [plot_name, update_id] of Object.entries(stamps)) {{
+    if (update_id <= max_update_id) {{
+        continue
+    }}
+    source._bagle_max_update_id = Math.max(source._bagle_max_update_id, update_id)
+
+    const start = performance.now()
+    const wait_for_render = () => {{
+        const view = Bokeh.index.query_one((view) => (view.model.name == plot_name) && ('_reacting' in view))
+        if ((view != null) && view._rendered && !view._reacting) {{
+            source._bagle_reports = [
+                ...source._bagle_reports.slice(1 - {NUM_RESENT_REPORTS}),
+                [plot_name, update_id, (performance.now() - start) / 1000]
+            ]
+            report.value = JSON.stringify(source._bagle_reports)
+        }} else if (performance.now() - start < {MAX_WAIT_MS}) {{
+            requestAnimationFrame(wait_for_render)
+        }}
+    }}
+    requestAnimationFrame(wait_for_render)
+}}
+'''
+
+
+class RenderTracker:
+    '''
+    Tracks the client-observed latency of the plot updates of one session (see 'ENABLED').
+    The stamps are sent to the browser with a hidden text input, and the browser's reports come back with another one.
+    Both inputs are in 'layout', which has to be added to the session's page.
+    '''
+
+    def __init__(self, settings_info):
+        self.settings_info = settings_info
+        self.next_update_id = 1
+
+        # Dictionary of plot name to (update ID, update start time, stamp time, metric tags) of its last update that isn't drawn yet
+        self.pending = {}
+
+        # Input-to-pixel latencies (in seconds) of the session's recent updates
+        self.recent_latencies = deque(maxlen = NUM_RECENT_LATENCIES)
+
+        self.stamp_input = pn.widgets.TextInput(value = '{}')
+        self.report_input = pn.widgets.TextInput(value = '[]')
+        self.stamp_input.jscallback(args = {'report': self.report_input}, value = REPORT_CODE)
+        self.report_input.param.watch(self.record_reports, 'value')
+
+        self.layout = pn.Row(self.stamp_input, self.report_input, visible = False)
+
+
+    def stamp(self, plot_name):
+        '''
+        Stamps the last update of a plot's pane. This is called after the pane is updated and shown.
+        Note: an update that is never drawn (e.g. its plot is replaced by the error layout) is dropped by the browser, 
+            and is replaced here by the plot's next update.
+        '''
+        stamp_time = time.perf_counter()
+        start_time = metrics.get_update_start_time()
+        if start_time == None:
+            start_time = stamp_time
+
+        self.pending[plot_name] = (self.next_update_id, start_time, stamp_time, self.settings_info.get_metric_tags())
+        self.next_update_id += 1
+
+        # Note: every update that isn't drawn yet is sent, since only the last stamp value of a held document is sent
+        stamps = {name: pending_update[0] for name, pending_update in self.pending.items()}
+        self.stamp_input.value = json.dumps(stamps)
+
+
+    def record_reports(self, event):
+        report_time = time.perf_counter()
+        for plot_name, update_id, render_time in json.loads(event.new):
+            # Note: reports of updates that were already recorded (or replaced by a newer update) are ignored
+            if (plot_name not in self.pending) or (self.pending[plot_name][0] != update_id):
+                continue
+
+            update_id, start_time, stamp_time, tags = self.pending.pop(plot_name)
+            latency = report_time - start_time
+            self.recent_latencies.append(latency)
+
+            if metrics.ENABLED == True:
+                self.record_latency(plot_name, latency, stamp_time - start_time, render_time, tags)
+
+        self.set_slow_client()
+
+
+    def record_latency(self, plot_name, latency, server_time, render_time, tags):
+        '''
+        Records the input-to-pixel latency of an update as an 'input_to_pixel' span, broken down into
+            'pixel_server': the time until the pane was updated (i.e. the update's spans),
+            'pixel_transfer': the rest of the update, serialization, and both websocket trips,
+            'client_render': the time from the browser receiving the update to plotly finishing drawing it.
+        Note: the round trip of the report is included, since the server and browser clocks can't be compared.
+        '''
+        tags = {**tags, 'plot': plot_name}
+        latency_span = metrics.Span('input_to_pixel', tags)
+        metrics.record_span('pixel_server', server_time, tags, latency_span)
+        metrics.record_span('pixel_transfer', max(0, latency - server_time - render_time), tags, latency_span)
+        metrics.record_span('client_render', render_time, tags, latency_span)
+        metrics.record_span('input_to_pixel', latency, tags, None, latency_span.breakdown)
+
+        if plot_name not in PLOT_HISTOGRAMS:
+            PLOT_HISTOGRAMS[plot_name] = metrics.Histogram()
+        PLOT_HISTOGRAMS[plot_name].observe(latency)
+
+
+    def set_slow_client(self):
+        # Note: the slider throttle can only be set while a parameterization is selected
+        if (len(self.recent_latencies) < NUM_RECENT_LATENCIES / 2) or (self.settings_info.paramztn_info.selected_paramztn == None):
+            return
+
+        median_latency = np.median(self.recent_latencies)
+        if median_latency > SLOW_LATENCY:
+            self.settings_info.slow_client = True
+        elif median_latency < SLOW_LATENCY / 2:
+            self.settings_info.slow_client = False
@@ -23,5 +23,6 @@ ALL_INDICATORS = {
 }
 
 # Note: I am putting the GIF panes inside a flexbox because it seems to work better for linux
+# Note: this makes a new flexbox, so components make their indicators once and reuse them (instead of a new one every time an indicator is shown)
 def get_indicator(name):
     return pn.FlexBox(ALL_INDICATORS[name], styles = {'width':'min-content', 'height':'min-content'})
\ No newline at end of file
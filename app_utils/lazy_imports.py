@@ -0,0 +1,139 @@
+################################################
+# Packages
+################################################
+import sys
+import time
+import logging
+import importlib
+import threading
+
+
+################################################
+# Lazy Imports
+################################################
+# Note: BAGLE (with astropy), celerite, and plotly take most of the time needed to import the app.
+    # These are only imported when first used (or by the warm-up thread), so that the server can start without them.
+
+logger = logging.getLogger(__name__)
+
+# Dictionary of module name to its lazy module (see 'lazy_import')
+LAZY_MODULES = {}
+
+# Dictionary of module name to (import time in seconds, name of the thread that imported it)
+    # Note: modules that were already imported by something else (e.g. celerite by BAGLE) are listed as 'already imported'
+IMPORT_TIMES = {}
+
+
+class LazyModule:
+    '''
+    Stands in for a module, which is imported the first time one of its attributes is used.
+    Note: the attributes of this class are underscored so they don't hide attributes of the module.
+    Note: 'warmup_attrs' are attributes that are also loaded on import. This is for modules that load their own submodules lazily (e.g. plotly).
+    '''
+
+    def __init__(self, module_name, warmup_attrs = ()):
+        self._module_name = module_name
+        self._warmup_attrs = warmup_attrs
+        self._module = None
+
+    def _load(self):
+        if self._module == None:
+            already_imported = self._module_name in sys.modules
+            start_time = time.perf_counter()
+
+            # Note: importlib is thread-safe, so a session that needs the module during the warm-up will wait for it
+            module = importlib.import_module(self._module_name)
+            for attr_name in self._warmup_attrs:
+                getattr(module, attr_name)
+
+            if already_imported == True:
+                IMPORT_TIMES.setdefault(self._module_name, (time.perf_counter() - start_time, 'already imported'))
+            else:
+                IMPORT_TIMES.setdefault(self._module_name, (time.perf_counter() - start_time, threading.current_thread().name))
+
+            self._module = module
+
+        return self._module
+
+    def __getattr__(self, attr_name):
+        return getattr(self._load(), attr_name)
+
+    def __repr__(self):
+        return f'<lazy module {self._module_name!r}>'
+
+
+def lazy_import(module_name, warmup_attrs = ()):
+    '''
+    Returns the (shared) lazy module of 'module_name'.
+    '''
+    if module_name not in LAZY_MODULES:
+        LAZY_MODULES[module_name] = LazyModule(module_name, warmup_attrs)
+    return LAZY_MODULES[module_name]
+
+
+################################################
+# Warm-up Thread
+################################################
+WARMUP_THREAD = None
+
+
+def start_warmup():
+    '''
+    Starts a background thread that imports all lazy modules, so that they are usually ready before a session needs them.
+    Note: this only starts one thread per server process, no matter how many times it's called.
+    '''
+    global WARMUP_THREAD
+    if WARMUP_THREAD == None:
+        WARMUP_THREAD = threading.Thread(target = _warmup, name = 'import_warmup', daemon = True)
+        WARMUP_THREAD.start()
+
+
+def _warmup():
+    start_time = time.perf_counter()
+    for lazy_module in list(LAZY_MODULES.values()):
+        try:
+            lazy_module._load()
+        except Exception:
+            logger.exception(f'Failed to import {lazy_module._module_name!r} in the warm-up thread')
+
+    logger.info(f'Imported lazy modules in {time.perf_counter() - start_time:.2f}s')
+
+
+################################################
+# Import Time Report
+################################################
+def get_import_report():
+    '''
+    Returns a table (as a string) of the time taken by each lazy module import.
+    '''
+    report_lines = [f'{"Module":<24}{"Time (s)":>10}  Imported by']
+    for module_name, (import_time, thread_name) in sorted(IMPORT_TIMES.items(), key = lambda item: -item[1][0]):
+        report_lines.append(f'{module_name:<24}{import_time:>10.3f}  {thread_name}')
+
+    return '\n'.join(report_lines)
+
+
+if __name__ == '__main__':
+    # Prints an import time breakdown of the app. Run this from the app directory with 'python -m app_utils.lazy_imports'
+        # Note: each step only includes the modules that weren't already imported by the previous steps
+        # Note: the app modules use 'app_utils.lazy_imports' (not this '__main__' module), so its lazy modules are loaded here
+    import_steps = [
+        ('panel', ['panel']),
+        ('app components', ['app_components.mod_select', 'app_components.paramztn_select', 'app_components.settings_tabs',
+                            'app_components.param_summary', 'app_components.color_panel', 'app_components.plots',
+                            'app_components.code_display'])
+    ]
+
+    print(f'{"Step":<24}{"Time (s)":>10}')
+    for step_name, module_names in import_steps:
+        start_time = time.perf_counter()
+        for module_name in module_names:
+            importlib.import_module(module_name)
+        print(f'{step_name:<24}{time.perf_counter() - start_time:>10.3f}')
+
+    app_lazy_imports = importlib.import_module('app_utils.lazy_imports')
+    for lazy_module in list(app_lazy_imports.LAZY_MODULES.values()):
+        lazy_module._load()
+
+    print()
+    print(app_lazy_imports.get_import_report())
@@ -0,0 +1,366 @@
+################################################
+# Packages
+################################################
+import os
+import sys
+import time
+import asyncio
+import functools
+import bisect
+import threading
+import contextvars
+from collections import deque
+
+import numpy as np
+import panel as pn
+
+
+################################################
+# Update Stage Metrics
+################################################
+# Note: these metrics are shared by all sessions of the server process. They are off by default,
+    # and can be turned on with the 'BAGLE_METRICS' environment variable (e.g. 'BAGLE_METRICS=1 panel serve app.py')
+ENABLED = os.environ.get('BAGLE_METRICS', '0') not in ['', '0']
+
+# Upper bounds (in seconds) of the histogram buckets. The last bucket has no upper bound.
+HISTOGRAM_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Number of recent spans that are kept (e.g. to find slow updates)
+RECENT_SPANS_SIZE = 2000
+
+# Number of recent top-level spans (i.e. whole updates) that are kept with their stage breakdowns (e.g. for the admin page)
+RECENT_UPDATE_SPANS_SIZE = 500
+
+# Current (innermost) span. Spans inside of it are its children, and are given its tags (e.g. paramztn and num_pts).
+    # Note: the current span is passed to pool threads with the context (see 'updates.run_in_executor')
+CURRENT_SPAN = contextvars.ContextVar('current_span', default = None)
+
+# Dictionary of (stage, paramztn) to the histogram of the stage's durations
+STAGE_HISTOGRAMS = {}
+
+# Recent spans, stored as (end time, stage, duration in seconds, tags)
+RECENT_SPANS = deque(maxlen = RECENT_SPANS_SIZE)
+
+# Recent top-level spans, stored as dictionaries with the end time, stage, duration, tags, and breakdown (see 'Span')
+RECENT_UPDATE_SPANS = deque(maxlen = RECENT_UPDATE_SPANS_SIZE)
+
+# Dictionary of (counter name, labels) to the counter's value, where labels is a tuple of (label name, label value) pairs
+COUNTERS = {}
+
+# Times of recent updates (i.e. scheduler flushes), used for the update rate
+RECENT_UPDATES = deque(maxlen = 10000)
+
+_metrics_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self):
+        self.bucket_counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for i, bucket_count in enumerate(other.bucket_counts):
+            self.bucket_counts[i] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def get_quantile(self, quantile):
+        '''
+        Returns an estimate of a quantile (i.e. the upper bound of the bucket it falls in). The last bucket uses the maximum value.
+        '''
+        rank = quantile * self.count
+        cumulative_count = 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            cumulative_count += bucket_count
+            if (cumulative_count >= rank) and (bucket_count != 0):
+                if i < len(HISTOGRAM_BUCKETS):
+                    return min(HISTOGRAM_BUCKETS[i], self.max)
+                return self.max
+        return 0
+
+
+class Span:
+    '''
+    Context manager that records the time spent in a stage of an update.
+    Note: the total time of each stage directly inside of a span is kept in its 'breakdown' (stage: seconds).
+        Spans that aren't inside of another span are whole updates, and are kept in 'RECENT_UPDATE_SPANS' with their breakdown.
+        Stages that run in parallel threads (e.g. 'ast_fig') can add up to more than the span's own time.
+    '''
+
+    def __init__(self, stage, tags):
+        self.stage = stage
+        self.tags = tags
+        self.parent = None
+        self.breakdown = {}
+        self.start_time = None
+        self.span_token = None
+
+    def __enter__(self):
+        self.parent = CURRENT_SPAN.get()
+        if self.parent != None:
+            self.tags = {**self.parent.tags, **self.tags}
+
+        self.span_token = CURRENT_SPAN.set(self)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start_time
+        CURRENT_SPAN.reset(self.span_token)
+        record_span(self.stage, duration, self.tags, self.parent, self.breakdown)
+
+
+class NullSpan:
+    '''
+    Span that does nothing. This is used when metrics are disabled, so that spans have almost no overhead.
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(stage, **tags):
+    '''
+    Returns a context manager that times a stage of an update (e.g. 'with metrics.span('model', paramztn = ...):').
+    Note: tags (e.g. paramztn and num_pts) are given to every span inside of this span, including spans in pool threads.
+    '''
+    if ENABLED == False:
+        return NULL_SPAN
+    return Span(stage, tags)
+
+
+def timed_update(stage):
+    '''
+    Decorator for the update methods (sync or async) of dashboard components, which times the whole method as a span of 'stage'.
+    The span is tagged with the parameterization and number of points of the component's dashboard (i.e. 'self.settings_info').
+    '''
+
+    def decorator(function):
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def timed_function(self, *args, **kwargs):
+                if ENABLED == False:
+                    return await function(self, *args, **kwargs)
+                with Span(stage, self.settings_info.get_metric_tags()):
+                    return await function(self, *args, **kwargs)
+
+        else:
+            @functools.wraps(function)
+            def timed_function(self, *args, **kwargs):
+                if ENABLED == False:
+                    return function(self, *args, **kwargs)
+                with Span(stage, self.settings_info.get_metric_tags()):
+                    return function(self, *args, **kwargs)
+
+        return timed_function
+
+    return decorator
+
+
+def get_update_start_time():
+    '''
+    Returns the start time (from 'time.perf_counter') of the current update (i.e. the outermost span), or None outside of spans.
+    '''
+    current_span = CURRENT_SPAN.get()
+    if current_span == None:
+        return None
+
+    while current_span.parent != None:
+        current_span = current_span.parent
+    return current_span.start_time
+
+
+def record_span(stage, duration, tags, parent = None, breakdown = None):
+    histogram_key = (stage, tags.get('paramztn'))
+    with _metrics_lock:
+        if histogram_key not in STAGE_HISTOGRAMS:
+            STAGE_HISTOGRAMS[histogram_key] = Histogram()
+        STAGE_HISTOGRAMS[histogram_key].observe(duration)
+        RECENT_SPANS.append((time.time(), stage, duration, tags))
+
+        if parent != None:
+            parent.breakdown[stage] = parent.breakdown.get(stage, 0) + duration
+        else:
+            RECENT_UPDATE_SPANS.append({'time': time.time(), 'stage': stage, 'duration': duration, 'tags': tags, 
+                                        'breakdown': breakdown if breakdown != None else {}})
+
+
+def add_span(stage, duration):
+    '''
+    Records a stage that was timed without a span (e.g. the end of a 'with' block), as if it were a span inside of the current span.
+    '''
+    if ENABLED == False:
+        return
+
+    parent = CURRENT_SPAN.get()
+    record_span(stage, duration, parent.tags if parent != None else {}, parent)
+
+
+def count(counter_name, amount = 1, **labels):
+    '''
+    Adds to a counter (e.g. 'metrics.count('cache_requests', cache = 'trace_state', result = 'hit')').
+    '''
+    if ENABLED == False:
+        return
+
+    counter_key = (counter_name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        COUNTERS[counter_key] = COUNTERS.get(counter_key, 0) + amount
+
+
+def count_cache(cache_name, hit):
+    count('cache_requests', cache = cache_name, result = 'hit' if hit == True else 'miss')
+
+
+def record_update():
+    if ENABLED == False:
+        return
+
+    count('updates')
+    RECENT_UPDATES.append(time.time())
+
+
+def get_update_rate(window = 60):
+    '''
+    Returns the number of updates per second over the last 'window' seconds.
+    '''
+    start_time = time.time() - window
+    return sum(1 for update_time in list(RECENT_UPDATES) if update_time >= start_time) / window
+
+
+def set_enabled(enabled):
+    global ENABLED
+    ENABLED = enabled
+
+
+def reset():
+    with _metrics_lock:
+        STAGE_HISTOGRAMS.clear()
+        RECENT_SPANS.clear()
+        RECENT_UPDATE_SPANS.clear()
+        COUNTERS.clear()
+        RECENT_UPDATES.clear()
+
+
+################################################
+# Live Sessions
+################################################
+# Dictionary of session ID to (start time, app instance, Bokeh session context) of every live session of the server process
+    # Note: sessions are always tracked (even if metrics are disabled), since this is only done once per session
+SESSIONS = {}
+
+
+def register_session(app):
+    '''
+    Adds the app of the current session to 'SESSIONS'. It is removed when the session is destroyed.
+    Note: nothing is done without a server session.
+    '''
+    doc = pn.state.curdoc
+    if (doc == None) or (doc.session_context == None):
+        return
+
+    SESSIONS[doc.session_context.id] = (time.time(), app, doc.session_context)
+    pn.state.on_session_destroyed(unregister_session)
+
+
+def unregister_session(session_context):
+    SESSIONS.pop(session_context.id, None)
+
+
+def end_session(session_id):
+    '''
+    Closes the websocket connections of a live session (e.g. a runaway session found on the admin page).
+    Note: the server then discards the session (and calls 'unregister_session') once it has been unused for the server's 
+        unused session lifetime (see 'panel serve --unused-session-lifetime'). The session is removed from 'SESSIONS' right away.
+    '''
+    if session_id not in SESSIONS:
+        return
+
+    start_time, app, session_context = SESSIONS.pop(session_id)
+
+    # Note: Bokeh doesn't have a public way to close the connections of a session, so they are found with 'ServerSession._subscribed_connections'
+    server_session = session_context.session
+    if server_session != None:
+        for connection in list(server_session._subscribed_connections):
+            connection._socket.close()
+
+
+################################################
+# Object Sizes
+################################################
+def estimate_bytes(obj, max_depth = 6):
+    '''
+    Returns a rough estimate of the memory (in bytes) used by an object, including numpy arrays in nested containers.
+    Note: objects that are shared between containers are counted once for each container.
+    '''
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+
+    obj_bytes = sys.getsizeof(obj)
+    if max_depth != 0:
+        if isinstance(obj, dict):
+            for key, val in list(obj.items()):
+                obj_bytes += estimate_bytes(key, max_depth - 1) + estimate_bytes(val, max_depth - 1)
+        elif isinstance(obj, (list, tuple, set, deque)):
+            for val in list(obj):
+                obj_bytes += estimate_bytes(val, max_depth - 1)
+
+    return obj_bytes
+
+
+################################################
+# Metric Reports
+################################################
+def get_stage_histograms():
+    '''
+    Returns a dictionary of stage to its histogram, combined over all parameterizations.
+    '''
+    stage_histograms = {}
+    with _metrics_lock:
+        for (stage, paramztn), histogram in STAGE_HISTOGRAMS.items():
+            if stage not in stage_histograms:
+                stage_histograms[stage] = Histogram()
+            stage_histograms[stage].merge(histogram)
+
+    return stage_histograms
+
+
+def get_slowest_updates(num_updates = 20):
+    '''
+    Returns the slowest of the recent updates (see 'RECENT_UPDATE_SPANS'), sorted from slowest to fastest.
+    '''
+    with _metrics_lock:
+        update_spans = [{**update_span, 'breakdown': dict(update_span['breakdown'])} for update_span in RECENT_UPDATE_SPANS]
+
+    return sorted(update_spans, key = lambda update_span: -update_span['duration'])[:num_updates]
+
+
+def get_report():
+    '''
+    Returns a table (as a string) of the duration statistics (in milliseconds) of each stage, sorted by total time.
+    '''
+    report_lines = [f'{"Stage":<28}{"Count":>8}{"Mean":>10}{"p50":>10}{"p95":>10}{"Max":>10}{"Total":>12}']
+    stage_histograms = get_stage_histograms()
+    for stage, histogram in sorted(stage_histograms.items(), key = lambda item: -item[1].total):
+        report_lines.append(
+            f'{stage:<28}{histogram.count:>8}{1000 * histogram.total / histogram.count:>10.2f}'
+            f'{1000 * histogram.get_quantile(0.5):>10.2f}{1000 * histogram.get_quantile(0.95):>10.2f}'
+            f'{1000 * histogram.max:>10.2f}{1000 * histogram.total:>12.1f}'
+        )
+
+    return '\n'.join(report_lines)
@@ -0,0 +1,261 @@
+################################################
+# Packages
+################################################
+import os
+import time
+import types
+import pstats
+import asyncio
+import cProfile
+import logging
+import functools
+import threading
+import contextvars
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import panel as pn
+
+
+################################################
+# Callback Profiling
+################################################
+# Note: profiling is off by default. It's turned on with the 'BAGLE_PROFILE' environment variable:
+    # 'BAGLE_PROFILE=1 panel serve app.py' profiles the heavy callbacks of every session,
+    # and 'BAGLE_PROFILE=query panel serve app.py' only profiles sessions opened with '?profile=1' (e.g. 'localhost:5006/app?profile=1').
+    # Each profile is written to 'PROFILE_DIR' as a pstats file and a collapsed-stack file (the input format of flamegraph tools).
+MODE = os.environ.get('BAGLE_PROFILE', '0')
+ENABLED = MODE not in ['', '0']
+PROFILE_DIR = os.environ.get('BAGLE_PROFILE_DIR', 'profiles')
+
+# Shortest time (in seconds) between two profiles of the same callback, per server process
+    # Note: profiled calls are a few times slower, so this keeps the cost low enough to leave profiling on for a while
+MIN_INTERVAL = float(os.environ.get('BAGLE_PROFILE_INTERVAL', 60))
+
+# Collapsed stacks are cut at this depth, and stacks with less time (in seconds) than this are left out
+MAX_STACK_DEPTH = 100
+MIN_STACK_TIME = 1e-5
+
+# Dictionary of callback name to the time (from 'time.monotonic') its last profile was started
+LAST_PROFILE_TIMES = {}
+
+# Profiles of the callbacks that are being profiled in the current context
+    # Note: code run in pool threads with a copy of the context (see 'updates.run_in_executor') is added to these profiles
+CURRENT_PROFILES = contextvars.ContextVar('current_profiles', default = ())
+
+# Profiles are written in their own thread, so that the event loop isn't blocked
+WRITER_POOL = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'profile_writer')
+
+# Active profilers of each thread (innermost last)
+    # Note: only one profiler can be active in a thread, so an inner profiler pauses the outer one until it's done
+_thread_state = threading.local()
+_profile_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackProfile:
+    '''
+    The profile of one callback call, made of the profilers of every part of the call (see 'run_slice').
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.profilers = []
+        self.start_time = time.time()
+        self.start_perf_time = time.perf_counter()
+
+    def finish(self):
+        wall_time = time.perf_counter() - self.start_perf_time
+        WRITER_POOL.submit(write_profile, self.name, self.start_time, wall_time, list(self.profilers))
+
+
+def is_session_profiled():
+    if MODE != 'query':
+        return True
+    return pn.state.session_args.get('profile', [b''])[0] not in [b'', b'0']
+
+
+def start_profile(name):
+    '''
+    Returns a new profile of a callback, or None if the call shouldn't be profiled (i.e. its session isn't profiled, or it was profiled recently).
+    '''
+    if is_session_profiled() == False:
+        return None
+
+    start_time = time.monotonic()
+    with _profile_lock:
+        if (name in LAST_PROFILE_TIMES) and (start_time - LAST_PROFILE_TIMES[name] < MIN_INTERVAL):
+            return None
+        LAST_PROFILE_TIMES[name] = start_time
+
+    return CallbackProfile(name)
+
+
+def run_slice(function, *args, **kwargs):
+    '''
+    Runs 'function(*args, **kwargs)' with a new profiler, which is added to every profile of the current context.
+    Note: the function is run as is if nothing is being profiled.
+    '''
+    profiles = CURRENT_PROFILES.get()
+    if len(profiles) == 0:
+        return function(*args, **kwargs)
+
+    if not hasattr(_thread_state, 'profilers'):
+        _thread_state.profilers = []
+    active_profilers = _thread_state.profilers
+
+    profiler = cProfile.Profile()
+    if len(active_profilers) != 0:
+        active_profilers[-1].disable()
+    active_profilers.append(profiler)
+    profiler.enable()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profiler.disable()
+        active_profilers.pop()
+        if len(active_profilers) != 0:
+            active_profilers[-1].enable()
+        for profile in profiles:
+            profile.profilers.append(profiler)
+
+
+@types.coroutine
+def run_coroutine_slices(coroutine):
+    '''
+    Awaits a coroutine, profiling each of its steps on the event loop with 'run_slice'.
+    Note: the coroutine is stepped by hand (like 'yield from'), so that the other tasks that run while it waits aren't profiled with it.
+    '''
+    send_value, send_error = None, None
+    while True:
+        try:
+            if send_error != None:
+                awaited = run_slice(coroutine.throw, send_error)
+            else:
+                awaited = run_slice(coroutine.send, send_value)
+        except StopIteration as stop:
+            return stop.value
+
+        # Note: what the coroutine waits on (e.g. a future) is passed to the task running it, and the result is passed back
+        send_value, send_error = None, None
+        try:
+            send_value = yield awaited
+        except BaseException as error:
+            send_error = error
+
+
+def profiled(name):
+    '''
+    Decorator for heavy callbacks (sync or async), which profiles some of their calls (see 'start_profile').
+    Calls made while another callback is profiled (e.g. the plot updates of '_update_all_plots') are also added to that profile.
+    '''
+
+    def decorator(function):
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def profiled_function(*args, **kwargs):
+                if ENABLED == False:
+                    return await function(*args, **kwargs)
+
+                # Note: the steps of a coroutine awaited by a profiled coroutine are already profiled with it
+                profile = start_profile(name)
+                if profile == None:
+                    return await function(*args, **kwargs)
+
+                token = CURRENT_PROFILES.set(CURRENT_PROFILES.get() + (profile,))
+                try:
+                    return await run_coroutine_slices(function(*args, **kwargs))
+                finally:
+                    CURRENT_PROFILES.reset(token)
+                    profile.finish()
+
+        else:
+            @functools.wraps(function)
+            def profiled_function(*args, **kwargs):
+                if ENABLED == False:
+                    return function(*args, **kwargs)
+
+                profile = start_profile(name)
+                if profile == None:
+                    return run_slice(function, *args, **kwargs)
+
+                token = CURRENT_PROFILES.set(CURRENT_PROFILES.get() + (profile,))
+                try:
+                    return run_slice(function, *args, **kwargs)
+                finally:
+                    CURRENT_PROFILES.reset(token)
+                    profile.finish()
+
+        return profiled_function
+
+    return decorator
+
+
+################################################
+# Profile Files
+################################################
+def get_func_label(func):
+    filename, line_num, func_name = func
+    if filename == '~':
+        label = func_name
+    else:
+        label = f'{func_name} ({os.path.basename(filename)}:{line_num})'
+    return label.replace(';', ',')
+
+
+def get_collapsed_stacks(stats):
+    '''
+    Returns a dictionary of collapsed stack (e.g. 'a;b;c') to its own time (in seconds).
+    Note: cProfile only keeps the callers of each function (not whole stacks), so the time of a function that is called from
+        more than one place is split between its stacks in proportion to the time spent in it from each caller.
+    '''
+    callees = defaultdict(dict)
+    for func, (prim_calls, num_calls, own_time, cum_time, callers) in stats.stats.items():
+        for caller, caller_stats in callers.items():
+            callees[caller][func] = caller_stats[3]
+
+    stacks = defaultdict(float)
+
+    def add_stack(func, scale, stack, stack_funcs):
+        own_time, cum_time = stats.stats[func][2], stats.stats[func][3]
+        stack = stack + [get_func_label(func)]
+        stacks[';'.join(stack)] += scale * own_time
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+
+        for callee, callee_time in callees[func].items():
+            callee_cum_time = stats.stats[callee][3]
+            # Note: recursive calls are already counted in the cumulative time of the first call
+            if (callee in stack_funcs) or (callee_cum_time <= 0) or (scale * callee_time < MIN_STACK_TIME):
+                continue
+            add_stack(callee, scale * callee_time / callee_cum_time, stack, stack_funcs | {callee})
+
+    root_funcs = [func for func, func_stats in stats.stats.items() if len(func_stats[4]) == 0]
+    for func in root_funcs:
+        add_stack(func, 1, [], {func})
+
+    return stacks
+
+
+def write_profile(name, start_time, wall_time, profilers):
+    '''
+    Writes a profile as '<time>_<callback>_<wall time>ms.pstats' (see 'pstats.Stats'), and the same name with '.collapsed'.
+    '''
+    try:
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+
+        os.makedirs(PROFILE_DIR, exist_ok = True)
+        file_name = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(start_time))}_{name.strip("_")}_{round(1000 * wall_time)}ms'
+        stats.dump_stats(os.path.join(PROFILE_DIR, file_name + '.pstats'))
+
+        with open(os.path.join(PROFILE_DIR, file_name + '.collapsed'), 'w') as collapsed_file:
+            for stack, stack_time in get_collapsed_stacks(stats).items():
+                # Note: stack times are written in microseconds
+                if round(1e6 * stack_time) > 0:
+                    collapsed_file.write(f'{stack} {round(1e6 * stack_time)}\n')
+
+    except Exception:
+        logger.exception('Failed to write the profile of %s', name)
@@ -0,0 +1,160 @@
+################################################
+# Packages
+################################################
+import os
+import json
+import time
+import logging
+
+import numpy as np
+import panel as pn
+
+
+################################################
+# Interaction Recording
+################################################
+# Note: recording is off by default. It's turned on with the 'BAGLE_RECORD_DIR' environment variable
+    # (e.g. 'BAGLE_RECORD_DIR=recordings panel serve app.py'), and every session is then recorded to its own file in that directory.
+    # Recordings are interaction scripts (see 'benchmarks.scripts' for the format), so they can be replayed
+    # headlessly with 'benchmarks.replay', or over the websocket protocol with 'benchmarks.load'.
+RECORD_DIR = os.environ.get('BAGLE_RECORD_DIR', '')
+
+logger = logging.getLogger(__name__)
+
+
+def get_widgets(app):
+    '''
+    Returns a list of (step kind, step name, widget) for every widget of an app instance whose changes are recorded.
+    Slider steps also cover their releases (i.e. 'release' steps), and checkbox groups have no name (see 'benchmarks.scripts').
+    Note: the figure color pickers have no visible name or id, so their step names are their figure color keys.
+        The trace color pickers are named by their ids (see 'color_panel.ColorPanel.make_trace_clrs_layout').
+    '''
+    mod_row, settings_tabs, color_panel = app.mod_row, app.dashboard.settings_tabs, app.dashboard.color_panel
+
+    selects = [mod_row.srclens_type, mod_row.data_type, mod_row.par_type, mod_row.gp_type, color_panel.theme_dropdown]
+    widgets = [('select', select.name, select) for select in selects]
+    widgets += [('click', paramztn, btn) for paramztn, btn in app.paramztn_row.paramztn_btns.items()]
+    widgets += [('slider', slider.name, slider) for slider in settings_tabs.param_sliders.values()]
+    widgets += [('checkbox', '', checkbox) for checkbox in settings_tabs.all_checkboxes]
+    widgets += [('edit', table.name, table) for table in settings_tabs.all_tables]
+
+    # Note: the color pickers are only made when the color panel is first opened
+    if color_panel.clr_pickers_made == True:
+        widgets += [('color', fig_key, clr_picker) for fig_key, clr_picker in color_panel.fig_clr_pickers.items()]
+        for trace_clr_pickers in color_panel.trace_clr_pickers.values():
+            if 'clr_cycle' in trace_clr_pickers:
+                clr_pickers = trace_clr_pickers['clr_cycle']
+            else:
+                clr_pickers = list(trace_clr_pickers.values())
+            widgets += [('color', clr_picker.description, clr_picker) for clr_picker in clr_pickers]
+
+    return widgets
+
+
+def to_json_value(value):
+    # Note: table cells are numpy scalars
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class SessionRecorder:
+    '''
+    Records the widget changes made in the browser of one session as an interaction script, written to 'path' one step at a time.
+
+    Note: only changes made in the browser are recorded (i.e. not changes made by the app, like the sliders set by a parameterization change).
+        Panel applies the browser's changes while their parameters are syncing, and button clicks and table edits only come from the browser.
+    Note: widgets are watched when the recorder is made, and new widgets (e.g. the sliders of a new parameterization) after every recorded step.
+    '''
+
+    def __init__(self, app, path):
+        self.app = app
+        self.path = path
+        self.record_file = None
+        self.closed = False
+        self.last_step_time = time.perf_counter()
+
+        # IDs of the widgets that are already watched
+        self.watched_ids = set()
+        self.watch_widgets()
+
+    def watch_widgets(self):
+        for kind, name, widget in get_widgets(self.app):
+            if id(widget) in self.watched_ids:
+                continue
+            self.watched_ids.add(id(widget))
+
+            if kind == 'click':
+                widget.param.watch(self.record_click, 'clicks')
+            elif kind == 'slider':
+                widget.param.watch(self.record_slider, ['value', 'value_throttled'])
+            elif kind == 'edit':
+                widget.on_edit(lambda event, table = widget: self.record_edit(table, event))
+            else:
+                widget.param.watch(lambda event, kind = kind, name = name: self.record_change(kind, name, event), 'value')
+
+    def write_step(self, kind, name, value, **step_info):
+        if self.closed == True:
+            return
+
+        # Note: the file is only made at the first step, so that sessions without changes (e.g. health checks) don't leave empty files
+        if self.record_file == None:
+            self.record_file = open(self.path, 'w')
+
+        step_time = time.perf_counter()
+        step = {'wait': round(step_time - self.last_step_time, 3), 'kind': kind, 'name': name, 'value': value, **step_info}
+        self.last_step_time = step_time
+
+        self.record_file.write(json.dumps(step, separators = (',', ':')) + '\n')
+        self.record_file.flush()
+        self.watch_widgets()
+
+    def record_click(self, event):
+        self.write_step('click', event.obj.name, None)
+
+    def record_slider(self, event):
+        if event.name not in event.obj._param__private.syncing:
+            return
+
+        if event.name == 'value':
+            self.write_step('slider', event.obj.name, event.new)
+        else:
+            self.write_step('release', event.obj.name, None)
+
+    def record_change(self, kind, name, event):
+        if event.name not in event.obj._param__private.syncing:
+            return
+
+        widget = event.obj
+        if kind == 'select':
+            self.write_step(kind, name, widget.labels[widget.values.index(event.new)])
+        elif kind == 'checkbox':
+            checked_labels = [label for label, value in zip(widget.labels, widget.values) if value in event.new]
+            self.write_step(kind, name, checked_labels, options = widget.labels)
+        else:
+            self.write_step(kind, name, event.new)
+
+    def record_edit(self, table, event):
+        self.write_step('edit', table.name, to_json_value(event.value), row = table.value.index[event.row], column = event.column)
+
+    def close(self, *session_context):
+        self.closed = True
+        if self.record_file != None:
+            self.record_file.close()
+
+
+def record_session(app):
+    '''
+    Records the current session's widget changes, if recording is turned on (see 'RECORD_DIR').
+    Note: nothing is done without a server session.
+    '''
+    doc = pn.state.curdoc
+    if (RECORD_DIR == '') or (doc == None) or (doc.session_context == None):
+        return
+
+    os.makedirs(RECORD_DIR, exist_ok = True)
+    path = os.path.join(RECORD_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}_{doc.session_context.id[:8]}.jsonl')
+    logger.info('Recording session %s to %s', doc.session_context.id, path)
+
+    session_recorder = SessionRecorder(app, path)
+    pn.state.on_session_destroyed(session_recorder.close)
@@ -0,0 +1,154 @@
+################################################
+# Packages
+################################################
+import time
+
+from tornado.web import RequestHandler
+from bokeh.server.urls import toplevel_patterns
+
+from app_utils import metrics, updates, catalog, client_latency
+from app_components import plots
+
+
+################################################
+# Metrics Route (Prometheus)
+################################################
+# Note: the route is added to the Bokeh server by 'server_setup.py' (i.e. 'panel serve app.py --setup server_setup.py')
+METRICS_ROUTE = r'/metrics'
+
+# Dictionary of pool name to the thread pools used by all sessions of the server process
+    # Note: 'AST_PLOT_POOL' is only in 'plots', because it's only used to build astrometry figures
+WORKER_POOLS = {
+    'model_eval': updates.MODEL_POOL,
+    'prefetch': updates.PREFETCH_POOL,
+    'ast_plot': plots.AST_PLOT_POOL
+}
+
+PROCESS_START_TIME = time.time()
+
+
+def get_label_str(labels):
+    '''
+    Returns the Prometheus label string of a dictionary (or pairs) of labels (e.g. '{stage="model"}').
+    '''
+    if len(labels) == 0:
+        return ''
+
+    label_strs = []
+    for label_name, label_val in dict(labels).items():
+        label_val = str(label_val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        label_strs.append(f'{label_name}="{label_val}"')
+    return '{' + ','.join(label_strs) + '}'
+
+
+def get_histogram_lines(metric_name, histogram, labels):
+    histogram_lines = []
+    cumulative_count = 0
+    for bucket_bound, bucket_count in zip(list(metrics.HISTOGRAM_BUCKETS) + ['+Inf'], histogram.bucket_counts):
+        cumulative_count += bucket_count
+        histogram_lines.append(f'{metric_name}_bucket{get_label_str({**labels, "le": bucket_bound})} {cumulative_count}')
+
+    histogram_lines.append(f'{metric_name}_sum{get_label_str(labels)} {histogram.total}')
+    histogram_lines.append(f'{metric_name}_count{get_label_str(labels)} {histogram.count}')
+    return histogram_lines
+
+
+def get_cache_totals():
+    '''
+    Returns a dictionary of cache name to [number of entries, estimated bytes], summed over all live sessions.
+    Note: 'paramztn_info' is the parameterization catalog, which is shared by all sessions (see 'app_utils.catalog').
+    '''
+    cache_totals = {'paramztn_info': [len(catalog.PARAMZTN_INFO), metrics.estimate_bytes(list(catalog.PARAMZTN_INFO.values()))]}
+    for start_time, app, session_context in list(metrics.SESSIONS.values()):
+        for cache_name, (num_entries, num_bytes) in app.dashboard.get_cache_info().items():
+            cache_totals.setdefault(cache_name, [0, 0])
+            cache_totals[cache_name][0] += num_entries
+            cache_totals[cache_name][1] += num_bytes
+
+    return cache_totals
+
+
+def get_prometheus_text():
+    '''
+    Returns all metrics of the server process in the Prometheus text format.
+    Note: latency histograms, counters, and update rates are only recorded if metrics are enabled (see 'app_utils.metrics').
+    '''
+    lines = []
+
+    def add_metric(metric_name, metric_type, help_str, samples):
+        lines.append(f'# HELP {metric_name} {help_str}')
+        lines.append(f'# TYPE {metric_name} {metric_type}')
+        for labels, value in samples:
+            lines.append(f'{metric_name}{get_label_str(labels)} {value}')
+
+    # Process and sessions
+    add_metric('bagle_process_start_time_seconds', 'gauge', 'Start time of the server process (Unix time).', [({}, PROCESS_START_TIME)])
+    add_metric('bagle_metrics_enabled', 'gauge', 'Whether update metrics are recorded (BAGLE_METRICS).', [({}, int(metrics.ENABLED))])
+    add_metric('bagle_active_sessions', 'gauge', 'Number of live sessions.', [({}, len(metrics.SESSIONS))])
+
+    # Updates
+    update_counts = [({}, val) for (counter_name, labels), val in list(metrics.COUNTERS.items()) if counter_name == 'updates']
+    add_metric('bagle_updates_total', 'counter', 'Number of dashboard updates (scheduler flushes).', update_counts or [({}, 0)])
+    add_metric('bagle_updates_per_second', 'gauge', 'Dashboard updates per second over the last minute.', [({}, metrics.get_update_rate())])
+
+    # Stage latencies
+    lines.append('# HELP bagle_stage_seconds Time spent in each stage of the dashboard updates.')
+    lines.append('# TYPE bagle_stage_seconds histogram')
+    for stage, histogram in sorted(metrics.get_stage_histograms().items()):
+        lines += get_histogram_lines('bagle_stage_seconds', histogram, {'stage': stage})
+
+    # Client-observed latency per plot (see 'app_utils.client_latency')
+    lines.append('# HELP bagle_input_to_pixel_seconds Time from the start of an update to the browser drawing it, for each plot.')
+    lines.append('# TYPE bagle_input_to_pixel_seconds histogram')
+    for plot_name, histogram in sorted(list(client_latency.PLOT_HISTOGRAMS.items())):
+        lines += get_histogram_lines('bagle_input_to_pixel_seconds', histogram, {'plot': plot_name})
+
+    num_slow_clients = sum(app.dashboard.settings_tabs.slow_client for start_time, app, session_context in list(metrics.SESSIONS.values()))
+    add_metric('bagle_slow_client_sessions', 'gauge', 'Number of live sessions whose sliders are throttled for a slow browser.',
+               [({}, num_slow_clients)])
+
+    # Compute time per parameterization (i.e. trace updates)
+    paramztn_samples = {'seconds': [], 'count': []}
+    for (stage, paramztn), histogram in sorted(list(metrics.STAGE_HISTOGRAMS.items()), key = lambda item: str(item[0])):
+        if (stage == 'traces') and (paramztn != None):
+            paramztn_samples['seconds'].append(({'paramztn': paramztn}, histogram.total))
+            paramztn_samples['count'].append(({'paramztn': paramztn}, histogram.count))
+
+    add_metric('bagle_paramztn_compute_seconds_total', 'counter', 'Time spent updating traces for each parameterization.',
+               paramztn_samples['seconds'])
+    add_metric('bagle_paramztn_computes_total', 'counter', 'Number of trace updates for each parameterization.',
+               paramztn_samples['count'])
+
+    # Caches
+    cache_requests = [(labels, val) for (counter_name, labels), val in sorted(list(metrics.COUNTERS.items()))
+                      if counter_name == 'cache_requests']
+    add_metric('bagle_cache_requests_total', 'counter', 'Number of cache lookups by cache and result (hit/miss).', cache_requests)
+
+    cache_totals = get_cache_totals()
+    add_metric('bagle_cache_entries', 'gauge', 'Number of cache entries (summed over sessions).',
+               [({'cache': cache_name}, totals[0]) for cache_name, totals in cache_totals.items()])
+    add_metric('bagle_cache_bytes', 'gauge', 'Estimated cache memory in bytes (summed over sessions).',
+               [({'cache': cache_name}, totals[1]) for cache_name, totals in cache_totals.items()])
+
+    # Worker pools
+        # Note: the queue of a ThreadPoolExecutor isn't public, so its size is read from '_work_queue'
+    add_metric('bagle_pool_queue_depth', 'gauge', 'Number of tasks waiting in each worker pool.',
+               [({'pool': pool_name}, pool._work_queue.qsize()) for pool_name, pool in WORKER_POOLS.items()])
+    add_metric('bagle_pool_threads', 'gauge', 'Number of started threads in each worker pool.',
+               [({'pool': pool_name}, len(pool._threads)) for pool_name, pool in WORKER_POOLS.items()])
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(get_prometheus_text())
+
+
+def add_metrics_route():
+    '''
+    Adds the metrics route to the routes of any Bokeh server that is made afterwards (i.e. this needs to be called before the server starts).
+    '''
+    if all(pattern[0] != METRICS_ROUTE for pattern in toplevel_patterns):
+        toplevel_patterns.append((METRICS_ROUTE, MetricsHandler))
@@ -3,17 +3,22 @@
 ################################################
 import numpy as np
 import itertools
-import plotly.graph_objects as go
+import copy
+import functools
+import collections
+from time import thread_time
 import panel as pn
 import param
 import threading
 
-from bagle import model
-import celerite
-
-from app_utils import styles
+from app_utils import styles, updates, lazy_imports, metrics
 from app_components import paramztn_select, settings_tabs
 
+# Note: these are only imported when first used (see 'app_utils.lazy_imports')
+go = lazy_imports.lazy_import('plotly.graph_objects', warmup_attrs = ['Figure', 'Scatter', 'Scattergl'])
+model = lazy_imports.lazy_import('bagle.model')
+celerite = lazy_imports.lazy_import('celerite')
+
 
 ################################################
 # Limit Trace (For all Plots)
@@ -35,6 +40,70 @@ def add_limit_trace(fig, x_limits, y_limits):
     )
 
 
+################################################
+# Trace Helpers
+################################################
+# Attributes that are set by '_update_trace' of the (non-GP) trace classes. These are the only parts of a trace stored in a trace state.
+TRACE_DATA_ATTRS = ['phot', 'plot_data', 'num_imgs', 'num_lens']
+
+
+def get_gp_mag_err(mag_obs):
+    '''
+    Returns fake magnitude errors of the GP prior photometry (mimicking OGLE photon noise)
+    '''
+    flux0 = 4000.0
+    mag0 = 19.0
+    flux_obs = flux0 * 10 ** ((mag_obs - mag0) / -2.5)
+    flux_obs_err = flux_obs ** 0.5
+    return 1.087 / flux_obs_err
+
+
+def get_gp_kernel(mod_param_values, selected_params, mag_obs_err):
+    '''
+    Returns the celerite kernel (Matern-3/2 + DDSHO + jitter) of a GP parameterization.
+    mag_obs_err: the magnitude errors from 'get_gp_mag_err'. These are only used if the parameterization has no jitter parameter.
+    '''
+    # Matern-3/2 parameters
+    log_sig = mod_param_values['gp_log_sigma']
+
+    if 'gp_rho' in selected_params:
+        log_rho = np.log(mod_param_values['gp_rho'])
+    elif 'gp_log_rho' in selected_params:
+        log_rho = mod_param_values['gp_log_rho']
+
+    # DDSHO parameters
+    log_Q = np.log(2**-0.5)
+    log_omega0 = mod_param_values['gp_log_omega0']
+
+    if 'gp_log_S0' in selected_params:
+        log_S0 = mod_param_values['gp_log_S0']
+    elif 'gp_log_omega04_S0' in selected_params:
+        log_S0 = mod_param_values['gp_log_omega04_S0'] - (4 * log_omega0)    
+    elif 'gp_log_omega0_S0' in selected_params:
+        log_S0 = mod_param_values['gp_log_omega0_S0'] - log_omega0
+
+    # Jitter term parameters
+    if 'gp_log_jit_sigma' in selected_params:
+        log_jit_sigma = mod_param_values['gp_log_jit_sigma']
+    else: 
+        log_jit_sigma = np.log(np.average(mag_obs_err))
+        
+    m32 = celerite.terms.Matern32Term(log_sig, log_rho)
+    sho = celerite.terms.SHOTerm(log_S0, log_Q, log_omega0)
+    jitter = celerite.terms.JitterTerm(log_jit_sigma)
+    return m32 + sho + jitter
+
+
+def get_time_array(start, end, num_pts, time_value):
+    time = np.linspace(start = start, stop = end, num = num_pts)
+        
+    # Check if 'Time slider' value is in time
+    if time_value not in time:
+        time = np.sort(np.append(time, time_value))
+
+    return time
+
+
 ################################################
 # All Traces
 ################################################
@@ -42,6 +111,7 @@ def add_limit_trace(fig, x_limits, y_limits):
 class AllTraceInfo(param.Parameterized):
     paramztn_info = param.ClassSelector(class_ = paramztn_select.ParamztnSelect)
     settings_info = param.ClassSelector(class_ = settings_tabs.SettingsTabs)
+    scheduler = param.ClassSelector(class_ = updates.UpdateScheduler)
 
     # Lists for the set of photometry plots and set of astrometry plots selected in plot checkbox
     selected_phot_plots, selected_ast_plots = param.List(), param.List()
@@ -50,14 +120,33 @@ class AllTraceInfo(param.Parameterized):
     main_phot_keys, extra_phot_keys = param.List(default = []), param.List(default = [])
     main_ast_keys, extra_ast_keys = param.List(default = []), param.List(default = [])
 
+    # Trace state cache and prefetching settings
+        # Note: the number of cached states is also limited by the total number of time points, so that memory is bounded for large 'Num_pts'
+        # The prefetch budget is the CPU time (in seconds) that can be spent on prefetching after each parameter change
+    STATE_CACHE_SIZE = 24
+    STATE_CACHE_POINTS = 60000
+    PREFETCH_STEPS = 5
+    PREFETCH_BUDGET = 0.5
+
 
     def __init__(self, **params):
         super().__init__(**params)
         
         # A dictionary to store objects (e.g. model, time, gp) and data that may be shared across multiple traces.
         # The purpose of this dictionary is to make it so that we don't have to repetatively call the same functions.
+            # Note: the cache also has the parameterization that the model was made for ('paramztn'), which the traces read
+            # instead of 'paramztn_info', since they are computed in pool threads while the selected parameterization can change
         self.cache = {}
 
+        # A dictionary of previously computed (or prefetched) trace states, keyed by everything that affects the traces
+            # Note: the lock is needed because states are read and stored from both the model and prefetching pools
+        self.state_cache = collections.OrderedDict()
+        self._state_lock = threading.Lock()
+
+        # Note: the prefetch generation is bumped by every parameter change (see '_schedule_prefetch') and parameterization change,
+            # so that prefetched states of older inputs aren't stored (see 'store_state')
+        self._prefetch_generation = 0
+
         # Defining traces
         # Note: Make sure the 'trace_key' of the trace matches the dictionary key. This is important for recoloring traces.
         self.phot_traces = {
@@ -222,10 +311,25 @@ class AllTraceInfo(param.Parameterized):
         }
 
         # Set dependencies
+        # Note: the main astrometry traces need to be updated before the extra astrometry traces (e.g. for the binary-lens arrays in cache)
         self.param.watch(self._update_main_phot_traces, 'selected_phot_plots')
         self.param.watch(self._update_main_ast_traces, 'selected_ast_plots', precedence = 0)
         self.param.watch(self._update_extra_ast_traces, 'selected_ast_plots', precedence = 1)
-        self.settings_info.param_sliders['Num_samps'].param.watch(self._update_gp_samps, 'value', precedence = 0)
+
+        self.scheduler.register('selected_plots', self._update_selected_plots, after = ['layout'])
+        self.scheduler.register('extra_ast_traces', self._update_extra_ast_traces, after = ['selected_plots'])
+        self.scheduler.register('gp_samps', self._update_gp_samps, after = ['selected_plots'])
+
+        self.scheduler.subscribe(self.settings_info.dashboard_checkbox, 'value', ['selected_plots'])
+        self.scheduler.subscribe(self.settings_info.ast_checkbox, 'value', ['extra_ast_traces'])
+        self.scheduler.subscribe(self.settings_info.param_sliders['Num_samps'], 'value', ['gp_samps'])
+
+        # Note: prefetching is started after every other task, so that it only uses idle time
+        self.scheduler.register('prefetch', self._schedule_prefetch, after = ['all_plots', 'summary', 'code'])
+        self.scheduler.subscribe(self.settings_info, 'trigger_param_change', ['prefetch'])
+
+        # Note: this isn't a scheduler task, since prefetching has to stop right away, and not after the plots of the new parameterization
+        self.paramztn_info.param.watch(self._stop_prefetch, 'selected_paramztn')
 
 
     def get_trace_types(self):
@@ -254,34 +358,290 @@ class AllTraceInfo(param.Parameterized):
                 setattr(trace, clr_key, theme_dict[trace_key][clr_key])
 
 
-    @pn.depends('settings_info.dashboard_checkbox.value', watch = True)
+    def get_trace_snapshot(self, trace_keys):
+        '''
+        Returns shallow copies of the selected traces. 
+        Note: '_update_trace' and color changes replace the attributes of astrometry traces (e.g. plot_data, pri_clr) instead of changing them in place,
+            so a shallow copy is enough to keep the snapshot unchanged while figures are being built.
+        '''
+        return {trace_key: copy.copy(self.all_traces[trace_key]) for trace_key in trace_keys}
+
+
     def _update_selected_plots(self):
         self.selected_phot_plots = [name for name in styles.PHOT_PLOT_NAMES if name in self.settings_info.dashboard_checkbox.value]
         self.selected_ast_plots = [name for name in styles.AST_PLOT_NAMES if name in self.settings_info.dashboard_checkbox.value]
 
 
-    def update_all_traces(self):
-        time = np.linspace(start = self.settings_info.param_sliders['Time'].start, 
-                           stop = self.settings_info.param_sliders['Time'].end, 
-                           num = self.settings_info.param_sliders['Num_pts'].value)
-        
-        # Check if 'Time slider' value is in time
-        time_value = self.settings_info.param_sliders['Time'].value
-        if time_value not in time:
-            time = np.sort(np.append(time, time_value))
-        
+    @metrics.timed_update('traces')
+    def update_all_traces(self, trace_inputs):
+        '''
+        Updates all selected traces from 'trace_inputs' (see 'get_trace_inputs').
+        Note: this is run in the model pool, so the inputs are read on the event loop before this is called (see 'updates.run_in_executor').
+            The widgets can change while this runs, so nothing here should read them.
+        '''
+
+        # Check if the traces were already computed (or prefetched)
+            # Note: GP traces aren't cached, since they are random samples that should be redrawn on every update
+        if 'GP' not in trace_inputs['paramztn']:
+            state_key = self.get_state_key(trace_inputs)
+            state = self.get_cached_state(state_key)
+            metrics.count_cache('trace_state', state != None)
+
+            # Note: the state is computed from 'trace_inputs' alone (like prefetching) before it's applied,
+                # so that a stored state only has traces computed for its key (e.g. not traces left over from an earlier checkbox change)
+            if state == None:
+                state = self.compute_trace_state(trace_inputs, timed = True)
+                self.store_state(state_key, state)
+
+            self.apply_trace_state(trace_inputs, state)
+            return
+
         # Update the model and time array in cache
-        self.cache['mod'] = getattr(model, self.paramztn_info.selected_paramztn)(**self.settings_info.mod_param_values)
-        self.cache['time'] = time
+            # Note: 'mod_key' is kept with the model so that other components can reuse the model (see 'get_shared_model')
+        with metrics.span('model'):
+            self.cache['mod'] = getattr(model, trace_inputs['paramztn'])(**trace_inputs['mod_param_values'])
+        self.cache['paramztn'] = trace_inputs['paramztn']
+        self.cache['mod_key'] = self.get_model_key(trace_inputs['paramztn'], trace_inputs['mod_param_values'])
+        self.cache['time'] = get_time_array(*trace_inputs['time'])
 
         # Update photometry
         # Note: there are currently no extra photometry traces from phot_checkbox
             # I'm including GP samples as a main trace here, despite its dependency on 'Num_samps'
-        self._update_main_phot_traces()
+        self.compute_main_phot_traces(trace_inputs)
 
         # Update astrometry
-        self._update_main_ast_traces()
-        self._update_extra_ast_traces()
+        self.compute_main_ast_traces(trace_inputs)
+        self.compute_extra_ast_traces(trace_inputs)
+
+
+    ########################
+    # Trace State Methods
+    ########################
+    def get_trace_inputs(self):
+        '''
+        Returns everything that the traces are computed from, so that they can be computed without reading the widgets (e.g. in another thread).
+        '''
+        time_slider = self.settings_info.param_sliders['Time']
+
+        phot_keys, main_ast_keys, extra_ast_keys = [], [], []
+        if len(self.selected_phot_plots) != 0:
+            phot_keys = ['non_gp']
+
+        if len(self.selected_ast_plots) != 0:
+            main_ast_keys = ['unres_len', 'unres_unlen']
+            for cb_key in self.settings_info.ast_checkbox.value:
+                extra_ast_keys += self.extra_ast_cb_map[cb_key]
+
+        trace_inputs = {
+            'paramztn': self.paramztn_info.selected_paramztn,
+            'mod_param_values': dict(self.settings_info.mod_param_values),
+            'time': (time_slider.start, time_slider.end, self.settings_info.param_sliders['Num_pts'].value, time_slider.value),
+            'phot_keys': phot_keys,
+            'main_ast_keys': main_ast_keys,
+            'extra_ast_keys': extra_ast_keys
+        }
+        return trace_inputs
+
+
+    def get_model_key(self, paramztn, mod_param_values):
+        # Note: values are rounded so that slider values with floating point errors (e.g. 0.1 + 0.2) still match
+        param_key = tuple(
+            (param_name, tuple(float(f'{val:.10g}') for val in np.ravel(mod_param_values[param_name])))
+            for param_name in sorted(mod_param_values.keys())
+        )
+        return (paramztn, param_key)
+
+
+    def get_state_key(self, trace_inputs):
+        mod_key = self.get_model_key(trace_inputs['paramztn'], trace_inputs['mod_param_values'])
+        trace_keys = tuple(trace_inputs['phot_keys'] + trace_inputs['main_ast_keys'] + trace_inputs['extra_ast_keys'])
+        return (mod_key, trace_inputs['time'], trace_keys)
+
+
+    def get_shared_model(self, mod_key):
+        '''
+        Returns the model made by the last trace update if it was made for 'mod_key' (see 'get_model_key'). Otherwise, returns None.
+        Note: the returned model should only be read, since it is shared with the displayed traces.
+        '''
+        if self.cache.get('mod_key') == mod_key:
+            return self.cache['mod']
+        return None
+
+
+    def compute_trace_state(self, trace_inputs, timed = False):
+        '''
+        Computes the traces for 'trace_inputs' without changing the displayed traces or cache.
+        The traces are computed on shallow copies that share a new cache, so the returned state can be applied later with 'apply_trace_state'.
+        timed: if True, the model and traces are timed as update stages (see 'app_utils.metrics'). Speculative computations (e.g. prefetching) aren't timed.
+        '''
+        def get_span(stage):
+            return metrics.span(stage) if timed == True else metrics.NULL_SPAN
+
+        # Note: 'mod_key' is kept with the model so that other components can reuse the model (see 'get_shared_model')
+        with get_span('model'):
+            state_cache = {'mod': getattr(model, trace_inputs['paramztn'])(**trace_inputs['mod_param_values'])}
+        state_cache['paramztn'] = trace_inputs['paramztn']
+        state_cache['mod_key'] = self.get_model_key(trace_inputs['paramztn'], trace_inputs['mod_param_values'])
+        state_cache['time'] = get_time_array(*trace_inputs['time'])
+
+        if ('BL' in trace_inputs['paramztn']) and (len(trace_inputs['main_ast_keys']) != 0):
+            with get_span('bl_arrays'):
+                state_cache['bl_image_arr'], state_cache['bl_amp_arr'] = state_cache['mod'].get_all_arrays(state_cache['time'])
+
+        trace_data = {}
+        for trace_key in (trace_inputs['phot_keys'] + trace_inputs['main_ast_keys'] + trace_inputs['extra_ast_keys']):
+            trace = copy.copy(self.all_traces[trace_key])
+            trace.cache = state_cache
+            with get_span('trace.' + trace_key):
+                trace._update_trace()
+            trace_data[trace_key] = {attr: val for attr, val in vars(trace).items() if attr in TRACE_DATA_ATTRS}
+
+        # These are only shared between companion traces while computing
+        for key in ['bs_res_unlen', 'bs_res_len']:
+            state_cache.pop(key, None)
+
+        return {'cache': state_cache, 'trace_data': trace_data}
+
+
+    def apply_trace_state(self, trace_inputs, state):
+        self.cache.clear()
+        self.cache.update(state['cache'])
+
+        for trace_key, data in state['trace_data'].items():
+            for attr, val in data.items():
+                setattr(self.all_traces[trace_key], attr, val)
+
+        # Update trace keys the same way as 'compute_main_phot_traces', 'compute_main_ast_traces', and 'compute_extra_ast_traces'
+        if len(trace_inputs['phot_keys']) != 0:
+            self.main_phot_keys = trace_inputs['phot_keys']
+        if len(trace_inputs['main_ast_keys']) != 0:
+            self.main_ast_keys = trace_inputs['main_ast_keys']
+            self.extra_ast_keys = trace_inputs['extra_ast_keys']
+
+
+    def get_cached_state(self, state_key):
+        with self._state_lock:
+            state = self.state_cache.get(state_key)
+            if state != None:
+                self.state_cache.move_to_end(state_key)
+            return state
+
+
+    def get_cache_info(self):
+        '''
+        Returns a dictionary of cache name to (number of entries, estimated bytes) for the caches of this dashboard.
+        '''
+        with self._state_lock:
+            states = list(self.state_cache.values())
+        return {'trace_state': (len(states), metrics.estimate_bytes(states))}
+
+
+    def clear_caches(self):
+        with self._state_lock:
+            self.state_cache.clear()
+
+
+    def get_max_states(self, num_pts):
+        return min(self.STATE_CACHE_SIZE, self.STATE_CACHE_POINTS // num_pts)
+
+
+    def store_state(self, state_key, state, generation = None):
+        '''
+        Stores a trace state under its key (see 'get_state_key').
+        generation: the prefetch generation of a prefetched state. The state is only stored if there was no parameter or parameterization change
+            since it was started (i.e. it's still the current generation), and its parameterization is still selected.
+        '''
+        max_states = self.get_max_states(len(state['cache']['time']))
+        with self._state_lock:
+            if (generation != None) and ((generation != self._prefetch_generation) or 
+                                         (state['cache']['paramztn'] != self.paramztn_info.selected_paramztn)):
+                return
+
+            if max_states == 0:
+                self.state_cache.clear()
+                return
+
+            self.state_cache[state_key] = state
+            self.state_cache.move_to_end(state_key)
+            while len(self.state_cache) > max_states:
+                self.state_cache.popitem(last = False)
+
+
+    ########################
+    # Prefetching Methods
+    ########################
+    def _stop_prefetch(self, *event):
+        with self._state_lock:
+            self._prefetch_generation += 1
+
+
+    def _schedule_prefetch(self):
+        '''
+        Prefetches the trace states at the neighbouring steps of the last changed parameter slider, so that the next small change is a cache hit.
+        '''
+        # Note: this also stops any prefetching for an older parameter change
+        self._stop_prefetch()
+
+        # Note: prefetching only happens in server sessions, because there is no idle time when the app is run by a script
+        doc = pn.state.curdoc
+        if (doc == None) or (doc.session_context == None):
+            return
+
+        param_name = self.settings_info.current_param_change
+        if (('GP' not in self.paramztn_info.selected_paramztn) and (param_name in self.paramztn_info.selected_params) and 
+            (self.settings_info.errored_state['params'].value == False) and 
+            (self.get_max_states(self.settings_info.param_sliders['Num_pts'].value) > 1)):
+            pn.state.execute(functools.partial(self._prefetch_neighbours, param_name, self._prefetch_generation))
+
+
+    async def _prefetch_neighbours(self, param_name, generation):
+        slider = self.settings_info.param_sliders[param_name]
+        base_inputs = self.get_trace_inputs()
+
+        # Neighbouring values in order of distance (i.e. +1 step, -1 step, +2 steps, ...)
+        neighbour_vals = []
+        for i in range(1, self.PREFETCH_STEPS + 1):
+            for sign in [1, -1]:
+                val = slider.value + (sign * i * slider.step)
+                if slider.start <= val <= slider.end:
+                    neighbour_vals.append(val)
+
+        cpu_time = 0
+        for val in neighbour_vals:
+            # Stop as soon as real work arrives or the budget is used up
+            if (generation != self._prefetch_generation) or self.scheduler.is_flushing() or (cpu_time >= self.PREFETCH_BUDGET):
+                return
+
+            mod_param_values = dict(base_inputs['mod_param_values'])
+            if param_name in self.paramztn_info.selected_phot_params:
+                mod_param_values[param_name] = np.array([val])
+            else:
+                mod_param_values[param_name] = val
+
+            trace_inputs = {**base_inputs, 'mod_param_values': mod_param_values}
+            state_key = self.get_state_key(trace_inputs)
+            if self.get_cached_state(state_key) != None:
+                continue
+
+            try:
+                state, state_cpu_time = await updates.run_in_executor(self._compute_timed_trace_state, trace_inputs, pool = updates.PREFETCH_POOL)
+            except:
+                # Note: bad parameter combinations are skipped. The error will be shown if the slider is actually moved there.
+                continue
+
+            cpu_time += state_cpu_time
+            self.store_state(state_key, state, generation = generation)
+
+
+    def update_trace(self, trace_key):
+        with metrics.span('trace.' + trace_key):
+            self.all_traces[trace_key]._update_trace()
+
+
+    def _compute_timed_trace_state(self, trace_inputs):
+        start_time = thread_time()
+        state = self.compute_trace_state(trace_inputs)
+        return state, thread_time() - start_time
 
 
     ########################
@@ -297,73 +657,47 @@ class AllTraceInfo(param.Parameterized):
             if (event != ()) and (len(event[0].old) != 0):
                 return
             else:
-                # Check for GP
-                if 'GP' not in self.paramztn_info.selected_paramztn:
-                    # Reset phot keys
-                    self.main_phot_keys = ['non_gp']
-                else:
-                    selected_params = self.paramztn_info.selected_params
-                    mod_param_values = self.settings_info.mod_param_values
-
-                    cel_mod = model.Celerite_GP_Model(self.cache['mod'], 0)
-                        
-                    # Matern-3/2 parameters
-                    log_sig = mod_param_values['gp_log_sigma']
-
-                    if 'gp_rho' in selected_params:
-                        log_rho = np.log(mod_param_values['gp_rho'])
-                    elif 'gp_log_rho' in selected_params:
-                        log_rho = mod_param_values['gp_log_rho']
-
-                    # DDSHO parameters
-                    log_Q = np.log(2**-0.5)
-                    log_omega0 = mod_param_values['gp_log_omega0']
-
-                    if 'gp_log_S0' in selected_params:
-                        log_S0 = mod_param_values['gp_log_S0']
-                    elif 'gp_log_omega04_S0' in selected_params:
-                        log_S0 = mod_param_values['gp_log_omega04_S0'] - (4 * log_omega0)    
-                    elif 'gp_log_omega0_S0' in selected_params:
-                        log_S0 = mod_param_values['gp_log_omega0_S0'] - log_omega0
-
-                    # Make fake errors (mimicking OGLE photon noise)
-                    flux0 = 4000.0
-                    mag0 = 19.0
-                    mag_obs = cel_mod.get_value(self.cache['time'])
-
-                    flux_obs = flux0 * 10 ** ((mag_obs - mag0) / -2.5)
-                    flux_obs_err = flux_obs ** 0.5
-                    mag_obs_err = 1.087 / flux_obs_err
-
-                    # Jitter term parameters
-                    if 'gp_log_jit_sigma' in selected_params:
-                        log_jit_sigma = mod_param_values['gp_log_jit_sigma']
-                    else: 
-                        log_jit_sigma = np.log(np.average(mag_obs_err))
-                        
-                    # Make GP model
-                    m32 = celerite.terms.Matern32Term(log_sig, log_rho)
-                    sho = celerite.terms.SHOTerm(log_S0, log_Q, log_omega0)
-                    jitter = celerite.terms.JitterTerm(log_jit_sigma)
-                    kernel = m32 + sho + jitter
-
-                    gp = celerite.GP(kernel, mean = cel_mod, fit_mean = True)
-                    gp.compute(self.cache['time'], mag_obs_err)
-
-                    # Update the GP object in cache
-                    self.cache['gp'] = gp
-
-                    # Change phot of 'gp_prior' traces. This is done so that we don't have to call 'get_photometry' twice
-                    self.phot_traces['gp_prior'].phot = mag_obs
-
-                    # Reset phot keys
-                    self.main_phot_keys = ['gp_prior', 'gp_predict', 'gp_samps']
-
-            # Update relevant phot traces
-                # Note the 'gp_prior' is excluded because we would have already updated it's photometry
-            for trace_key in set(self.main_phot_keys) - {'gp_prior'}:
-                trace_thread = threading.Thread(self.all_traces[trace_key]._update_trace())
-                trace_thread.start()
+                self.compute_main_phot_traces(self.get_trace_inputs())
+
+
+    def compute_main_phot_traces(self, trace_inputs):
+        '''
+        Updates the main photometry traces from 'trace_inputs' (see 'get_trace_inputs'). This doesn't read any widgets, so it may be run in a pool thread.
+        '''
+        if len(trace_inputs['phot_keys']) == 0:
+            return
+
+        # Check for GP
+        if 'GP' not in trace_inputs['paramztn']:
+            # Reset phot keys
+            self.main_phot_keys = ['non_gp']
+        else:
+            cel_mod = model.Celerite_GP_Model(self.cache['mod'], 0)
+            with metrics.span('gp_prior'):
+                mag_obs = cel_mod.get_value(self.cache['time'])
+
+            # Make GP model
+                # Note: the model parameter values only have the selected parameters, so their keys are the selected parameters
+            mag_obs_err = get_gp_mag_err(mag_obs)
+            kernel = get_gp_kernel(trace_inputs['mod_param_values'], list(trace_inputs['mod_param_values'].keys()), mag_obs_err)
+            gp = celerite.GP(kernel, mean = cel_mod, fit_mean = True)
+            with metrics.span('gp_compute'):
+                gp.compute(self.cache['time'], mag_obs_err)
+
+            # Update the GP object in cache
+            self.cache['gp'] = gp
+
+            # Change phot of 'gp_prior' traces. This is done so that we don't have to call 'get_photometry' twice
+            self.phot_traces['gp_prior'].phot = mag_obs
+
+            # Reset phot keys
+            self.main_phot_keys = ['gp_prior', 'gp_predict', 'gp_samps']
+
+        # Update relevant phot traces
+            # Note the 'gp_prior' is excluded because we would have already updated it's photometry
+        for trace_key in set(self.main_phot_keys) - {'gp_prior'}:
+            trace_thread = threading.Thread(self.update_trace(trace_key))
+            trace_thread.start()
             
 
     def _update_gp_samps(self, *event):
@@ -376,7 +710,7 @@ class AllTraceInfo(param.Parameterized):
         # Check if photometry is selected in dashboard
         # Check for locks. This is needed to guard against checkbox resets and slider resets
         if (len(self.selected_phot_plots) != 0) and (self.settings_info.lock_trigger == False):
-            self.all_traces['gp_samps']._update_trace()
+            self.update_trace('gp_samps')
 
 
     ########################
@@ -393,19 +727,28 @@ class AllTraceInfo(param.Parameterized):
             if (event != ()) and (len(event[0].old) != 0):
                 return
             else:
-                selected_paramztn = self.paramztn_info.selected_paramztn
-                if 'BL' in selected_paramztn:
-                    self.cache['bl_image_arr'], self.cache['bl_amp_arr'] = self.cache['mod'].get_all_arrays(self.cache['time'])
+                self.compute_main_ast_traces(self.get_trace_inputs())
+
+
+    def compute_main_ast_traces(self, trace_inputs):
+        '''
+        Updates the main astrometry traces from 'trace_inputs' (see 'get_trace_inputs'). This doesn't read any widgets, so it may be run in a pool thread.
+        '''
+        if len(trace_inputs['main_ast_keys']) == 0:
+            return
+
+        if 'BL' in trace_inputs['paramztn']:
+            with metrics.span('bl_arrays'):
+                self.cache['bl_image_arr'], self.cache['bl_amp_arr'] = self.cache['mod'].get_all_arrays(self.cache['time'])
 
-                self.main_ast_keys = ['unres_len', 'unres_unlen']
+        self.main_ast_keys = trace_inputs['main_ast_keys']
 
-                # Update relevant ast traces
-                for trace_key in self.main_ast_keys:
-                    trace_thread = threading.Thread(self.all_traces[trace_key]._update_trace())
-                    trace_thread.start()
+        # Update relevant ast traces
+        for trace_key in self.main_ast_keys:
+            trace_thread = threading.Thread(self.update_trace(trace_key))
+            trace_thread.start()
 
 
-    @pn.depends('settings_info.ast_checkbox.value', watch = True)
     def _update_extra_ast_traces(self, *event):
         # Check if astrometry is selected in dashboard
         # Check for locks. This is needed to guard against checkbox resets
@@ -415,20 +758,27 @@ class AllTraceInfo(param.Parameterized):
             if (event != ()) and (len(event[0].old) != 0):
                 return
             else:
-                extra_ast_keys = []
-                for cb_key in self.settings_info.ast_checkbox.value:
-                    extra_ast_keys += self.extra_ast_cb_map[cb_key]
-                
-                # Update relevant ast traces
-                for trace_key in extra_ast_keys:
-                    trace_thread = threading.Thread(self.all_traces[trace_key]._update_trace())
-                    trace_thread.start()
+                self.compute_extra_ast_traces(self.get_trace_inputs())
+
+
+    def compute_extra_ast_traces(self, trace_inputs):
+        '''
+        Updates the extra astrometry traces (from 'ast_checkbox') of 'trace_inputs' (see 'get_trace_inputs'). 
+        This doesn't read any widgets, so it may be run in a pool thread.
+        '''
+        if len(trace_inputs['main_ast_keys']) == 0:
+            return
+
+        # Update relevant ast traces
+        for trace_key in trace_inputs['extra_ast_keys']:
+            trace_thread = threading.Thread(self.update_trace(trace_key))
+            trace_thread.start()
 
-                self.extra_ast_keys = extra_ast_keys
+        self.extra_ast_keys = trace_inputs['extra_ast_keys']
 
-            # These need to be removed to have the traces properly updating when parameters change
-            for key in ['bs_res_unlen', 'bs_res_len']:
-                self.cache.pop(key, None)
+        # These need to be removed to have the traces properly updating when parameters change
+        for key in ['bs_res_unlen', 'bs_res_len']:
+            self.cache.pop(key, None)
 
 
 # Note: For all trace classes, '-update_trace' needs to be called before plotting
@@ -635,7 +985,7 @@ class Ast_Unres(param.Parameterized):
             ast = self.cache['mod'].get_astrometry_unlensed(self.cache['time'])
             
         else:
-            selected_paramztn = self.paramztn_info.selected_paramztn
+            selected_paramztn = self.cache['paramztn']
             if 'PL' in selected_paramztn:
                 ast = self.cache['mod'].get_astrometry(self.cache['time'])
             elif 'BL' in selected_paramztn:
@@ -741,7 +1091,7 @@ class Ast_PS_ResLensed(param.Parameterized):
         ra_list, dec_list = [], []
 
         # Check if point-lens (2 imgs) or binary-lens (5 imgs)
-        selected_paramztn = self.paramztn_info.selected_paramztn
+        selected_paramztn = self.cache['paramztn']
         if 'PL' in selected_paramztn:
             self.num_imgs = 2
             for i in range(2):
@@ -873,7 +1223,7 @@ class Ast_BS_ResLensed(Ast_PS_ResLensed):
         '''
         
         # Check if point-lens (2 imgs) or binary-lens (5 imgs)
-        selected_paramztn = self.paramztn_info.selected_paramztn
+        selected_paramztn = self.cache['paramztn']
         if 'PL' in selected_paramztn:
             self.num_imgs = 2
         elif 'BL' in selected_paramztn:
@@ -942,7 +1292,7 @@ class Ast_Lens(param.Parameterized):
         '''
 
         # Check for point-lens or binary-lens
-        selected_paramztn = self.paramztn_info.selected_paramztn
+        selected_paramztn = self.cache['paramztn']
 
         if 'PL' in selected_paramztn:
             ast = self.cache['mod'].get_lens_astrometry(self.cache['time'])
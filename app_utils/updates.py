@@ -0,0 +1,350 @@
+################################################
+# Packages
+################################################
+import os
+import time
+import asyncio
+import functools
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import panel as pn
+from panel.io.document import unlocked
+
+from app_utils import metrics, profiling
+
+
+################################################
+# Batched Document Updates
+################################################
+def hold_updates(function):
+    '''
+    Decorator for callbacks that start a logical user action (e.g. a slider move or a checkbox change).
+
+    All Bokeh model changes made while the callback runs (plots, summary, tables, code, etc.) are held on the
+    current document and sent to the browser as a single combined patch when the outermost held callback exits.
+    Note: panel's hold is re-entrant, so nested held callbacks will only be dispatched once by the outermost one.
+    Note: If there is no current document (e.g. when the app is built without a server), the callback runs as normal.
+    '''
+
+    @functools.wraps(function)
+    def held_function(*args, **kwargs):
+        with held_document():
+            return function(*args, **kwargs)
+
+    return held_function
+
+
+@contextmanager
+def held_document():
+    '''
+    Context manager version of 'hold_updates'.
+    Note: the outermost hold sends the held changes with panel's 'unlocked', which writes them straight to the session's websockets.
+        This is needed for async scheduler tasks (see 'UpdateScheduler'), since panel runs them without the document lock,
+        and Bokeh can only send the changes of a released hold while the lock is held.
+    Note: when metrics are enabled, the time taken by the outermost hold to send the held changes (i.e. Bokeh serialization) 
+        is recorded as the 'bokeh_dispatch' stage (see 'app_utils.metrics').
+    '''
+    doc = pn.state.curdoc
+    if (doc == None) or (doc.callbacks.hold_value != None):
+        with pn.io.hold(doc):
+            yield
+        return
+
+    # Note: the dispatch isn't timed with a span, so that spans made while the document is held aren't counted as part of the dispatch
+    with unlocked():
+        with pn.io.hold(doc):
+            yield
+            dispatch_start = time.perf_counter()
+
+    if metrics.ENABLED == True:
+        metrics.add_span('bokeh_dispatch', time.perf_counter() - dispatch_start)
+
+    forget_unsent_models(doc)
+
+
+def forget_unsent_models(doc):
+    '''
+    Removes the models that were removed from a document before they were ever sent from the document's new models.
+    Note: Bokeh keeps every model added to a document as new until a sent change refers to it. A model that is added and removed
+        in the same hold (e.g. a loading indicator that is replaced by its plot) is never sent, so it would be kept for the whole session.
+    '''
+    doc_models = doc.models
+    if any(model.document != doc for model in doc_models._new_models):
+        doc_models._new_models = {model for model in doc_models._new_models if model.document == doc}
+
+
+################################################
+# Model Evaluation Pool
+################################################
+# Note: this pool is shared by all sessions of the server process. Model evaluations (BAGLE/celerite) are run here so that 
+    # the server's event loop can keep handling websocket traffic for other sessions while a slow model is evaluated.
+MODEL_POOL = ThreadPoolExecutor(max_workers = min(4, os.cpu_count() or 1), thread_name_prefix = 'model_eval')
+
+# Note: speculative evaluations (e.g. prefetching) use their own single thread, so that they never delay evaluations in 'MODEL_POOL'
+PREFETCH_POOL = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'prefetch')
+
+
+async def run_in_executor(function, *args, pool = MODEL_POOL, **kwargs):
+    '''
+    Awaits 'function(*args, **kwargs)' run in the model evaluation pool (or the given pool).
+    Note: any arguments read from widgets should be read before calling this, so that the pool thread doesn't see later changes.
+    Note: the function is run in a copy of the current context, so that it keeps the current metric tags (see 'app_utils.metrics'),
+        and is added to the callback profiles of the current context (see 'app_utils.profiling')
+    '''
+    event_loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await event_loop.run_in_executor(pool, functools.partial(context.run, profiling.run_slice, function, *args, **kwargs))
+
+
+async def gather_futures(futures):
+    '''
+    Awaits a dictionary of name to future (e.g. figures submitted to a plotting pool) without blocking the event loop.
+    Returns a dictionary of name to result. The first error of any future is raised once all of them are done.
+    '''
+    results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures.values()), return_exceptions = True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+    return dict(zip(futures.keys(), results))
+
+
+################################################
+# Coalesced Table Patches
+################################################
+class TablePatcher:
+    '''
+    Collects cell changes of a Tabulator widget and sends them to the browser as a single 'patch'.
+
+    While a slider is dragged, changes are sent at most once per 'interval' (in milliseconds), with only the latest value of each cell.
+    Note: without a server session (or if 'interval' is None), changes are patched right away.
+    Note: cells of rows that were removed before the patch is sent (e.g. by a parameterization change) are skipped.
+    '''
+
+    def __init__(self, table, interval = None):
+        self.table = table
+        self.interval = interval
+        self.pending = {} # Dictionary of column name to a dictionary of row index to value
+        self.scheduled = False
+
+    def set_cells(self, column, values):
+        '''
+        Adds changed cells of a column, given as a dictionary of row index to value.
+        '''
+        self.pending.setdefault(column, {}).update(values)
+        doc = pn.state.curdoc
+
+        if (self.interval == None) or (doc == None) or (doc.session_context == None):
+            self.send()
+
+        elif self.scheduled == False:
+            self.scheduled = True
+            doc.add_timeout_callback(self.send, self.interval)
+
+    def clear(self):
+        # Note: used when the whole table value is replaced, so that older changes aren't patched over the new table
+        self.pending.clear()
+
+    def send(self):
+        self.scheduled = False
+
+        table_index = self.table.value.index
+        patches = {}
+        for column, values in self.pending.items():
+            column_patches = [(index, val) for index, val in values.items() if index in table_index]
+            if len(column_patches) != 0:
+                patches[column] = column_patches
+
+        self.pending.clear()
+        if len(patches) != 0:
+            self.table.patch(patches)
+
+
+################################################
+# Update Scheduler
+################################################
+class UpdateScheduler:
+    '''
+    A central invalidation layer for a single dashboard (i.e. a single session).
+
+    Components register their recompute/render functions as named tasks, along with the tasks that must run before them.
+    They then subscribe tasks to the parameters (sources) that make them stale (e.g. 'dashboard_checkbox.value').
+    When a source changes, its tasks are only marked as dirty. At the end of the source event, all dirty tasks are run 
+    once in dependency order. Tasks that are marked dirty while running other tasks are added to the same flush.
+
+    Note: a task can also 'cover' other tasks. If both are dirty, the covered tasks are dropped because the covering task already does their work
+        (e.g. updating all plots covers updating only the photometry plot).
+    Note: a task can also be a coroutine function (e.g. one that awaits a model evaluation in 'MODEL_POOL'). When one is reached, the rest
+        of the flush is scheduled on the event loop with 'pn.state.execute'. Source events that happen while the task is awaiting are
+        only marked dirty, and are run by the same flush once the task is done.
+    '''
+
+    # Precedence of source watchers. This makes sure that any direct watchers on a source (e.g. widget syncing) have already run.
+    SOURCE_PRECEDENCE = 100
+
+    def __init__(self):
+        self.tasks = {} # Dictionary of task name to function
+        self.task_deps = {} # Dictionary of task name to a list of task names that must run first (if they are dirty)
+        self.covered_by = {} # Dictionary of task name to a set of task names that cover it
+        self.subscriptions = {} # Dictionary of (source object id, parameter name) to a list of task names
+        self.dirty = set()
+
+        self._task_order = None
+        self._flushing = False
+        self._batch_depth = 0
+
+
+    def register(self, task_name, function, after = (), covers = ()):
+        '''
+        function: a function with no required arguments.
+        after: task names that must run before this task. Task names that are never registered are ignored.
+        covers: task names whose work is already done by this task.
+        '''
+        self.tasks[task_name] = function
+        self.task_deps[task_name] = list(after)
+        for covered_name in covers:
+            self.covered_by.setdefault(covered_name, set()).add(task_name)
+
+        # Reset the order so that it is recomputed with the new task
+        self._task_order = None
+
+
+    def subscribe(self, obj, parameter_name, task_names):
+        '''
+        Marks the tasks as dirty whenever 'obj.parameter_name' changes. 
+        Note: only one watcher is made per source, so that all tasks of the source are flushed together at the end of its event.
+        '''
+        source_key = (id(obj), parameter_name)
+        if source_key not in self.subscriptions:
+            self.subscriptions[source_key] = []
+            obj.param.watch(functools.partial(self._source_changed, source_key), parameter_name, precedence = self.SOURCE_PRECEDENCE)
+            
+        for task_name in task_names:
+            if task_name not in self.subscriptions[source_key]:
+                self.subscriptions[source_key].append(task_name)
+
+
+    def invalidate(self, *task_names):
+        '''
+        Marks tasks as dirty. They will be run by the current flush, or the flush at the end of the current source event.
+        '''
+        self.dirty.update(task_names)
+
+
+    def is_dirty(self, task_name):
+        return task_name in self.dirty
+
+
+    @contextmanager
+    def batch(self):
+        '''
+        Context manager to group several source changes into a single flush when the outermost batch exits.
+        '''
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+        self.flush()
+
+
+    def is_flushing(self):
+        return self._flushing
+
+
+    def flush(self):
+        # Note: nested flushes are not needed because the running flush picks up any newly dirty tasks
+        if (self._flushing == True) or (self._batch_depth != 0):
+            return
+
+        self._flushing = True
+        metrics.record_update()
+        try:
+            async_task_name = self._run_sync_tasks()
+
+        except:
+            # Drop the remaining tasks so that a failed update isn't repeated by the next unrelated source event
+            self.dirty.clear()
+            self._flushing = False
+            raise
+
+        if async_task_name != None:
+            # Note: '_flushing' stays on until the async flush is done
+            pn.state.execute(self._flush_async)
+        else:
+            self._flushing = False
+
+
+    def _run_sync_tasks(self):
+        '''
+        Runs dirty tasks in order under a single document hold, until there are no dirty tasks or the next task is a coroutine function.
+        Returns the name of the next coroutine task (or None).
+        '''
+        with held_document():
+            task_name = self._get_next_task()
+            while (task_name != None) and (asyncio.iscoroutinefunction(self.tasks[task_name]) == False):
+                self.dirty.discard(task_name)
+                self.tasks[task_name]()
+                task_name = self._get_next_task()
+
+        return task_name
+
+
+    async def _flush_async(self):
+        try:
+            # Note: sync tasks that were marked dirty before this was scheduled are run first
+            task_name = self._run_sync_tasks()
+            while task_name != None:
+                self.dirty.discard(task_name)
+                await self.tasks[task_name]()
+                task_name = self._run_sync_tasks()
+
+        except:
+            self.dirty.clear()
+            raise
+
+        finally:
+            self._flushing = False
+
+
+    def _source_changed(self, source_key, *event):
+        self.invalidate(*self.subscriptions[source_key])
+        self.flush()
+
+
+    def _get_next_task(self):
+        # Drop tasks that are unregistered or covered by another dirty task
+        for task_name in list(self.dirty):
+            if (task_name not in self.tasks) or (len(self.covered_by.get(task_name, set()) & self.dirty) != 0):
+                self.dirty.discard(task_name)
+
+        for task_name in self._get_task_order():
+            if task_name in self.dirty:
+                return task_name
+        return None
+
+
+    def _get_task_order(self):
+        '''
+        Orders tasks so that each task comes after the tasks it depends on. Otherwise, tasks are kept in registration order.
+        '''
+        if self._task_order == None:
+            task_order, ordered = [], set()
+            remaining = list(self.tasks.keys())
+            while len(remaining) != 0:
+                for task_name in remaining:
+                    deps = [dep for dep in self.task_deps[task_name] if (dep in self.tasks) and (dep not in ordered)]
+                    if len(deps) == 0:
+                        break
+                else:
+                    raise RuntimeError(f'Circular task dependency found between the tasks: {remaining}')
+
+                task_order.append(task_name)
+                ordered.add(task_name)
+                remaining.remove(task_name)
+
+            self._task_order = task_order
+
+        return self._task_order
@@ -0,0 +1,83 @@
+################################################
+# Packages
+################################################
+import os
+import logging
+from collections import deque
+
+from tornado.ioloop import IOLoop
+from panel.io.state import set_curdoc
+import panel as pn
+
+
+################################################
+# Warm Pool of App Instances
+################################################
+# Note: 'panel serve' runs 'app.py' for every new session, but imported modules (like this one) are only loaded once per server process.
+    # So the pool is kept here, and 'app.py' passes its app class every time it asks for an instance.
+
+# Number of pre-built app instances kept ready per server process. This is off (0) by default.
+    # Note: this can be set with the 'BAGLE_WARM_POOL_SIZE' environment variable (e.g. 'BAGLE_WARM_POOL_SIZE=4 panel serve app.py')
+POOL_SIZE = int(os.environ.get('BAGLE_WARM_POOL_SIZE', 0))
+
+# Time (in seconds) before a pre-built instance is made after a session is created, and between pre-built instances.
+    # Note: instances are built on the event loop one at a time, so this gives the new session time to send its page first.
+REFILL_DELAY = 1
+
+logger = logging.getLogger(__name__)
+
+
+class WarmPool:
+    '''
+    Keeps up to 'size' fully constructed app instances ready, so that a new session only has to render one.
+
+    Note: each instance is only ever handed to a single session. Instances are built outside of any session document,
+        since their Bokeh models are only made when the session renders them.
+    Note: without a server session (or if 'size' is 0), a new instance is made every time.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self.factory = None
+        self.instances = deque()
+        self.refill_handle = None
+
+    def get(self, factory):
+        '''
+        Returns a pre-built instance if there is one (otherwise a new one is made with 'factory'), then refills the pool.
+        Note: 'factory' is kept so that the pool is always refilled with the app class of the latest session.
+        '''
+        self.factory = factory
+        doc = pn.state.curdoc
+
+        if (self.size <= 0) or (doc == None) or (doc.session_context == None):
+            return factory()
+
+        if len(self.instances) != 0:
+            instance = self.instances.popleft()
+        else:
+            instance = factory()
+
+        self.schedule_refill()
+        return instance
+
+    def schedule_refill(self):
+        if (self.refill_handle == None) and (len(self.instances) < self.size):
+            self.refill_handle = IOLoop.current().call_later(REFILL_DELAY, self._refill)
+
+    def _refill(self):
+        self.refill_handle = None
+
+        # Note: the current document is cleared so that the instance isn't tied to the session that scheduled the refill
+        try:
+            with set_curdoc(None):
+                self.instances.append(self.factory())
+        except Exception:
+            logger.exception('Failed to pre-build an app instance for the warm pool')
+            return
+
+        self.schedule_refill()
+
+
+# Pool shared by all sessions of the server process
+APP_POOL = WarmPool(POOL_SIZE)
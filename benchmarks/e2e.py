@@ -0,0 +1,229 @@
+################################################
+# Packages
+################################################
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import traceback
+
+import numpy as np
+import panel as pn
+import bokeh
+
+from app_utils import constants, styles, metrics
+from benchmarks import headless
+
+
+################################################
+# End-to-end Latency Benchmark
+################################################
+# Note: run from the app directory with 'python -m benchmarks.e2e' (see '--help').
+    # Every parameterization is run in its own headless app session (see 'benchmarks.headless'), with the same interaction script.
+    # Each step of the script is timed on its own, and the report has one sample per step.
+
+# Number of parameters that are dragged, and the number of steps of each slider drag
+NUM_DRAG_PARAMS = 3
+NUM_DRAG_STEPS = 5
+
+# Number of steps taken back in time by the Time scrub
+NUM_SCRUB_STEPS = 5
+
+# Number of points set by the 'Num_pts' changes
+NUM_PTS_VALUES = [1000, 5000, 3000]
+
+# Plot themes set by the theme switches
+THEMES = {'light': styles.LIGHT_PLOT_THEME, 'dark': styles.DARK_PLOT_THEME}
+
+
+class Benchmark:
+    '''
+    Runs the interaction script on every parameterization, and collects a sample (wall time, allocation, and payload) for each step.
+    trace_alloc: if True, allocations are traced with tracemalloc. This makes the wall times longer, but the same for every run.
+    '''
+
+    def __init__(self, app_module, trace_alloc = True):
+        self.app_module = app_module
+        self.trace_alloc = trace_alloc
+        self.samples = []
+        self.failures = []
+
+    def measure(self, session, paramztn, action, function, *args):
+        session.get_payload()
+        if self.trace_alloc == True:
+            tracemalloc.reset_peak()
+            start_alloc = tracemalloc.get_traced_memory()[0]
+
+        start_time = time.perf_counter()
+        function(*args)
+        wall_time = time.perf_counter() - start_time
+
+        sample = {'paramztn': paramztn, 'action': action, 'wall_s': wall_time}
+        if self.trace_alloc == True:
+            end_alloc, peak_alloc = tracemalloc.get_traced_memory()
+            sample['alloc_bytes'] = end_alloc - start_alloc
+            sample['peak_alloc_bytes'] = peak_alloc - start_alloc
+
+        sample['num_events'], sample['payload_bytes'] = session.get_payload()
+        sample['errored'] = session.is_errored()
+        self.samples.append(sample)
+
+    def run_script(self, paramztn):
+        session = headless.HeadlessSession(self.app_module)
+        settings_tabs = session.settings_tabs
+
+        # Select the parameterization and show every plot, the summary, and the code
+        self.measure(session, paramztn, 'select', session.select_paramztn, paramztn)
+        for checkbox in [settings_tabs.dashboard_checkbox, settings_tabs.ast_checkbox, settings_tabs.genrl_plot_checkbox]:
+            # Note: the options are a dictionary of label to value, or a list of values
+            options = checkbox.options
+            all_values = list(options.values()) if isinstance(options, dict) else list(options)
+            self.measure(session, paramztn, 'show_all', session.set_value, checkbox, all_values)
+
+        # Slider drags
+        drag_params = [param_name for param_name in session.app.paramztn_row.selected_params if param_name not in ['raL', 'decL']]
+        for param_name in drag_params[:NUM_DRAG_PARAMS]:
+            slider = settings_tabs.param_sliders[param_name]
+            for i in range(NUM_DRAG_STEPS):
+                self.measure(session, paramztn, 'slider_drag', session.drag, slider, min(slider.value + slider.step, slider.end))
+            self.measure(session, paramztn, 'slider_release', session.release, slider)
+
+        # Time scrubbing (back from the end of the time range)
+        time_slider = settings_tabs.param_sliders['Time']
+        scrub_step = (time_slider.end - time_slider.start) / (2 * NUM_SCRUB_STEPS)
+        for i in range(NUM_SCRUB_STEPS):
+            self.measure(session, paramztn, 'time_scrub', session.drag, time_slider, max(time_slider.value - scrub_step, time_slider.start))
+        self.measure(session, paramztn, 'time_release', session.release, time_slider)
+
+        # Number of points
+        num_pts_slider = settings_tabs.param_sliders['Num_pts']
+        for num_pts in NUM_PTS_VALUES:
+            self.measure(session, paramztn, 'num_pts', session.drag, num_pts_slider, num_pts)
+            self.measure(session, paramztn, 'num_pts_release', session.release, num_pts_slider)
+
+        # Dashboard checkbox toggles (hide and show each component)
+        dashboard_checkbox = settings_tabs.dashboard_checkbox
+        for component in list(dashboard_checkbox.value):
+            shown_components = list(dashboard_checkbox.value)
+            self.measure(session, paramztn, 'checkbox_toggle', session.set_value, dashboard_checkbox,
+                         [key for key in shown_components if key != component])
+            self.measure(session, paramztn, 'checkbox_toggle', session.set_value, dashboard_checkbox, shown_components)
+
+        # Theme switches
+        for theme_name, theme in THEMES.items():
+            self.measure(session, paramztn, 'theme_switch', session.set_value, session.dashboard.color_panel.theme_dropdown, theme)
+
+    def run(self, paramztns):
+        if self.trace_alloc == True:
+            tracemalloc.start()
+
+        for paramztn in paramztns:
+            start_time = time.perf_counter()
+            try:
+                self.run_script(paramztn)
+            except Exception:
+                self.failures.append({'paramztn': paramztn, 'traceback': traceback.format_exc()})
+                print(f'{paramztn}: failed (see the report for the traceback)', file = sys.stderr)
+            else:
+                print(f'{paramztn}: {time.perf_counter() - start_time:.2f}s', file = sys.stderr)
+
+        if self.trace_alloc == True:
+            tracemalloc.stop()
+
+
+################################################
+# Report
+################################################
+def get_stats(values):
+    values = np.asarray(values, dtype = float)
+    return {'count': len(values), 'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)), 'max': float(values.max())}
+
+
+def get_summary(samples, group_keys):
+    '''
+    Returns a dictionary of group (e.g. 'select' or 'PSPL_Phot_noPar_Param1/select') to the statistics of its samples.
+    '''
+    groups = {}
+    for sample in samples:
+        groups.setdefault('/'.join(sample[key] for key in group_keys), []).append(sample)
+
+    summary = {}
+    for group_name, group_samples in groups.items():
+        summary[group_name] = {'wall_s': get_stats([sample['wall_s'] for sample in group_samples]),
+                               'payload_bytes': get_stats([sample['payload_bytes'] for sample in group_samples])}
+        if 'alloc_bytes' in group_samples[0]:
+            summary[group_name]['peak_alloc_bytes'] = get_stats([sample['peak_alloc_bytes'] for sample in group_samples])
+        summary[group_name]['errored'] = sum(sample['errored'] for sample in group_samples)
+
+    return summary
+
+
+def get_report(benchmark, stand_in):
+    bagle_module = sys.modules.get('bagle')
+    if stand_in == True:
+        bagle_version = 'stand-in'
+    else:
+        bagle_version = getattr(bagle_module, '__version__', 'unknown')
+
+    stage_stats = {}
+    for stage, histogram in metrics.get_stage_histograms().items():
+        stage_stats[stage] = {'count': histogram.count, 'total_s': histogram.total, 'max_s': histogram.max,
+                              'p50_s': histogram.get_quantile(0.5), 'p95_s': histogram.get_quantile(0.95)}
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'panel': pn.__version__,
+            'bokeh': bokeh.__version__,
+            'numpy': np.__version__,
+            'bagle': bagle_version,
+            'trace_alloc': benchmark.trace_alloc
+        },
+        'actions': get_summary(benchmark.samples, ['action']),
+        'paramztn_actions': get_summary(benchmark.samples, ['paramztn', 'action']),
+        'stages': stage_stats,
+        'failures': benchmark.failures,
+        'samples': benchmark.samples
+    }
+
+
+def get_report_table(report):
+    report_lines = [f'{"Action":<18}{"Count":>7}{"Mean (ms)":>11}{"p50":>9}{"p95":>9}{"Max":>9}{"Payload (kB)":>14}{"Peak alloc (kB)":>17}']
+    for action, action_stats in report['actions'].items():
+        wall_stats = action_stats['wall_s']
+        peak_alloc_str = f'{action_stats["peak_alloc_bytes"]["mean"] / 1e3:>17.1f}' if 'peak_alloc_bytes' in action_stats else f'{"-":>17}'
+        report_lines.append(
+            f'{action:<18}{wall_stats["count"]:>7}{1000 * wall_stats["mean"]:>11.1f}{1000 * wall_stats["p50"]:>9.1f}'
+            f'{1000 * wall_stats["p95"]:>9.1f}{1000 * wall_stats["max"]:>9.1f}{action_stats["payload_bytes"]["mean"] / 1e3:>14.1f}{peak_alloc_str}'
+        )
+
+    return '\n'.join(report_lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Headless end-to-end latency benchmark of the BAGLE Calculator.')
+    parser.add_argument('--paramztns', nargs = '+', default = list(constants.ALL_MODS),
+                        help = 'Parameterizations to run (default: all of constants.ALL_MODS)')
+    parser.add_argument('--stand-in', action = 'store_true', help = 'Use the stand-in BAGLE models (see benchmarks.stand_in_bagle)')
+    parser.add_argument('--no-alloc', action = 'store_true', help = "Don't trace allocations (wall times are then shorter)")
+    parser.add_argument('--output', default = 'bench_e2e.json', help = 'Path of the JSON report (default: bench_e2e.json)')
+    args = parser.parse_args()
+
+    # Note: stage timings are included in the report (see 'app_utils.metrics')
+    metrics.set_enabled(True)
+    app_module = headless.load_app(stand_in = args.stand_in)
+
+    benchmark = Benchmark(app_module, trace_alloc = not args.no_alloc)
+    benchmark.run(args.paramztns)
+
+    report = get_report(benchmark, args.stand_in)
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent = 1)
+
+    print(get_report_table(report))
+    print(f'\nReport written to {args.output}')
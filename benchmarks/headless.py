@@ -0,0 +1,130 @@
+################################################
+# Packages
+################################################
+import importlib
+from contextlib import contextmanager
+
+import param
+import panel as pn
+from panel.io.state import set_curdoc
+from bokeh.document import Document
+from bokeh.protocol import Protocol
+from panel.models.tabulator import TableEditEvent
+
+from app_utils import catalog
+
+
+################################################
+# Headless App Sessions
+################################################
+def load_app(stand_in = False):
+    '''
+    Imports and returns the app module ('app.py'). Run this from the app directory.
+    stand_in: if True, the stand-in BAGLE models are used (see 'benchmarks.stand_in_bagle'). This needs to be set the first time the app is loaded.
+    '''
+    if stand_in == True:
+        from benchmarks import stand_in_bagle
+        stand_in_bagle.install()
+
+    return importlib.import_module('app')
+
+
+class HeadlessSession:
+    '''
+    An app instance rendered into its own Bokeh document, without a browser or server.
+
+    Widget changes are made the same way as the browser would make them (see 'drag'), and the document changes they cause
+    are collected so that their size can be measured (see 'get_payload').
+    Note: without a server session, the update scheduler runs async tasks (e.g. the plot updates) to completion before a change returns.
+    '''
+
+    def __init__(self, app_module):
+        self.app = app_module.BAGLECalc()
+        self.dashboard = self.app.dashboard
+        self.settings_tabs = self.dashboard.settings_tabs
+
+        self.doc = Document()
+        with self.in_doc():
+            self.doc.add_root(pn.panel(self.app).get_root(self.doc))
+
+        # Note: the server sends the whole document when a session is opened, so its models are only referenced (not sent again) by later changes
+            # Otherwise, a change to a model that was never sent (e.g. the code editor's callbacks) would be measured with the whole model.
+        self.doc.models.flush_synced()
+
+        self.events = []
+        self.doc.on_change(self.events.append)
+        self.protocol = Protocol()
+
+    @contextmanager
+    def in_doc(self):
+        '''
+        Context manager that makes the session's document the current document (e.g. so that held changes are combined like on the server).
+        '''
+        with set_curdoc(self.doc):
+            yield
+
+    def get_payload(self):
+        '''
+        Returns the number of document change events since the last call, and the size (in bytes) of the patch message
+        the server would send for them. The collected events are then cleared.
+        '''
+        if len(self.events) == 0:
+            return 0, 0
+
+        num_events = len(self.events)
+        # Note: changes to models that were removed from the document by a later change (e.g. the code editor replaced by an error indicator)
+            # are left out, since they refer to models that the browser no longer has
+        events = [event for event in self.events if (getattr(event, 'model', None) == None) or (event.model.document != None)]
+        self.events.clear()
+        if len(events) == 0:
+            return num_events, 0
+
+        patch_msg = self.protocol.create('PATCH-DOC', events)
+
+        num_bytes = len(patch_msg.header_json) + len(patch_msg.metadata_json) + len(patch_msg.content_json)
+        num_bytes += sum(len(buffer.to_bytes()) for buffer in patch_msg.buffers)
+        return num_events, num_bytes
+
+    def is_errored(self):
+        return any(errored_state.value == True for errored_state in self.settings_tabs.errored_state.values())
+
+    ########################
+    # Interactions
+    ########################
+    def select_paramztn(self, paramztn):
+        srclens, data, par, gp = catalog.get_mod_types(paramztn)
+        with self.in_doc():
+            mod_row = self.app.mod_row
+            mod_row.srclens_type.value = srclens
+            mod_row.data_type.value = data
+            mod_row.par_type.value = par
+            mod_row.gp_type.value = gp
+            self.app.paramztn_row.paramztn_btns[paramztn].clicks += 1
+
+    def set_value(self, widget, value):
+        with self.in_doc():
+            widget.value = value
+
+    def drag(self, slider, value):
+        '''
+        Moves a slider to a value, as one step of a drag (i.e. without releasing it).
+        '''
+        self.set_value(slider, value)
+
+    def release(self, slider):
+        '''
+        Releases a dragged slider. This sets 'value_throttled', like the browser does at the end of a drag.
+        '''
+        with self.in_doc():
+            with param.edit_constant(slider):
+                slider.value_throttled = slider.value
+
+    def edit_cell(self, table, row, column, value):
+        '''
+        Edits a table cell, like the browser does (the table's data is changed in place, and then its edit callbacks are called).
+        row: the index label of the edited row (i.e. the parameter name)
+        Note: tabulator has no public way to make an edit event, so it's passed to the table's event handler.
+        '''
+        with self.in_doc():
+            table.value.loc[row, column] = value
+            table._process_event(TableEditEvent(model = None, column = column, row = table.value.index.get_loc(row)))
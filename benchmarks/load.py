@@ -0,0 +1,475 @@
+################################################
+# Packages
+################################################
+import os
+import sys
+import json
+import time
+import asyncio
+import pkgutil
+import argparse
+import platform
+import importlib
+import threading
+import traceback
+import subprocess
+import urllib.request
+from contextlib import nullcontext
+
+import numpy as np
+import panel as pn
+import panel.models
+import bokeh
+from tornado.ioloop import IOLoop
+from bokeh.client import pull_session
+from bokeh.core.serialization import Serializable
+from bokeh.document.events import MessageSentEvent
+from bokeh.events import ButtonClick, DocumentReady
+from bokeh.models import AbstractSlider
+
+from benchmarks import scripts
+
+
+################################################
+# Multi-session Load Generator
+################################################
+# Note: run from the app directory with 'python -m benchmarks.load' (see '--help').
+    # A 'panel serve app.py' server is started (or an existing one is used with '--url'), and for each number of users,
+    # that many sessions are opened over the Bokeh websocket protocol and replay the same interaction script (see 'benchmarks.scripts').
+    # Each simulated user waits for the server's response to a step before taking the next one (like a user watching the plots).
+    # A step is done when the server has sent no document changes for 'QUIET_PERIOD', and its latency is the time of the last change.
+        # Steps without any change in 'NO_CHANGE_PERIOD' (e.g. releasing a slider that isn't throttled) have no latency, and are counted on their own.
+    # The server's CPU and memory are sampled from '/proc', so they are only reported on Linux.
+
+# Time (in seconds) without server changes after which a step is done, the time after which a step without changes is done, and the longest a step can take
+    # Note: the quiet period is longer than the gaps between the changes of one update (e.g. a parameterization's layout, and then its plots)
+QUIET_PERIOD = 1
+NO_CHANGE_PERIOD = 5
+STEP_TIMEOUT = 30
+
+# Time (in seconds) between the start of each user, between resource samples, and the longest the server can take to start
+USER_STAGGER = 0.1
+SAMPLE_PERIOD = 0.5
+SERVER_START_TIMEOUT = 60
+
+# Numbers of users that are run by default
+DEFAULT_NUM_USERS = [1, 2, 4, 8]
+
+# Step kinds that are skipped, since their widgets can't be found or changed by a websocket client
+    # Note: color pickers are named by ids that aren't sent to the browser, and table edits are made by tabulator in the browser.
+    # These steps can be replayed headlessly with 'benchmarks.replay'.
+UNSUPPORTED_KINDS = ['color', 'edit']
+
+
+def import_panel_models():
+    '''
+    Imports every panel model module.
+    Note: the client has to know every model class of the app's document to read it, and panel only imports some of them when they are used.
+    '''
+    for module_info in pkgutil.iter_modules(panel.models.__path__):
+        try:
+            importlib.import_module(f'panel.models.{module_info.name}')
+        except ImportError:
+            pass
+
+
+class ClientEvent(Serializable):
+    '''
+    A UI event sent by the browser (e.g. a button click), in the format the server reads with 'bokeh.events.Event.from_serializable'.
+    model: the model the event is for. None for document events (e.g. 'document_ready').
+    '''
+
+    def __init__(self, event_name, model = None):
+        self.event_name = event_name
+        self.model = model
+
+    def to_serializable(self, serializer):
+        # Note: the model is sent as a reference, since the server already has it
+        values = {'type': 'map', 'entries': []}
+        if self.model != None:
+            values['entries'].append(['model', {'id': self.model.id}])
+        return {'type': 'event', 'name': self.event_name, 'values': values}
+
+
+################################################
+# Server
+################################################
+def get_proc_usage(pid):
+    '''
+    Returns the CPU time (in seconds) and resident memory (in bytes) of a process, or None if they can't be read (e.g. not on Linux).
+    '''
+    try:
+        with open(f'/proc/{pid}/stat') as stat_file:
+            # Note: the process name (in parentheses) can have spaces, so the fields are counted from its end
+            stat_fields = stat_file.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status') as status_file:
+            rss_line = next(line for line in status_file if line.startswith('VmRSS:'))
+    except (OSError, StopIteration):
+        return None
+
+    # Note: utime and stime are the 12th and 13th fields after the process name
+    cpu_time = (int(stat_fields[11]) + int(stat_fields[12])) / os.sysconf('SC_CLK_TCK')
+    return cpu_time, 1024 * int(rss_line.split()[1])
+
+
+class ResourceSampler:
+    '''
+    Samples the CPU usage and memory of a process in a background thread, while in its context.
+    '''
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    def run(self):
+        last_time, last_usage = time.perf_counter(), get_proc_usage(self.pid)
+        while (last_usage != None) and (self.stop_event.wait(SAMPLE_PERIOD) == False):
+            sample_time, usage = time.perf_counter(), get_proc_usage(self.pid)
+            if usage == None:
+                break
+
+            cpu_percent = 100 * (usage[0] - last_usage[0]) / (sample_time - last_time)
+            self.samples.append({'cpu_percent': cpu_percent, 'rss_bytes': usage[1]})
+            last_time, last_usage = sample_time, usage
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+    def get_stats(self):
+        if len(self.samples) == 0:
+            return {'cpu_percent_mean': None, 'cpu_percent_max': None, 'rss_mb_peak': None}
+
+        cpu_percents = [sample['cpu_percent'] for sample in self.samples]
+        return {'cpu_percent_mean': float(np.mean(cpu_percents)), 'cpu_percent_max': float(np.max(cpu_percents)),
+                'rss_mb_peak': max(sample['rss_bytes'] for sample in self.samples) / 1e6}
+
+
+class AppServer:
+    '''
+    A 'panel serve app.py' subprocess. Run this from the app directory.
+    server_args: extra arguments of 'panel serve' (e.g. ['--num-threads', '4'])
+    Note: the environment is passed on, so the app's settings (e.g. 'BAGLE_WARM_POOL_SIZE') can be set as usual.
+    '''
+
+    def __init__(self, port, server_args = ()):
+        self.port = port
+        self.url = f'http://localhost:{port}/app'
+        self.process = subprocess.Popen([sys.executable, '-m', 'panel', 'serve', 'app.py', '--port', str(port), *server_args],
+                                        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+        self.pid = self.process.pid
+
+    def wait_until_ready(self):
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < SERVER_START_TIMEOUT:
+            if self.process.poll() != None:
+                raise RuntimeError(f'The server exited with code {self.process.returncode}')
+            try:
+                urllib.request.urlopen(self.url, timeout = 5).close()
+                return
+            except OSError:
+                time.sleep(0.5)
+
+        raise RuntimeError(f'The server did not start in {SERVER_START_TIMEOUT}s')
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout = 10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+################################################
+# Simulated Users
+################################################
+def get_option_label(option):
+    '''
+    Returns the label of a select option. The options are labels, or [value, label] pairs.
+    '''
+    return option[1] if isinstance(option, (list, tuple)) else option
+
+
+class SimulatedUser:
+    '''
+    A browser session that replays an interaction script through the websocket protocol, in its own thread and event loop.
+    speed: factor of the script's wait times (e.g. 0 to take every step as soon as the previous one is done)
+    '''
+
+    def __init__(self, user_id, url, script, speed = 1, quiet_period = QUIET_PERIOD, step_timeout = STEP_TIMEOUT):
+        self.user_id = user_id
+        self.url = url
+        self.script = script
+        self.speed = speed
+        self.quiet_period = quiet_period
+        self.step_timeout = step_timeout
+
+        self.samples = []
+        self.failure = None
+        self.session = None
+        self.last_change_time = None
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    ########################
+    # Widgets
+    ########################
+    def get_models(self):
+        return [model for root in self.session.document.roots for model in root.references()]
+
+    def find_model(self, step):
+        '''
+        Returns the model of a step's widget, found by what is visible in the browser (see 'benchmarks.scripts'), or None if there isn't one.
+        Note: the first matching model is used, since the app doesn't have two visible widgets with the same name.
+        '''
+        kind, name = step['kind'], step['name']
+        for model in self.get_models():
+            model_type = type(model).__name__
+            if kind == 'click' and model_type == 'Button' and model.label == name:
+                return model
+            if kind in ['slider', 'release'] and isinstance(model, AbstractSlider) and model.title == name:
+                return model
+            if kind == 'select' and model_type in ['Select', 'CustomSelect'] and model.title == name:
+                if step['value'] in [get_option_label(option) for option in model.options]:
+                    return model
+            if kind == 'checkbox' and model_type == 'CheckboxGroup' and list(model.labels) == list(step['options']):
+                return model
+
+        return None
+
+    def take_step(self, step, model):
+        kind = step['kind']
+        if kind == 'click':
+            self.send_event(ClientEvent(ButtonClick.event_name, model))
+        elif kind == 'slider':
+            model.value = step['value']
+        elif kind == 'release':
+            # Note: 'value_throttled' is read only in Python, so it's set the way the browser's changes are applied
+            model.set_from_json('value_throttled', model.value)
+        elif kind == 'select':
+            option = next(option for option in model.options if get_option_label(option) == step['value'])
+            model.value = option[0] if isinstance(option, (list, tuple)) else option
+        elif kind == 'checkbox':
+            model.active = [step['options'].index(label) for label in step['value']]
+        else:
+            raise ValueError(f"Unknown step kind '{kind}'")
+
+    def send_event(self, event):
+        connection = self.session._connection
+        connection._send_patch_document(self.session.id, MessageSentEvent(self.session.document, 'bokeh_event', event))
+
+    ########################
+    # Script
+    ########################
+    def on_change(self, event):
+        # Note: changes made by this client have no setter, and changes sent by the server have the session as their setter
+        if event.setter is self.session:
+            self.last_change_time = time.perf_counter()
+
+    async def wait_for_response(self, send_time):
+        '''
+        Waits until the server has responded to a step, and returns its latency (or None if there were no changes) and error (or None).
+        '''
+        while True:
+            await asyncio.sleep(0.02)
+            now = time.perf_counter()
+            responded = (self.last_change_time != None) and (self.last_change_time > send_time)
+            if responded and (now - self.last_change_time >= self.quiet_period):
+                return self.last_change_time - send_time, None
+            if (responded == False) and (now - send_time >= NO_CHANGE_PERIOD):
+                return None, None
+            if now - send_time >= self.step_timeout:
+                return self.last_change_time - send_time, 'timed out'
+
+    async def run_script(self):
+        # Note: the server only runs the app's 'onload' callbacks once the browser says the document is ready
+        self.send_event(ClientEvent(DocumentReady.event_name))
+        await self.wait_for_response(time.perf_counter())
+
+        for step_idx, step in enumerate(self.script):
+            await asyncio.sleep(self.speed * step['wait'])
+
+            sample = {'user': self.user_id, 'step': step_idx, 'kind': step['kind'], 'name': step['name']}
+            if step['kind'] in UNSUPPORTED_KINDS:
+                sample.update({'latency_s': None, 'error': 'not supported'})
+                self.samples.append(sample)
+                continue
+
+            model = self.find_model(step)
+            if model == None:
+                sample.update({'latency_s': None, 'error': 'widget not found'})
+                self.samples.append(sample)
+                continue
+
+            send_time = time.perf_counter()
+            self.take_step(step, model)
+            latency, error = await self.wait_for_response(send_time)
+            sample.update({'latency_s': latency, 'error': error})
+            self.samples.append(sample)
+
+    def run(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        io_loop = IOLoop.current()
+        try:
+            self.session = pull_session(url = self.url, io_loop = io_loop)
+        except Exception:
+            self.failure = traceback.format_exc()
+            return
+        self.session.document.on_change(self.on_change)
+
+        # Note: the client only reads the server's messages while its connection loop runs, so the script runs as a callback of that loop
+        async def run_and_close():
+            try:
+                await self.run_script()
+            except Exception:
+                self.failure = traceback.format_exc()
+            finally:
+                self.session.close()
+
+        io_loop.add_callback(run_and_close)
+        self.session._connection.loop_until_closed()
+        io_loop.close(all_fds = True)
+
+
+def run_level(url, script, num_users, server_pid = None, speed = 1, quiet_period = QUIET_PERIOD, step_timeout = STEP_TIMEOUT):
+    '''
+    Runs the script with a number of concurrent users, and returns the level's results (see 'get_level_summary').
+    '''
+    users = [SimulatedUser(user_id, url, script, speed, quiet_period, step_timeout) for user_id in range(num_users)]
+    sampler = ResourceSampler(server_pid) if server_pid != None else None
+
+    client_cpu_start = time.process_time()
+    start_time = time.perf_counter()
+    with sampler if sampler != None else nullcontext():
+        for user in users:
+            user.thread.start()
+            time.sleep(USER_STAGGER)
+        for user in users:
+            user.thread.join()
+
+    level = {'num_users': num_users, 'wall_s': time.perf_counter() - start_time, 'client_cpu_s': time.process_time() - client_cpu_start,
+             'server': sampler.get_stats() if sampler != None else None,
+             'samples': [sample for user in users for sample in user.samples],
+             'failures': [{'user': user.user_id, 'traceback': user.failure} for user in users if user.failure != None]}
+    for failure in level['failures']:
+        print(f'User {failure["user"]} failed (see the report for the traceback)', file = sys.stderr)
+    return level
+
+
+################################################
+# Report
+################################################
+def get_latency_stats(samples):
+    latencies = np.asarray([sample['latency_s'] for sample in samples if sample['latency_s'] != None], dtype = float)
+    if len(latencies) == 0:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    return {'count': len(latencies), 'mean': float(latencies.mean()), 'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)), 'p99': float(np.percentile(latencies, 99)), 'max': float(latencies.max())}
+
+
+def get_level_summary(level):
+    samples = level['samples']
+    num_done = sum(sample['error'] == None for sample in samples)
+
+    kinds = {}
+    for sample in samples:
+        kinds.setdefault(sample['kind'], []).append(sample)
+
+    return {
+        'num_users': level['num_users'],
+        'wall_s': level['wall_s'],
+        'throughput_steps_per_s': num_done / level['wall_s'],
+        'latency_s': get_latency_stats(samples),
+        'kind_latency_s': {kind: get_latency_stats(kind_samples) for kind, kind_samples in kinds.items()},
+        'no_change': sum((sample['latency_s'] == None) and (sample['error'] == None) for sample in samples),
+        'timed_out': sum(sample['error'] == 'timed out' for sample in samples),
+        'not_found': sum(sample['error'] == 'widget not found' for sample in samples),
+        'not_supported': sum(sample['error'] == 'not supported' for sample in samples),
+        'failed_users': len(level['failures']),
+        'server': level['server'],
+        'client_cpu_s': level['client_cpu_s']
+    }
+
+
+def get_report(levels, script, args):
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'panel': pn.__version__,
+            'bokeh': bokeh.__version__,
+            'script': args.script or 'default',
+            'num_steps': len(script),
+            'speed': args.speed,
+            'quiet_period': args.quiet
+        },
+        'levels': [get_level_summary(level) for level in levels],
+        'failures': [failure for level in levels for failure in level['failures']],
+        'samples': [sample for level in levels for sample in level['samples']]
+    }
+
+
+def get_report_table(report):
+    report_lines = [f'{"Users":>5}{"Steps/s":>9}{"p50 (ms)":>10}{"p95":>9}{"p99":>9}{"Timed out":>11}{"CPU mean (%)":>14}{"CPU max":>9}{"RSS (MB)":>10}']
+    for level in report['levels']:
+        latency_stats, server_stats = level['latency_s'], level['server'] or {}
+        latency_strs = [f'{1000 * latency_stats[key]:>{width}.1f}' if latency_stats[key] != None else f'{"-":>{width}}'
+                        for key, width in [('p50', 10), ('p95', 9), ('p99', 9)]]
+        server_strs = [f'{server_stats[key]:>{width}.1f}' if server_stats.get(key) != None else f'{"-":>{width}}'
+                       for key, width in [('cpu_percent_mean', 14), ('cpu_percent_max', 9), ('rss_mb_peak', 10)]]
+        report_lines.append(f'{level["num_users"]:>5}{level["throughput_steps_per_s"]:>9.2f}{"".join(latency_strs)}'
+                            f'{level["timed_out"]:>11}{"".join(server_strs)}')
+
+    return '\n'.join(report_lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Multi-session websocket load generator for the BAGLE Calculator.')
+    parser.add_argument('--users', nargs = '+', type = int, default = DEFAULT_NUM_USERS,
+                        help = f'Numbers of concurrent users to run, one level each (default: {" ".join(map(str, DEFAULT_NUM_USERS))})')
+    parser.add_argument('--script', default = None, help = 'Path of a JSON lines interaction script (default: benchmarks.scripts.get_default_script)')
+    parser.add_argument('--speed', type = float, default = 1, help = "Factor of the script's wait times (0 to take steps as fast as possible)")
+    parser.add_argument('--quiet', type = float, default = QUIET_PERIOD, help = f'Time without server changes after which a step is done (default: {QUIET_PERIOD}s)')
+    parser.add_argument('--timeout', type = float, default = STEP_TIMEOUT, help = f'Longest time a step can take (default: {STEP_TIMEOUT}s)')
+    parser.add_argument('--port', type = int, default = 5006, help = 'Port of the started server (default: 5006)')
+    parser.add_argument('--server-args', nargs = argparse.REMAINDER, default = [], help = "Extra arguments of 'panel serve' (must be last)")
+    parser.add_argument('--url', default = None, help = 'URL of a running app to use instead of starting a server')
+    parser.add_argument('--server-pid', type = int, default = None, help = "PID of the running server given by '--url' (for its CPU and memory)")
+    parser.add_argument('--output', default = 'bench_load.json', help = 'Path of the JSON report (default: bench_load.json)')
+    args = parser.parse_args()
+
+    import_panel_models()
+    script = scripts.load_script(args.script) if args.script != None else scripts.get_default_script()
+
+    server = None
+    if args.url == None:
+        server = AppServer(args.port, args.server_args)
+        url, server_pid = server.url, server.pid
+    else:
+        url, server_pid = args.url, args.server_pid
+
+    try:
+        if server != None:
+            server.wait_until_ready()
+
+        levels = []
+        for num_users in args.users:
+            print(f'Running {num_users} users...', file = sys.stderr)
+            levels.append(run_level(url, script, num_users, server_pid, args.speed, args.quiet, args.timeout))
+    finally:
+        if server != None:
+            server.stop()
+
+    report = get_report(levels, script, args)
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent = 1)
+
+    print(get_report_table(report))
+    print(f'\nReport written to {args.output}')
@@ -0,0 +1,306 @@
+################################################
+# Packages
+################################################
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib
+
+import numpy as np
+import celerite
+
+from app_utils import constants, catalog, traces
+
+
+################################################
+# Model Evaluation Micro-benchmark
+################################################
+# Note: run from the app directory with 'python -m benchmarks.model_eval' (see '--help').
+    # This times the model evaluations that 'traces.AllTraceInfo' makes for a trace update (without the UI),
+    # for every parameterization family (srclens x data x par x GP) and number of points.
+    # Each evaluation is called once to warm up, and then timed 'repeats' times. The minimum is used for comparisons, since it's the least noisy.
+
+# Number of points of the sweep (the range of the 'Num_pts' slider)
+NUM_PTS_VALUES = [1000, 3500, 10000, 25000]
+
+# Number of GP samples (the default of the 'Num_samps' slider)
+NUM_GP_SAMPS = 3
+
+# Default number of timed calls of each evaluation
+NUM_REPEATS = 5
+
+# Default relative slowdown (e.g. 0.25 is 25% slower) that is flagged by '--compare'
+SLOWDOWN_THRESHOLD = 0.25
+
+# Slowdowns shorter than this (in seconds) aren't flagged, since they are within timer noise
+MIN_SLOWDOWN = 50e-6
+
+
+def load_models(stand_in = False):
+    '''
+    Returns 'bagle.model'.
+    stand_in: if True, the stand-in BAGLE models are used (see 'benchmarks.stand_in_bagle')
+    '''
+    if stand_in == True:
+        from benchmarks import stand_in_bagle
+        return stand_in_bagle.install()
+
+    return importlib.import_module('bagle.model')
+
+
+def get_family(paramztn):
+    '''
+    Returns the family of a parameterization (e.g. 'PSPL_PhotAstrom_Par_GP'), which is its model types (see 'catalog.get_mod_types')
+    '''
+    return '_'.join(mod_type for mod_type in catalog.get_mod_types(paramztn) if mod_type != '')
+
+
+def get_default_paramztns():
+    '''
+    Returns the first parameterization of every family
+    '''
+    return [paramztns[0] for paramztns in catalog.MOD_PARAMZTNS.values()]
+
+
+def get_default_param_values(paramztn):
+    '''
+    Returns the model parameter values at their slider defaults, in the same form as 'settings_tabs.mod_param_values'
+    '''
+    paramztn_info = catalog.get_paramztn_info(paramztn)
+
+    mod_param_values = {}
+    for param_name in paramztn_info['params']:
+        # Note: 'phot_name' parameters should be inputed as an ndarray/list
+        if param_name in paramztn_info['phot_params']:
+            mod_param_values[param_name] = np.array([constants.DEFAULT_RANGES[param_name][1]])
+        else:
+            mod_param_values[param_name] = constants.DEFAULT_RANGES[param_name][1]
+
+    return mod_param_values
+
+
+def get_eval_functions(model, paramztn, mod_param_values, time_arr):
+    '''
+    Returns a dictionary of evaluation name to a function that makes the evaluation.
+    The evaluations (and their arguments) are the same as the ones made by the traces of 'traces.AllTraceInfo' when every trace is shown.
+    Note: the inputs that evaluations depend on (e.g. the binary-lens arrays, or the GP) are made here, so they aren't part of the timings.
+    '''
+    srclens, data, par, gp = catalog.get_mod_types(paramztn)
+    mod_class = getattr(model, paramztn)
+    mod = mod_class(**mod_param_values)
+
+    eval_functions = {'model_init': lambda: mod_class(**mod_param_values)}
+
+    # Photometry
+    if data != 'Astrom':
+        eval_functions['get_photometry'] = lambda: mod.get_photometry(time_arr)
+
+    # Astrometry
+    if 'Astrom' in data:
+        # Note: the binary-lens arrays are shared by the lensed astrometry of binary lenses
+        bl_args = ()
+        if 'BL' in srclens:
+            eval_functions['get_all_arrays'] = lambda: mod.get_all_arrays(time_arr)
+            bl_args = mod.get_all_arrays(time_arr)
+
+        eval_functions['get_astrometry'] = lambda: mod.get_astrometry(time_arr, *bl_args)
+        eval_functions['get_astrometry_unlensed'] = lambda: mod.get_astrometry_unlensed(time_arr)
+
+        if 'PS' in srclens:
+            eval_functions['get_resolved_astrometry'] = lambda: mod.get_resolved_astrometry(time_arr)
+        else:
+            eval_functions['get_resolved_astrometry_unlensed'] = lambda: mod.get_resolved_astrometry_unlensed(time_arr)
+            eval_functions['get_resolved_astrometry'] = lambda: mod.get_resolved_astrometry(time_arr, *bl_args)
+
+        if 'PL' in srclens:
+            eval_functions['get_lens_astrometry'] = lambda: mod.get_lens_astrometry(time_arr)
+        else:
+            eval_functions['get_resolved_lens_astrometry'] = lambda: mod.get_resolved_lens_astrometry(time_arr)
+
+    # Gaussian Process
+    if gp == 'GP':
+        cel_mod = model.Celerite_GP_Model(mod, 0)
+        mag_obs = cel_mod.get_value(time_arr)
+        mag_obs_err = traces.get_gp_mag_err(mag_obs)
+        kernel = traces.get_gp_kernel(mod_param_values, catalog.get_paramztn_info(paramztn)['params'], mag_obs_err)
+
+        gp_mod = celerite.GP(kernel, mean = cel_mod, fit_mean = True)
+        gp_mod.compute(time_arr, mag_obs_err)
+        mag_obs_corr = gp_mod.sample(size = 1)[0]
+
+        eval_functions['gp_prior'] = lambda: cel_mod.get_value(time_arr)
+        eval_functions['gp_compute'] = lambda: gp_mod.compute(time_arr, mag_obs_err)
+        eval_functions['gp_sample'] = lambda: gp_mod.sample(size = 1)
+        eval_functions['gp_predict'] = lambda: gp_mod.predict(mag_obs_corr, return_cov = False)
+        eval_functions['gp_samps'] = lambda: gp_mod.sample(size = NUM_GP_SAMPS)
+
+    return eval_functions
+
+
+def time_function(function, repeats):
+    function()
+
+    durations = []
+    for i in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start_time)
+
+    return {'min_s': min(durations), 'median_s': float(np.median(durations)), 'repeats': repeats}
+
+
+def run_matrix(model, paramztns, num_pts_values, repeats = NUM_REPEATS):
+    '''
+    Returns a dictionary of '{paramztn}/{num_pts}/{evaluation}' to its timings (see 'time_function'),
+    and a list of the parameterizations that failed (with their error).
+    '''
+    time_range = constants.DEFAULT_RANGES['Time']
+
+    results, failures = {}, []
+    for paramztn in paramztns:
+        start_time = time.perf_counter()
+        try:
+            mod_param_values = get_default_param_values(paramztn)
+            for num_pts in num_pts_values:
+                # Note: the time array is made the same way as the traces (i.e. with the 'Time' slider default included)
+                time_arr = traces.get_time_array(time_range[2], time_range[3], num_pts, time_range[1])
+
+                for eval_name, function in get_eval_functions(model, paramztn, mod_param_values, time_arr).items():
+                    results[f'{paramztn}/{num_pts}/{eval_name}'] = time_function(function, repeats)
+
+        except Exception as error:
+            failures.append({'paramztn': paramztn, 'error': repr(error)})
+            print(f'{paramztn}: failed ({error!r})', file = sys.stderr)
+        else:
+            print(f'{paramztn}: {time.perf_counter() - start_time:.2f}s', file = sys.stderr)
+
+    return results, failures
+
+
+################################################
+# Report and Comparison
+################################################
+def get_family_totals(results):
+    '''
+    Returns a dictionary of family to a dictionary of number of points to the total time of a trace update (i.e. of every evaluation).
+    The slowest parameterization of a family is used. This shows which families need the worker pools or fewer points.
+    '''
+    paramztn_totals = {}
+    for key, timings in results.items():
+        paramztn, num_pts, eval_name = key.split('/')
+        paramztn_totals.setdefault((paramztn, num_pts), 0)
+        paramztn_totals[(paramztn, num_pts)] += timings['min_s']
+
+    family_totals = {}
+    for (paramztn, num_pts), total in paramztn_totals.items():
+        num_pts_totals = family_totals.setdefault(get_family(paramztn), {})
+        num_pts_totals[num_pts] = max(num_pts_totals.get(num_pts, 0), total)
+
+    return family_totals
+
+
+def get_report(results, failures, stand_in):
+    bagle_module = sys.modules.get('bagle')
+    if stand_in == True:
+        bagle_version = 'stand-in'
+    else:
+        bagle_version = getattr(bagle_module, '__version__', 'unknown')
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'bagle': bagle_version
+        },
+        'family_totals': get_family_totals(results),
+        'results': results,
+        'failures': failures
+    }
+
+
+def get_slowdowns(baseline, report, threshold = SLOWDOWN_THRESHOLD):
+    '''
+    Returns a list of (key, baseline time, new time) of the evaluations that are slower than the baseline by more than 'threshold'.
+    Note: only evaluations in both reports are compared, and the minimum times are used (see 'time_function').
+    '''
+    slowdowns = []
+    for key, timings in report['results'].items():
+        if key in baseline['results']:
+            baseline_time, new_time = baseline['results'][key]['min_s'], timings['min_s']
+            if (new_time > baseline_time * (1 + threshold)) and (new_time - baseline_time > MIN_SLOWDOWN):
+                slowdowns.append((key, baseline_time, new_time))
+
+    return sorted(slowdowns, key = lambda slowdown: -slowdown[2] / slowdown[1])
+
+
+def get_family_table(report):
+    num_pts_values = sorted({int(num_pts) for num_pts_totals in report['family_totals'].values() for num_pts in num_pts_totals})
+    report_lines = [f'{"Family (update total, ms)":<28}' + ''.join(f'{num_pts:>10}' for num_pts in num_pts_values)]
+
+    # Note: families are listed from slowest to fastest at the largest number of points
+    family_totals = sorted(report['family_totals'].items(), key = lambda item: -item[1].get(str(num_pts_values[-1]), 0))
+    for family, num_pts_totals in family_totals:
+        report_lines.append(f'{family:<28}' + ''.join(
+            f'{1000 * num_pts_totals[str(num_pts)]:>10.1f}' if str(num_pts) in num_pts_totals else f'{"-":>10}' for num_pts in num_pts_values
+        ))
+
+    return '\n'.join(report_lines)
+
+
+def get_slowdown_table(slowdowns):
+    report_lines = [f'{"Evaluation":<64}{"Baseline (ms)":>15}{"New (ms)":>11}{"Ratio":>8}']
+    for key, baseline_time, new_time in slowdowns:
+        report_lines.append(f'{key:<64}{1000 * baseline_time:>15.3f}{1000 * new_time:>11.3f}{new_time / baseline_time:>8.2f}')
+
+    return '\n'.join(report_lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Micro-benchmark of the model evaluations behind the BAGLE Calculator traces.')
+    parser.add_argument('--paramztns', nargs = '+', default = None,
+                        help = 'Parameterizations to run (default: the first parameterization of every family)')
+    parser.add_argument('--all-paramztns', action = 'store_true', help = 'Run every parameterization of constants.ALL_MODS')
+    parser.add_argument('--num-pts', nargs = '+', type = int, default = NUM_PTS_VALUES,
+                        help = f'Numbers of points of the sweep (default: {NUM_PTS_VALUES})')
+    parser.add_argument('--repeats', type = int, default = NUM_REPEATS, help = f'Timed calls of each evaluation (default: {NUM_REPEATS})')
+    parser.add_argument('--stand-in', action = 'store_true', help = 'Use the stand-in BAGLE models (see benchmarks.stand_in_bagle)')
+    parser.add_argument('--output', default = 'bench_model_eval.json', help = 'Path of the JSON report (default: bench_model_eval.json)')
+    parser.add_argument('--compare', default = None, metavar = 'BASELINE',
+                        help = 'JSON report to compare against. Exits with status 1 if any evaluation is slower than the threshold')
+    parser.add_argument('--threshold', type = float, default = SLOWDOWN_THRESHOLD,
+                        help = f'Relative slowdown flagged by --compare (default: {SLOWDOWN_THRESHOLD})')
+    args = parser.parse_args()
+
+    if args.all_paramztns == True:
+        paramztns = list(constants.ALL_MODS)
+    else:
+        paramztns = args.paramztns or get_default_paramztns()
+
+    model = load_models(stand_in = args.stand_in)
+    results, failures = run_matrix(model, paramztns, args.num_pts, args.repeats)
+
+    report = get_report(results, failures, args.stand_in)
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent = 1)
+
+    print(get_family_table(report))
+    print(f'\nReport written to {args.output}')
+
+    if args.compare != None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        if baseline['meta']['bagle'] != report['meta']['bagle']:
+            print(f'\nWarning: the baseline used BAGLE {baseline["meta"]["bagle"]}, but this run used {report["meta"]["bagle"]}', file = sys.stderr)
+
+        slowdowns = get_slowdowns(baseline, report, args.threshold)
+        if len(slowdowns) != 0:
+            print(f'\n{len(slowdowns)} evaluation(s) are more than {100 * args.threshold:.0f}% slower than {args.compare}:')
+            print(get_slowdown_table(slowdowns))
+            sys.exit(1)
+        else:
+            print(f'\nNo evaluation is more than {100 * args.threshold:.0f}% slower than {args.compare}')
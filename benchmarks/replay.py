@@ -0,0 +1,201 @@
+################################################
+# Packages
+################################################
+import sys
+import json
+import time
+import argparse
+import platform
+
+import numpy as np
+import panel as pn
+import bokeh
+
+from app_utils import metrics, recorder
+from benchmarks import headless, scripts
+
+
+################################################
+# Headless Replay
+################################################
+# Note: run from the app directory with 'python -m benchmarks.replay RECORDING' (see '--help').
+    # A recorded session (see 'app_utils.recorder') or any other interaction script is replayed in a headless app session
+    # (see 'benchmarks.headless'), and every step is timed with the update stage spans it caused (see 'app_utils.metrics').
+    # Steps are taken at their recorded times (scaled by '--speed'), or as soon as the previous step is done with '--speed 0'.
+    # Since a new headless session always starts from the same state, replaying a recording reproduces the same updates.
+
+
+def find_widget(app, step):
+    '''
+    Returns the widget of a step (see 'app_utils.recorder.get_widgets'), or None if the app doesn't have it.
+    '''
+    kind = 'slider' if step['kind'] == 'release' else step['kind']
+    for widget_kind, name, widget in recorder.get_widgets(app):
+        if (widget_kind != kind) or (name != step['name']):
+            continue
+        # Note: selects without a title are found by their options, and checkbox groups by all of their labels
+        if (kind == 'select') and (step['value'] not in widget.labels):
+            continue
+        if (kind == 'checkbox') and (list(widget.labels) != list(step['options'])):
+            continue
+        return widget
+
+    return None
+
+
+def take_step(session, step, widget):
+    kind = step['kind']
+    if kind == 'click':
+        with session.in_doc():
+            widget.clicks += 1
+    elif kind == 'slider':
+        session.drag(widget, step['value'])
+    elif kind == 'release':
+        session.release(widget)
+    elif kind == 'select':
+        session.set_value(widget, widget.values[widget.labels.index(step['value'])])
+    elif kind == 'checkbox':
+        session.set_value(widget, [widget.values[widget.labels.index(label)] for label in step['value']])
+    elif kind == 'color':
+        session.set_value(widget, step['value'])
+    elif kind == 'edit':
+        session.edit_cell(widget, step['row'], step['column'], step['value'])
+    else:
+        raise ValueError(f"Unknown step kind '{kind}'")
+
+
+def get_step_stages(start_time):
+    '''
+    Returns a dictionary of stage to its total time (in seconds) over the spans that ended after 'start_time' (from 'time.time').
+    '''
+    stages = {}
+    for end_time, stage, duration, tags in list(metrics.RECENT_SPANS):
+        if end_time >= start_time:
+            stages[stage] = stages.get(stage, 0) + duration
+    return stages
+
+
+def replay(app_module, script, speed = 1):
+    '''
+    Replays a script in a new headless session, and returns a sample (wall time, stages, payload, and errors) for each step.
+    speed: factor of the script's wait times (e.g. 0 to take every step as soon as the previous one is done)
+    '''
+    session = headless.HeadlessSession(app_module)
+    samples = []
+
+    replay_start = time.perf_counter()
+    step_offset = 0
+    for step_idx, step in enumerate(script):
+        # Note: the waits are kept relative to the start of the replay, so that slow steps don't delay all later steps
+        step_offset += speed * step['wait']
+        time.sleep(max(0, replay_start + step_offset - time.perf_counter()))
+
+        sample = {'step': step_idx, 'kind': step['kind'], 'name': step['name']}
+        widget = find_widget(session.app, step)
+        if widget == None:
+            sample['error'] = 'widget not found'
+            samples.append(sample)
+            continue
+
+        session.get_payload()
+        start_time, span_start_time = time.perf_counter(), time.time()
+        take_step(session, step, widget)
+        sample['wall_s'] = time.perf_counter() - start_time
+        sample['stages'] = get_step_stages(span_start_time)
+        sample['num_events'], sample['payload_bytes'] = session.get_payload()
+        sample['errored'] = session.is_errored()
+        sample['error'] = None
+        samples.append(sample)
+
+    return samples
+
+
+################################################
+# Report
+################################################
+def get_stats(values):
+    values = np.asarray(values, dtype = float)
+    return {'count': len(values), 'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)), 'max': float(values.max())}
+
+
+def get_report(samples, script_path, speed, repeats, stand_in):
+    done_samples = [sample for sample in samples if sample['error'] == None]
+
+    kinds = {}
+    for sample in done_samples:
+        kinds.setdefault(sample['kind'], []).append(sample)
+
+    stage_stats = {}
+    for stage, histogram in metrics.get_stage_histograms().items():
+        stage_stats[stage] = {'count': histogram.count, 'total_s': histogram.total, 'max_s': histogram.max,
+                              'p50_s': histogram.get_quantile(0.5), 'p95_s': histogram.get_quantile(0.95)}
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'panel': pn.__version__,
+            'bokeh': bokeh.__version__,
+            'script': script_path or 'default',
+            'speed': speed,
+            'repeats': repeats,
+            'stand_in': stand_in
+        },
+        'total_wall_s': sum(sample['wall_s'] for sample in done_samples),
+        'kinds': {kind: {'wall_s': get_stats([sample['wall_s'] for sample in kind_samples]),
+                         'payload_bytes': get_stats([sample['payload_bytes'] for sample in kind_samples]),
+                         'errored': sum(sample['errored'] for sample in kind_samples)}
+                  for kind, kind_samples in kinds.items()},
+        'stages': stage_stats,
+        'not_found': sum(sample['error'] == 'widget not found' for sample in samples),
+        'samples': samples
+    }
+
+
+def get_report_table(report):
+    report_lines = [f'{"Step kind":<12}{"Count":>7}{"Mean (ms)":>11}{"p50":>9}{"p95":>9}{"Max":>9}{"Payload (kB)":>14}']
+    for kind, kind_stats in report['kinds'].items():
+        wall_stats = kind_stats['wall_s']
+        report_lines.append(
+            f'{kind:<12}{wall_stats["count"]:>7}{1000 * wall_stats["mean"]:>11.1f}{1000 * wall_stats["p50"]:>9.1f}'
+            f'{1000 * wall_stats["p95"]:>9.1f}{1000 * wall_stats["max"]:>9.1f}{kind_stats["payload_bytes"]["mean"] / 1e3:>14.1f}'
+        )
+
+    report_lines += ['', metrics.get_report()]
+    if report['not_found'] > 0:
+        report_lines += ['', f'{report["not_found"]} steps were skipped, since their widgets were not found']
+
+    return '\n'.join(report_lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Headless replay of a recorded BAGLE Calculator session.')
+    parser.add_argument('script', nargs = '?', default = None,
+                        help = 'Path of a recording or JSON lines interaction script (default: benchmarks.scripts.get_default_script)')
+    parser.add_argument('--speed', type = float, default = 0,
+                        help = "Factor of the recorded wait times (1 for the original speed, default: 0 for the maximum speed)")
+    parser.add_argument('--repeats', type = int, default = 1, help = 'Number of times the script is replayed, each in a new session')
+    parser.add_argument('--stand-in', action = 'store_true', help = 'Use the stand-in BAGLE models (see benchmarks.stand_in_bagle)')
+    parser.add_argument('--output', default = 'bench_replay.json', help = 'Path of the JSON report (default: bench_replay.json)')
+    args = parser.parse_args()
+
+    # Note: the stage spans of every step are collected from the update metrics
+    metrics.set_enabled(True)
+    app_module = headless.load_app(stand_in = args.stand_in)
+    script = scripts.load_script(args.script) if args.script != None else scripts.get_default_script()
+
+    samples = []
+    for repeat in range(args.repeats):
+        start_time = time.perf_counter()
+        repeat_samples = replay(app_module, script, args.speed)
+        samples += [{'repeat': repeat, **sample} for sample in repeat_samples]
+        print(f'Replay {repeat + 1}: {time.perf_counter() - start_time:.2f}s', file = sys.stderr)
+
+    report = get_report(samples, args.script, args.speed, args.repeats, args.stand_in)
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent = 1)
+
+    print(get_report_table(report))
+    print(f'\nReport written to {args.output}')
@@ -0,0 +1,90 @@
+################################################
+# Packages
+################################################
+import json
+
+from app_utils import constants
+
+
+################################################
+# Interaction Scripts
+################################################
+# Note: an interaction script is a list of steps, where each step is a dictionary with:
+    # 'wait': the time (in seconds) since the previous step (i.e. the user's think time)
+    # 'kind': the kind of widget change (one of 'STEP_KINDS')
+    # 'name': the visible name of the widget (i.e. the slider title, button label, select title, or table name)
+        # Color pickers have no visible name, so they are named by their ids (see 'app_utils.recorder.get_widgets')
+    # 'value': the new value, as shown in the browser (e.g. the select option label, or the checked checkbox labels)
+    # 'options': for checkboxes only, every checkbox label of the group (so that groups without a name can be found)
+    # 'row' and 'column': for table edits only, the parameter name of the edited row and the name of the edited column
+# Widgets are found by what is visible in the browser, so the same script can be replayed through the websocket protocol (see 'benchmarks.load').
+# Scripts are stored as JSON lines (one step per line). Sessions can be recorded as scripts with 'app_utils.recorder'.
+
+# Dictionary of step kind to a description of the change
+STEP_KINDS = {
+    'click': "a button click ('value' is unused)",
+    'slider': "a slider drag step (i.e. 'value' changes, but not 'value_throttled')",
+    'release': "the end of a slider drag (i.e. 'value_throttled' is set to 'value')",
+    'select': "a select change ('name' is empty for selects without a title)",
+    'checkbox': "a checkbox group change ('value' is the list of checked labels)",
+    'color': "a color picker change ('value' is a hex color)",
+    'edit': "a table cell edit ('value' is the new cell value)"
+}
+
+# Parameterization and drag settings of the default script
+DEFAULT_PARAMZTN = 'PSPL_PhotAstrom_noPar_Param1'
+DEFAULT_DRAG_PARAMS = ['t0', 'beta', 'mL']
+NUM_DRAG_STEPS = 5
+TIME_SCRUB_STEP = 50
+DRAG_WAIT = 0.05
+THINK_WAIT = 1
+
+
+def get_slider_title(param_name):
+    '''
+    Returns the title of a parameter slider (the same as the slider names in 'settings_tabs.SettingsTabs')
+    '''
+    units = constants.DEFAULT_RANGES[param_name][0]
+    if units == None:
+        return param_name
+    return param_name + f' [{units}]'
+
+
+def get_default_script():
+    '''
+    Returns a script that selects 'DEFAULT_PARAMZTN', drags a few parameter sliders, scrubs the time, and changes the number of points.
+    '''
+    script = [
+        {'wait': 0, 'kind': 'select', 'name': '', 'value': 'Photometry-Astrometry'},
+        {'wait': THINK_WAIT, 'kind': 'click', 'name': DEFAULT_PARAMZTN, 'value': None}
+    ]
+
+    for param_name in DEFAULT_DRAG_PARAMS + ['Time']:
+        units, default_val, min_val, max_val, step_val = constants.DEFAULT_RANGES[param_name]
+        slider_title = get_slider_title(param_name)
+
+        # Note: the time is scrubbed back from the end of its range, with larger steps than its slider step
+        if param_name == 'Time':
+            step_val = -TIME_SCRUB_STEP
+
+        for i in range(1, NUM_DRAG_STEPS + 1):
+            value = round(min(max(default_val + i * step_val, min_val), max_val), 10)
+            script.append({'wait': THINK_WAIT if i == 1 else DRAG_WAIT, 'kind': 'slider', 'name': slider_title, 'value': value})
+        script.append({'wait': DRAG_WAIT, 'kind': 'release', 'name': slider_title, 'value': None})
+
+    script += [
+        {'wait': THINK_WAIT, 'kind': 'slider', 'name': 'Number of Points (Trace Resolution)', 'value': 5000},
+        {'wait': DRAG_WAIT, 'kind': 'release', 'name': 'Number of Points (Trace Resolution)', 'value': None}
+    ]
+    return script
+
+
+def load_script(path):
+    with open(path) as script_file:
+        return [json.loads(line) for line in script_file if line.strip() != '']
+
+
+def save_script(script, path):
+    with open(path, 'w') as script_file:
+        for step in script:
+            script_file.write(json.dumps(step, separators = (',', ':')) + '\n')
@@ -0,0 +1,437 @@
+################################################
+# Packages
+################################################
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import linecache
+import tracemalloc
+import traceback
+from collections import Counter
+
+import numpy as np
+import param
+import panel as pn
+import bokeh
+
+from app_utils import constants, styles
+from benchmarks import headless, load
+
+
+################################################
+# Memory Soak Test
+################################################
+# Note: run from the app directory with 'python -m benchmarks.soak' (see '--help').
+    # Thousands of random interactions are made in one headless app session (see 'benchmarks.headless'), like a session left open for hours.
+    # Every step is measured by its traced memory (tracemalloc) and the number of models in the session's Bokeh document.
+    # Every '--checkpoint-every' steps, the app is put back into the same reference state (see 'reset_state'), and a checkpoint is taken
+    # with a tracemalloc snapshot, the document model count, and the param watcher count of every object.
+    # Since the checkpoints are all taken in the same state, a steady state has the same model and watcher counts at every checkpoint,
+    # and anything that keeps growing after the warmup checkpoints is reported as a leak.
+    # Note: some traced memory growth is expected, since Bokeh keeps the id of every model that was removed from a document
+        # (so that late browser events for them can be ignored). This is a few kB per step, so the default '--max-bytes-per-step' allows for it.
+
+# Parameterizations that the random interactions select from (one per family, without the slow binary-lens models)
+DEFAULT_PARAMZTNS = ['PSPL_Phot_noPar_Param1', 'PSPL_PhotAstrom_noPar_Param1', 'PSPL_PhotAstrom_Par_Param2',
+                     'BSPL_Phot_noPar_GP_Param1', 'PSPL_Phot_Par_GP_Param1']
+
+# Dictionary of interaction kind to its weight (i.e. how often it's chosen)
+INTERACTION_WEIGHTS = {
+    'select': 1,
+    'slider_drag': 8,
+    'slider_release': 2,
+    'time_scrub': 4,
+    'num_pts': 1,
+    'dashboard_toggle': 2,
+    'plot_checkbox': 2,
+    'theme_switch': 1,
+    'table_edit': 2,
+    'slider_error': 1
+}
+
+# Number of points set by the 'num_pts' interactions
+NUM_PTS_VALUES = [1000, 2000, 3000, 5000]
+
+# Plot themes set by the theme switches
+THEMES = [styles.LIGHT_PLOT_THEME, styles.DARK_PLOT_THEME]
+
+# Number of allocation sites (and watched objects) listed in the report
+NUM_TOP_SITES = 15
+
+
+def get_checkbox_values(checkbox):
+    # Note: the options are a dictionary of label to value, or a list of values
+    options = checkbox.options
+    return list(options.values()) if isinstance(options, dict) else list(options)
+
+
+class SoakTest:
+    '''
+    Makes random interactions in one headless session, and measures the memory, model, and watcher growth of each interaction kind.
+    '''
+
+    def __init__(self, app_module, paramztns, seed = 0, trace_frames = 1):
+        self.session = headless.HeadlessSession(app_module)
+        self.settings_tabs = self.session.settings_tabs
+        self.paramztns = paramztns
+        self.rng = random.Random(seed)
+        self.trace_frames = trace_frames
+
+        self.samples = []
+        self.checkpoints = []
+        self.failures = []
+
+    ########################
+    # Interactions
+    ########################
+    def get_drag_sliders(self):
+        selected_params = self.session.app.paramztn_row.selected_params
+        return [self.settings_tabs.param_sliders[param_name] for param_name in selected_params]
+
+    def drag_slider(self, slider, num_steps):
+        value = slider.value + num_steps * slider.step
+        self.session.drag(slider, round(min(max(value, slider.start), slider.end), 10))
+
+    def take_random_step(self, kind):
+        session, settings_tabs, rng = self.session, self.settings_tabs, self.rng
+
+        if kind == 'select':
+            session.select_paramztn(rng.choice(self.paramztns))
+
+        elif kind == 'slider_drag':
+            self.drag_slider(rng.choice(self.get_drag_sliders()), rng.choice([-3, -2, -1, 1, 2, 3]))
+
+        elif kind == 'slider_release':
+            session.release(rng.choice(self.get_drag_sliders()))
+
+        elif kind == 'time_scrub':
+            time_slider = settings_tabs.param_sliders['Time']
+            self.drag_slider(time_slider, rng.choice([-1, 1]) * rng.randint(1, 100))
+            if rng.random() < 0.25:
+                session.release(time_slider)
+
+        elif kind == 'num_pts':
+            num_pts_slider = settings_tabs.param_sliders['Num_pts']
+            session.drag(num_pts_slider, rng.choice(NUM_PTS_VALUES))
+            session.release(num_pts_slider)
+
+        elif kind == 'dashboard_toggle':
+            checkbox = settings_tabs.dashboard_checkbox
+            all_values = get_checkbox_values(checkbox)
+            session.set_value(checkbox, rng.sample(all_values, rng.randint(1, len(all_values))))
+
+        elif kind == 'plot_checkbox':
+            checkbox = rng.choice([settings_tabs.ast_checkbox, settings_tabs.genrl_plot_checkbox])
+            all_values = get_checkbox_values(checkbox)
+            session.set_value(checkbox, rng.sample(all_values, rng.randint(0, len(all_values))))
+
+        elif kind == 'theme_switch':
+            theme_dropdown = session.dashboard.color_panel.theme_dropdown
+            session.set_value(theme_dropdown, THEMES[1 - THEMES.index(theme_dropdown.value)] if theme_dropdown.value in THEMES else THEMES[0])
+
+        elif kind == 'table_edit':
+            slider = rng.choice(self.get_drag_sliders())
+            param_name = next(name for name, param_slider in settings_tabs.param_sliders.items() if param_slider is slider)
+            value = round(min(max(slider.value + rng.randint(-5, 5) * slider.step, slider.start), slider.end), 10)
+            session.edit_cell(settings_tabs.param_table, param_name, 'Value', value)
+
+        elif kind == 'slider_error':
+            # Note: an invalid range shows the error layouts (with the error indicators), and the edit is then undone
+            param_name = rng.choice(self.session.app.paramztn_row.selected_params)
+            min_val, max_val = settings_tabs.slider_table.value.loc[param_name, ['Min', 'Max']]
+            session.edit_cell(settings_tabs.slider_table, param_name, 'Min', max_val + 1)
+            session.edit_cell(settings_tabs.slider_table, param_name, 'Min', min_val)
+
+        else:
+            raise ValueError(f"Unknown interaction kind '{kind}'")
+
+    def warm_up(self):
+        '''
+        Selects every parameterization after every other one, so that the widgets of every model type that is passed through
+        (e.g. the parameterization buttons of each model type) are made before the first checkpoint.
+        '''
+        for paramztn in self.paramztns:
+            for next_paramztn in self.paramztns:
+                if next_paramztn != paramztn:
+                    self.session.select_paramztn(paramztn)
+                    self.session.select_paramztn(next_paramztn)
+        self.session.get_payload()
+
+    def reset_state(self):
+        '''
+        Puts the app into the reference state of the checkpoints: the first parameterization with its default settings, and the dark theme.
+        Note: selecting the parameterization that is already selected doesn't change anything, so another one is selected first.
+        '''
+        session = self.session
+        if session.app.paramztn_row.selected_paramztn == self.paramztns[0]:
+            session.select_paramztn(self.paramztns[1])
+        session.select_paramztn(self.paramztns[0])
+        session.set_value(session.dashboard.color_panel.theme_dropdown, styles.DARK_PLOT_THEME)
+
+    ########################
+    # Measurements
+    ########################
+    def get_num_models(self):
+        return len(self.session.doc.models)
+
+    def take_checkpoint(self, step_idx):
+        self.reset_state()
+        self.session.get_payload()
+        gc.collect()
+
+        checkpoint = {
+            'step': step_idx,
+            'traced_bytes': tracemalloc.get_traced_memory()[0],
+            'rss_bytes': (load.get_proc_usage(os.getpid()) or (None, None))[1],
+            'num_models': self.get_num_models(),
+            'watcher_counts': get_watcher_counts(),
+            # Note: the soak test's own samples and checkpoints are left out of the allocation sites
+            'snapshot': tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                                    tracemalloc.Filter(False, __file__)])
+        }
+        self.checkpoints.append(checkpoint)
+
+        print(f'Step {step_idx}: {checkpoint["traced_bytes"] / 1e6:.1f} MB traced, {checkpoint["num_models"]} models, '
+              f'{sum(checkpoint["watcher_counts"].values())} watchers', file = sys.stderr)
+
+    def run(self, num_steps, checkpoint_every):
+        self.warm_up()
+        tracemalloc.start(self.trace_frames)
+        self.take_checkpoint(0)
+
+        kinds, weights = list(INTERACTION_WEIGHTS.keys()), list(INTERACTION_WEIGHTS.values())
+        for step_idx in range(1, num_steps + 1):
+            kind = self.rng.choices(kinds, weights)[0]
+
+            self.session.get_payload()
+            start_alloc, start_models = tracemalloc.get_traced_memory()[0], self.get_num_models()
+            start_time = time.perf_counter()
+            try:
+                self.take_random_step(kind)
+                wall_time = time.perf_counter() - start_time
+                alloc_bytes = tracemalloc.get_traced_memory()[0] - start_alloc
+                payload_bytes = self.session.get_payload()[1]
+            except Exception:
+                self.failures.append({'step': step_idx, 'kind': kind, 'traceback': traceback.format_exc()})
+                continue
+
+            self.samples.append({
+                'step': step_idx,
+                'kind': kind,
+                'wall_s': wall_time,
+                'alloc_bytes': alloc_bytes,
+                'model_change': self.get_num_models() - start_models,
+                'payload_bytes': payload_bytes,
+                'errored': self.session.is_errored()
+            })
+
+            if step_idx % checkpoint_every == 0:
+                self.take_checkpoint(step_idx)
+
+        tracemalloc.stop()
+
+
+def get_watcher_counts():
+    '''
+    Returns a counter of object (e.g. 'FloatSlider(t0 [MJD])#140234') to the number of param watchers on it, for every live parameterized object.
+    '''
+    watcher_counts = Counter()
+    for obj in gc.get_objects():
+        if not isinstance(obj, param.Parameterized):
+            continue
+        # Note: objects that are still being made don't have their watchers yet
+        watchers = getattr(obj._param__private, 'watchers', {})
+        num_watchers = sum(len(what_watchers) for param_watchers in watchers.values() for what_watchers in param_watchers.values())
+        if num_watchers > 0:
+            watcher_counts[f'{type(obj).__name__}({obj.name})#{id(obj)}'] = num_watchers
+
+    return watcher_counts
+
+
+################################################
+# Report
+################################################
+def get_slope(steps, values):
+    '''
+    Returns the growth per step of the values (from a least-squares line), or 0 if there are fewer than two checkpoints.
+    '''
+    if len(steps) < 2:
+        return 0.0
+    return float(np.polyfit(steps, values, 1)[0])
+
+
+def get_floor_growth(values):
+    '''
+    Returns the growth of the lowest value in the last half of the checkpoints, from the lowest value in the first half.
+    Note: objects that are only alive at some checkpoints (e.g. made by one interaction and freed by a later one) make the counts
+        go up and down, so only growth that stays for every later checkpoint is counted.
+    '''
+    half = len(values) // 2
+    if half == 0:
+        return 0
+    return min(values[half:]) - min(values[:half])
+
+
+def get_top_sites(start_snapshot, end_snapshot):
+    '''
+    Returns the allocation sites with the most growth between two snapshots, each with its source line and frames (most recent first).
+    '''
+    top_sites = []
+    for stat_diff in end_snapshot.compare_to(start_snapshot, 'traceback')[:NUM_TOP_SITES]:
+        if stat_diff.size_diff <= 0:
+            break
+        frames = list(reversed(stat_diff.traceback))
+        top_sites.append({
+            'size_diff_bytes': stat_diff.size_diff,
+            'count_diff': stat_diff.count_diff,
+            'line': linecache.getline(frames[0].filename, frames[0].lineno).strip(),
+            'traceback': [f'{frame.filename}:{frame.lineno}' for frame in frames]
+        })
+
+    return top_sites
+
+
+def get_report(soak_test, num_steps, checkpoint_every, warmup, seed):
+    samples, checkpoints = soak_test.samples, soak_test.checkpoints
+
+    kinds = {}
+    for sample in samples:
+        kinds.setdefault(sample['kind'], []).append(sample)
+
+    # Note: checkpoints before the end of the warmup are left out of the growth (e.g. caches and imports are filled then)
+    measured = [checkpoint for checkpoint in checkpoints if checkpoint['step'] >= warmup] or checkpoints[-1:]
+    first, last = measured[0], measured[-1]
+    steps = [checkpoint['step'] for checkpoint in measured]
+
+    watcher_growth = {}
+    for obj_key in set().union(*[checkpoint['watcher_counts'].keys() for checkpoint in measured]):
+        obj_growth = get_floor_growth([checkpoint['watcher_counts'].get(obj_key, 0) for checkpoint in measured])
+        if obj_growth > 0:
+            watcher_growth[obj_key] = obj_growth
+    watcher_growth = dict(sorted(watcher_growth.items(), key = lambda item: -item[1]))
+
+    growth = {
+        'steps': last['step'] - first['step'],
+        'traced_bytes': last['traced_bytes'] - first['traced_bytes'],
+        'traced_bytes_per_step': get_slope(steps, [checkpoint['traced_bytes'] for checkpoint in measured]),
+        'num_models': get_floor_growth([checkpoint['num_models'] for checkpoint in measured]),
+        'num_watchers': get_floor_growth([sum(checkpoint['watcher_counts'].values()) for checkpoint in measured]),
+        'num_watched_objects': get_floor_growth([len(checkpoint['watcher_counts']) for checkpoint in measured]),
+        'watcher_growth': watcher_growth,
+        'top_sites': get_top_sites(first['snapshot'], last['snapshot'])
+    }
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'panel': pn.__version__,
+            'bokeh': bokeh.__version__,
+            'paramztns': soak_test.paramztns,
+            'steps': num_steps,
+            'checkpoint_every': checkpoint_every,
+            'warmup': warmup,
+            'seed': seed
+        },
+        'kinds': {kind: {'count': len(kind_samples),
+                         'mean_wall_s': float(np.mean([sample['wall_s'] for sample in kind_samples])),
+                         'mean_alloc_bytes': float(np.mean([sample['alloc_bytes'] for sample in kind_samples])),
+                         'total_alloc_bytes': int(sum(sample['alloc_bytes'] for sample in kind_samples)),
+                         'total_model_change': int(sum(sample['model_change'] for sample in kind_samples)),
+                         'errored': sum(sample['errored'] for sample in kind_samples)}
+                  for kind, kind_samples in sorted(kinds.items())},
+        'checkpoints': [{key: value for key, value in checkpoint.items() if key not in ['snapshot', 'watcher_counts']} |
+                        {'num_watchers': sum(checkpoint['watcher_counts'].values())} for checkpoint in checkpoints],
+        'growth': growth,
+        'failures': soak_test.failures,
+        'samples': samples
+    }
+
+
+def get_leaks(report, max_bytes_per_step):
+    '''
+    Returns a list of descriptions of the growth after the warmup that is counted as a leak (empty if the session reached a steady state).
+    '''
+    growth, leaks = report['growth'], []
+    if growth['num_models'] > 0:
+        leaks.append(f'{growth["num_models"]} more document models')
+    if growth['num_watchers'] > 0:
+        leaks.append(f'{growth["num_watchers"]} more param watchers (on {growth["num_watched_objects"]} more objects)')
+    if growth['traced_bytes_per_step'] > max_bytes_per_step:
+        leaks.append(f'{growth["traced_bytes_per_step"] / 1e3:.1f} kB more traced memory per step')
+    return leaks
+
+
+def get_report_table(report, leaks):
+    report_lines = [f'{"Interaction":<18}{"Count":>7}{"Mean (ms)":>11}{"Alloc/step (kB)":>17}{"Models (net)":>14}']
+    for kind, kind_stats in report['kinds'].items():
+        report_lines.append(
+            f'{kind:<18}{kind_stats["count"]:>7}{1000 * kind_stats["mean_wall_s"]:>11.1f}'
+            f'{kind_stats["mean_alloc_bytes"] / 1e3:>17.1f}{kind_stats["total_model_change"]:>14}'
+        )
+
+    growth = report['growth']
+    report_lines += [
+        '',
+        f'Growth over the last {growth["steps"]} steps (between checkpoints in the same state):',
+        f'    traced memory: {growth["traced_bytes"] / 1e6:+.2f} MB ({growth["traced_bytes_per_step"] / 1e3:+.2f} kB per step)',
+        f'    document models: {growth["num_models"]:+}',
+        f'    param watchers: {growth["num_watchers"]:+} (watched objects: {growth["num_watched_objects"]:+})'
+    ]
+
+    for obj_key, count in list(growth['watcher_growth'].items())[:NUM_TOP_SITES]:
+        report_lines.append(f'        {obj_key}: +{count}')
+
+    if len(growth['top_sites']) > 0:
+        report_lines += ['', 'Top allocation sites:']
+        for site in growth['top_sites']:
+            report_lines.append(f'    {site["size_diff_bytes"] / 1e3:+9.1f} kB {site["count_diff"]:+7} blocks  {site["traceback"][0]}  {site["line"]}')
+
+    if len(report['failures']) > 0:
+        report_lines += ['', f'{len(report["failures"])} steps failed (see the report for the tracebacks)']
+
+    report_lines += ['', 'Leaks: ' + ('; '.join(leaks) if len(leaks) > 0 else 'none (steady state)')]
+    return '\n'.join(report_lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Memory soak test of a long-running BAGLE Calculator session.')
+    parser.add_argument('--steps', type = int, default = 2000, help = 'Number of random interactions (default: 2000)')
+    parser.add_argument('--checkpoint-every', type = int, default = 200, help = 'Number of steps between checkpoints (default: 200)')
+    parser.add_argument('--warmup', type = int, default = 400,
+                        help = 'Number of steps before the growth is measured, so that caches can fill up (default: 400)')
+    parser.add_argument('--paramztns', nargs = '+', default = DEFAULT_PARAMZTNS, choices = constants.ALL_MODS, metavar = 'PARAMZTN',
+                        help = 'Parameterizations that are randomly selected (at least 2, the first is the reference state of the checkpoints)')
+    parser.add_argument('--seed', type = int, default = 0, help = 'Seed of the random interactions (default: 0)')
+    parser.add_argument('--trace-frames', type = int, default = 1,
+                        help = 'Number of frames kept for each allocation site (more frames are slower, default: 1)')
+    parser.add_argument('--max-bytes-per-step', type = float, default = 10000,
+                        help = 'Traced memory growth per step (after the warmup) that is counted as a leak (default: 10000)')
+    parser.add_argument('--stand-in', action = 'store_true', help = 'Use the stand-in BAGLE models (see benchmarks.stand_in_bagle)')
+    parser.add_argument('--output', default = 'bench_soak.json', help = 'Path of the JSON report (default: bench_soak.json)')
+    args = parser.parse_args()
+
+    if len(args.paramztns) < 2:
+        parser.error('at least 2 parameterizations are needed')
+
+    app_module = headless.load_app(stand_in = args.stand_in)
+    soak_test = SoakTest(app_module, args.paramztns, seed = args.seed, trace_frames = args.trace_frames)
+    soak_test.run(args.steps, args.checkpoint_every)
+
+    report = get_report(soak_test, args.steps, args.checkpoint_every, args.warmup, args.seed)
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent = 1)
+
+    leaks = get_leaks(report, args.max_bytes_per_step)
+    print(get_report_table(report, leaks))
+    print(f'\nReport written to {args.output}')
+
+    # Note: the exit status is 1 if a leak is found, so that the soak test can be run on CI
+    if len(leaks) > 0:
+        sys.exit(1)
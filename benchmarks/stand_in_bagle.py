@@ -0,0 +1,365 @@
+################################################
+# Packages
+################################################
+import re
+import sys
+import types
+
+import numpy as np
+import celerite
+
+from app_utils import constants, catalog
+
+
+################################################
+# Stand-in BAGLE Models
+################################################
+# Note: this is a deterministic stand-in for 'bagle.model', so that the benchmarks can run without BAGLE installed (see 'install').
+    # It has the same classes, parameter names, and method signatures/array shapes that the app uses,
+    # but the light curves and astrometry are simple closed-form approximations (e.g. binary lenses are a perturbed point lens).
+    # So the timings are of the app's update paths, and not of BAGLE's models.
+
+# Parameter names used by the parameterization classes
+    # Note: these follow the BAGLE version the app is made for, so parameters without slider ranges in 'constants.DEFAULT_RANGES' 
+    # (e.g. 'dmag_Lp_Ls' of some BAGLE versions) are left out
+PL_PHOT = ('t0', 'u0_amp', 'tE', 'piE_E', 'piE_N')
+PL_MASS = ('mL', 't0', 'beta', 'dL', 'dL_dS', 'xS0_E', 'xS0_N', 'muL_E', 'muL_N', 'muS_E', 'muS_N')
+PL_THETAE = ('t0', 'u0_amp', 'tE', 'thetaE', 'piS', 'piE_E', 'piE_N', 'xS0_E', 'xS0_N', 'muS_E', 'muS_N')
+PL_LOG_THETAE = ('t0', 'u0_amp', 'tE', 'log10_thetaE', 'piS', 'piE_E', 'piE_N', 'xS0_E', 'xS0_N', 'muS_E', 'muS_N')
+PL_LOG_THETAE_PIE = ('t0', 'u0_amp', 'tE', 'log10_thetaE', 'piS', 'piEN_piEE', 'piE_E', 'xS0_E', 'xS0_N', 'muS_E', 'muS_N')
+BL_MASS = ('mLp', 'mLs', 't0', 'xS0_E', 'xS0_N', 'beta', 'muL_E', 'muL_N', 'muS_E', 'muS_N', 'dL', 'dS')
+BL_MASS_P = ('mLp', 'mLs', 't0_p', 'xS0_E', 'xS0_N', 'beta_p', 'muL_E', 'muL_N', 'muS_E', 'muS_N', 'dL', 'dS')
+
+SRC = ('b_sff', 'mag_src')
+BASE = ('b_sff', 'mag_base')
+BS_SRC = ('mag_src_pri', 'mag_src_sec', 'b_sff')
+BS_BASE = ('fratio_bin', 'mag_base', 'b_sff')
+
+GP_LOG_RHO = ('gp_log_sigma', 'gp_log_rho', 'gp_log_S0', 'gp_log_omega0')
+GP_OMEGA04 = ('gp_log_sigma', 'gp_rho', 'gp_log_omega04_S0', 'gp_log_omega0')
+GP_OMEGA0 = ('gp_log_sigma', 'gp_rho', 'gp_log_omega0_S0', 'gp_log_omega0')
+JIT = ('gp_log_jit_sigma',)
+
+# Dictionary of parameterization class name (see 'catalog.get_paramztn_info') to (fitter_param_names, phot_param_names, phot_optional_param_names)
+PARAM_CLASSES = {
+    'PSPL_PhotParam1': (PL_PHOT, SRC, ()),
+    'PSPL_PhotParam2': (PL_PHOT, BASE, ()),
+    'PSPL_GP_PhotParam1': (PL_PHOT, SRC, GP_LOG_RHO),
+    'PSPL_GP_PhotParam2': (PL_PHOT, BASE, GP_LOG_RHO),
+    'PSPL_GP_PhotParam1_2': (PL_PHOT, SRC, GP_OMEGA04),
+    'PSPL_GP_PhotParam2_2': (PL_PHOT, BASE, GP_OMEGA04),
+    'PSPL_GP_PhotParam2_3': (PL_PHOT, BASE, GP_OMEGA0),
+    'PSPL_GP_PhotParam2_4': (PL_PHOT, BASE, GP_OMEGA04 + JIT),
+    'PSPL_GP_PhotParam2_5': (PL_PHOT, BASE, GP_OMEGA0 + JIT),
+    'PSPL_AstromParam3': (PL_LOG_THETAE, (), ()),
+    'PSPL_AstromParam4': (PL_LOG_THETAE, (), ()),
+    'PSPL_PhotAstromParam1': (PL_MASS, SRC, ()),
+    'PSPL_PhotAstromParam2': (PL_THETAE, SRC, ()),
+    'PSPL_PhotAstromParam3': (PL_LOG_THETAE, BASE, ()),
+    'PSPL_PhotAstromParam4': (PL_THETAE, BASE, ()),
+    'PSPL_PhotAstromParam5': (PL_LOG_THETAE_PIE, BASE, ()),
+    'PSPL_GP_PhotAstromParam1': (PL_MASS, SRC, GP_OMEGA04),
+    'PSPL_GP_PhotAstromParam2': (PL_THETAE, SRC, GP_OMEGA04),
+    'PSPL_GP_PhotAstromParam3': (PL_LOG_THETAE, BASE, GP_OMEGA04),
+    'PSPL_GP_PhotAstromParam3_1': (PL_LOG_THETAE, BASE, GP_OMEGA0),
+    'PSPL_GP_PhotAstromParam3_2': (PL_LOG_THETAE, BASE, GP_OMEGA0 + JIT),
+    'PSPL_GP_PhotAstromParam4': (PL_THETAE, BASE, GP_OMEGA04),
+    'PSPL_GP_PhotAstromParam4_1': (PL_THETAE, BASE, GP_OMEGA0),
+    'PSPL_GP_PhotAstromParam4_2': (PL_THETAE, BASE, GP_OMEGA0 + JIT),
+    'PSBL_PhotParam1': (PL_PHOT + ('q', 'sep', 'phi'), SRC, ()),
+    'PSBL_GP_PhotParam1': (PL_PHOT + ('q', 'sep', 'phi'), SRC, GP_LOG_RHO),
+    'PSBL_PhotAstromParam1': (BL_MASS + ('sep', 'alpha'), SRC, ()),
+    'PSBL_PhotAstromParam2': (PL_THETAE + ('q', 'sep', 'alpha'), SRC, ()),
+    'PSBL_PhotAstromParam3': (PL_LOG_THETAE + ('q', 'sep', 'alpha'), BASE, ()),
+    'PSBL_PhotAstromParam7': (BL_MASS_P + ('sep', 'alpha'), SRC, ()),
+    'PSBL_GP_PhotAstromParam1': (BL_MASS + ('sep', 'alpha'), SRC, GP_LOG_RHO),
+    'PSBL_GP_PhotAstromParam2': (PL_THETAE + ('q', 'sep', 'alpha'), SRC, GP_LOG_RHO),
+    'BSPL_PhotParam1': (PL_PHOT + ('sep', 'phi'), BS_SRC, ()),
+    'BSPL_GP_PhotParam1': (PL_PHOT + ('sep', 'phi'), BS_SRC, GP_OMEGA04),
+    'BSPL_PhotAstromParam1': (PL_MASS + ('sep', 'alpha'), BS_SRC, ()),
+    'BSPL_PhotAstromParam2': (PL_THETAE + ('sep', 'alpha'), BS_BASE, ()),
+    'BSPL_PhotAstromParam3': (PL_LOG_THETAE + ('sep', 'alpha'), BS_BASE, ()),
+    'BSPL_GP_PhotAstromParam1': (PL_MASS + ('sep', 'alpha'), BS_SRC, GP_OMEGA04),
+    'BSPL_GP_PhotAstromParam2': (PL_THETAE + ('sep', 'alpha'), BS_BASE, GP_OMEGA04),
+    'BSPL_GP_PhotAstromParam3': (PL_LOG_THETAE + ('sep', 'alpha'), BS_BASE, GP_OMEGA04),
+    'BSBL_PhotAstromParam1': (BL_MASS + ('sepL', 'alphaL', 'sepS', 'alphaS'), BS_SRC, ()),
+    'BSBL_PhotAstromParam2': (BL_MASS_P + ('sepL', 'alphaL', 'sepS', 'alphaS'), BS_SRC, ()),
+}
+
+# Constant of the Einstein radius (mas/Msun), and days in a year
+KAPPA = 8.144
+DAYS_PER_YEAR = 365.25
+
+
+def get_param_class_name(paramztn):
+    '''
+    Returns the name of the parameterization class of a parameterization (the same way as 'catalog.get_paramztn_info').
+    '''
+    srclens, data, par, gp = catalog.get_mod_types(paramztn)
+    class_num = re.search('Param.*', paramztn).group()
+    if gp == 'GP':
+        return '_'.join([srclens, 'GP', data + class_num])
+    else:
+        return '_'.join([srclens, data + class_num])
+
+
+class StandInModel:
+    '''
+    Base class of the stand-in models. The parameter names are set by the subclasses made in 'make_model_classes'.
+    Note: like BAGLE, photometry parameters are given as arrays (one value per filter), and only the first filter is used.
+    '''
+
+    fitter_param_names = []
+    phot_param_names = []
+    phot_optional_param_names = []
+    ast_optional_param_names = []
+    binary_source = False
+    binary_lens = False
+    parallax = False
+
+    def __init__(self, **params):
+        required_names = self.fitter_param_names + self.phot_param_names + self.phot_optional_param_names
+        if self.parallax == True:
+            required_names = required_names + ['raL', 'decL']
+
+        missing_names = [param_name for param_name in required_names if param_name not in params]
+        if len(missing_names) != 0:
+            raise TypeError(f'{type(self).__name__} is missing parameters: {missing_names}')
+
+        for param_name, val in params.items():
+            setattr(self, param_name, val)
+
+        self._set_derived_params()
+
+    def _get(self, param_name, default = None):
+        val = getattr(self, param_name, default)
+        if isinstance(val, (list, np.ndarray)):
+            return float(np.ravel(val)[0])
+        return val
+
+    def _set_derived_params(self):
+        # Time of closest approach and Einstein crossing time
+        self.t0 = self._get('t0', self._get('t0_p', constants.DEFAULT_RANGES['t0'][1]))
+
+        # Einstein radius (mas)
+        if hasattr(self, 'thetaE'):
+            self.thetaE_amp = self._get('thetaE')
+        elif hasattr(self, 'log10_thetaE'):
+            self.thetaE_amp = 10 ** self._get('log10_thetaE')
+        elif hasattr(self, 'dL'):
+            mass = self._get('mL', None) or (self._get('mLp', 1) + self._get('mLs', 1))
+            dL = self._get('dL')
+            dS = self._get('dS', dL / self._get('dL_dS', 0.5))
+            self.piRel = 1000 / dL - 1000 / dS
+            self.thetaE_amp = np.sqrt(KAPPA * mass * max(self.piRel, 1e-6))
+        else:
+            # Note: photometry-only models don't have an Einstein radius, so the default is used for their (unused) astrometry
+            self.thetaE_amp = constants.DEFAULT_RANGES['thetaE'][1]
+
+        # Proper motions (mas/yr)
+        self.muS = np.array([self._get('muS_E', 0), self._get('muS_N', 0)])
+        self.muL = np.array([self._get('muL_E', 0), self._get('muL_N', 0)])
+        self.muRel = self.muS - self.muL
+        self.muRel_amp = max(np.hypot(*self.muRel), 0.1)
+
+        if hasattr(self, 'tE') == False:
+            self.tE = DAYS_PER_YEAR * self.thetaE_amp / self.muRel_amp
+        if hasattr(self, 'u0_amp') == False:
+            self.u0_amp = self._get('beta', self._get('beta_p', 0.2)) / self.thetaE_amp
+
+        if hasattr(self, 'piE_E') == True:
+            self.piE_amp = np.hypot(self._get('piE_E'), self._get('piE_N', self._get('piE_E') * self._get('piEN_piEE', 1)))
+
+        # Source and lens positions at t0 (arcsec)
+        self.xS0 = np.array([self._get('xS0_E', 0), self._get('xS0_N', 0)])
+        self.u0_hat = np.array([0.6, -0.8])
+        self.xL0 = self.xS0 - (self.u0_amp * self.thetaE_amp * self.u0_hat) / 1e3
+
+        # Binary separations (in units of thetaE) and angles (rad)
+        self.sep_src = self._get('sepS', self._get('sep', 0)) / self.thetaE_amp if self.binary_source == True else 0
+        self.sep_lens = self._get('sepL', self._get('sep', 0)) / self.thetaE_amp if self.binary_lens == True else 0
+        self.alpha_rad = np.deg2rad(self._get('alphaS', self._get('alpha', self._get('phi', 0))))
+
+    ########################
+    # Positions
+    ########################
+    def _get_tau(self, t):
+        return (np.asarray(t) - self.t0) / self.tE
+
+    def _get_src_offsets(self):
+        # Offsets (in thetaE) of each source from the source position
+        if self.binary_source == True:
+            offset = 0.5 * self.sep_src * np.array([np.cos(self.alpha_rad), np.sin(self.alpha_rad)])
+            return [-offset, offset]
+        return [np.zeros(2)]
+
+    def _get_u_vecs(self, t):
+        # Position (in thetaE) of each source relative to the lens, with shape (number of sources, N, 2)
+        tau = self._get_tau(t)
+        mu_hat = np.array([-self.u0_hat[1], self.u0_hat[0]])
+        u_vec = self.u0_amp * self.u0_hat + tau[:, None] * mu_hat
+        return np.array([u_vec + src_offset for src_offset in self._get_src_offsets()])
+
+    def get_lens_astrometry(self, t):
+        dt = (np.asarray(t) - self.t0) / DAYS_PER_YEAR
+        return self.xL0 + np.outer(dt, self.muL) / 1e3
+
+    def get_resolved_lens_astrometry(self, t):
+        lens_ast = self.get_lens_astrometry(t)
+        offset = 0.5 * self.sep_lens * self.thetaE_amp * np.array([np.cos(self.alpha_rad), np.sin(self.alpha_rad)]) / 1e3
+        return np.array([lens_ast - offset, lens_ast + offset])
+
+    def get_astrometry_unlensed(self, t):
+        dt = (np.asarray(t) - self.t0) / DAYS_PER_YEAR
+        return self.xS0 + np.outer(dt, self.muS) / 1e3
+
+    def get_resolved_astrometry_unlensed(self, t):
+        src_ast = self.get_astrometry_unlensed(t)
+        src_offsets = [src_offset * self.thetaE_amp / 1e3 for src_offset in self._get_src_offsets()]
+        return np.stack([src_ast + src_offset for src_offset in src_offsets], axis = 1)
+
+    ########################
+    # Images
+    ########################
+    def get_all_arrays(self, t):
+        '''
+        Returns the image positions (relative to the lens, in thetaE) and amplifications,
+        with shapes (N, number of sources, number of images, 2) and (N, number of sources, number of images).
+        Note: a binary lens has 5 images, where the 3 extra images are faint images near the lenses.
+        '''
+        u_vecs = self._get_u_vecs(t)
+        u = np.maximum(np.linalg.norm(u_vecs, axis = -1), 1e-6)
+        u_hat = u_vecs / u[..., None]
+
+        # Point-lens images (major and minor)
+        root = np.sqrt(u ** 2 + 4)
+        image_arr = [u_hat * ((u + root) / 2)[..., None], u_hat * ((u - root) / 2)[..., None]]
+        amp_arr = [(u ** 2 + 2) / (2 * u * root) + 0.5, (u ** 2 + 2) / (2 * u * root) - 0.5]
+
+        if self.binary_lens == True:
+            lens_offset = 0.5 * self.sep_lens * np.array([np.cos(self.alpha_rad), np.sin(self.alpha_rad)])
+            for lens_pos in [-lens_offset, lens_offset, np.zeros(2)]:
+                image_arr.append(np.broadcast_to(lens_pos, u_vecs.shape) - 0.05 * u_hat)
+                amp_arr.append(0.01 / (1 + u ** 2))
+
+        image_arr = np.stack(image_arr, axis = -2).transpose(1, 0, 2, 3)
+        amp_arr = np.stack(amp_arr, axis = -1).transpose(1, 0, 2)
+        return image_arr, amp_arr
+
+    def _get_images(self, t, image_arr, amp_arr):
+        if image_arr is None:
+            image_arr, amp_arr = self.get_all_arrays(t)
+
+        # Image positions (arcsec) with shape (N, number of sources, number of images, 2)
+        lens_ast = self.get_lens_astrometry(t)
+        image_ast = lens_ast[:, None, None, :] + image_arr * self.thetaE_amp / 1e3
+        return image_ast, amp_arr
+
+    def get_resolved_astrometry(self, t, image_arr = None, amp_arr = None):
+        image_ast, amp_arr = self._get_images(t, image_arr, amp_arr)
+
+        # Note: the shapes match BAGLE's (see 'traces.Ast_PS_ResLensed' and 'traces.Ast_BS_ResLensed')
+        if self.binary_source == True:
+            return image_ast
+        elif self.binary_lens == True:
+            return image_ast[:, 0]
+        else:
+            return image_ast[:, 0].transpose(1, 0, 2)
+
+    def get_astrometry(self, t, image_arr = None, amp_arr = None):
+        image_ast, amp_arr = self._get_images(t, image_arr, amp_arr)
+        src_fluxes = self._get_src_fluxes()[None, :, None]
+        weights = amp_arr * src_fluxes
+        return (image_ast * weights[..., None]).sum(axis = (1, 2)) / weights.sum(axis = (1, 2))[:, None]
+
+    ########################
+    # Photometry
+    ########################
+    def _get_src_fluxes(self):
+        if self.binary_source == True:
+            if hasattr(self, 'fratio_bin'):
+                fratio = self._get('fratio_bin')
+                return np.array([1, fratio]) / (1 + fratio)
+            flux_pri, flux_sec = 10 ** (-0.4 * self._get('mag_src_pri')), 10 ** (-0.4 * self._get('mag_src_sec'))
+            return np.array([flux_pri, flux_sec]) / (flux_pri + flux_sec)
+        return np.array([1.0])
+
+    def get_amplification(self, t):
+        image_arr, amp_arr = self.get_all_arrays(t)
+        return (amp_arr.sum(axis = 2) * self._get_src_fluxes()).sum(axis = 1)
+
+    def get_photometry(self, t, filt_idx = 0, print_warning = True):
+        b_sff = self._get('b_sff', 1)
+        if hasattr(self, 'mag_base'):
+            mag_base = self._get('mag_base')
+        elif hasattr(self, 'mag_src'):
+            mag_base = self._get('mag_src') + 2.5 * np.log10(b_sff)
+        else:
+            flux_src = 10 ** (-0.4 * self._get('mag_src_pri')) + 10 ** (-0.4 * self._get('mag_src_sec'))
+            mag_base = -2.5 * np.log10(flux_src) + 2.5 * np.log10(b_sff)
+
+        return mag_base - 2.5 * np.log10(b_sff * (self.get_amplification(t) - 1) + 1)
+
+
+class Celerite_GP_Model(celerite.modeling.Model):
+    '''
+    Mean model of a GP (i.e. the photometry of a model in one filter), which is used the same way as BAGLE's.
+    '''
+    parameter_names = ()
+
+    def __init__(self, model, filt_idx):
+        self.model = model
+        self.filt_idx = filt_idx
+        super().__init__()
+
+    def get_value(self, t):
+        return self.model.get_photometry(t, self.filt_idx)
+
+
+def make_model_classes():
+    '''
+    Returns a dictionary of class name to class, for every parameterization class and model class (i.e. paramztn) of the app.
+    '''
+    model_classes = {}
+    for param_class_name, (fitter_names, phot_names, phot_optional_names) in PARAM_CLASSES.items():
+        model_classes[param_class_name] = type(param_class_name, (StandInModel,), {
+            'fitter_param_names': list(fitter_names),
+            'phot_param_names': list(phot_names),
+            'phot_optional_param_names': list(phot_optional_names),
+            'ast_optional_param_names': []
+        })
+
+    for paramztn in constants.ALL_MODS:
+        srclens, data, par, gp = catalog.get_mod_types(paramztn)
+        model_classes[paramztn] = type(paramztn, (model_classes[get_param_class_name(paramztn)],), {
+            'binary_source': srclens.startswith('BS'),
+            'binary_lens': srclens.endswith('BL'),
+            'parallax': par == 'Par'
+        })
+
+    return model_classes
+
+
+################################################
+# Install Stand-in
+################################################
+def install():
+    '''
+    Makes 'bagle.model' the stand-in module. This needs to be called before BAGLE is first used (i.e. before the app is imported).
+    Note: the app imports BAGLE lazily by name (see 'app_utils.lazy_imports'), so it then uses the stand-in models.
+    '''
+    loaded_module = sys.modules.get('bagle.model')
+    if (loaded_module != None) and (getattr(loaded_module, 'STAND_IN', False) == False):
+        raise RuntimeError("'bagle.model' was already imported, so the stand-in can't be installed")
+
+    model_module = types.ModuleType('bagle.model')
+    model_module.STAND_IN = True
+    model_module.Celerite_GP_Model = Celerite_GP_Model
+    for class_name, model_class in make_model_classes().items():
+        setattr(model_module, class_name, model_class)
+
+    bagle_module = sys.modules.get('bagle') or types.ModuleType('bagle')
+    bagle_module.model = model_module
+    sys.modules['bagle'] = bagle_module
+    sys.modules['bagle.model'] = model_module
+    return model_module
@@ -0,0 +1,146 @@
+################################################
+# Packages
+################################################
+import sys
+import argparse
+
+import numpy as np
+
+from app_utils import constants, styles
+from benchmarks import headless
+
+
+################################################
+# Trace State Cache Check
+################################################
+# Note: run from the app directory with 'python -m benchmarks.trace_cache_check' (see '--help').
+    # Trace updates run in the model pool while the session's widgets can still change (see 'traces.AllTraceInfo.update_all_traces').
+    # For each parameterization, the traces are updated for a new set of inputs around a checkbox change (see 'check_paramztn'),
+    # and the state stored in the trace state cache for those inputs is compared with a fresh 'compute_trace_state' of the same inputs.
+    # Any difference is a cached state that doesn't match its key (e.g. traces or cache entries left over from the live traces).
+    # The exit status is 1 if a difference is found.
+
+# Parameterizations with astrometry (and extra astrometry checkboxes), without the GP parameterizations (which aren't cached)
+    # Note: the binary parameterizations (e.g. 'PSBL_PhotAstrom_noPar_Param1' and 'BSPL_PhotAstrom_noPar_Param1') need the dev-branch BAGLE
+        # (see README), so they are only checked by default with '--stand-in'
+DEFAULT_PARAMZTNS = ['PSPL_PhotAstrom_noPar_Param1', 'PSPL_PhotAstrom_Par_Param2']
+STAND_IN_PARAMZTNS = DEFAULT_PARAMZTNS + ['PSBL_PhotAstrom_noPar_Param1', 'BSPL_PhotAstrom_noPar_Param1']
+
+
+def is_equal(val_1, val_2):
+    '''
+    Returns whether two trace values (i.e. nested dictionaries, lists, arrays, and scalars) are equal.
+    '''
+    if isinstance(val_1, dict) or isinstance(val_2, dict):
+        return (isinstance(val_1, dict) and isinstance(val_2, dict) and (val_1.keys() == val_2.keys()) and
+                all(is_equal(val_1[key], val_2[key]) for key in val_1.keys()))
+
+    if isinstance(val_1, (list, tuple)) and isinstance(val_2, (list, tuple)) and (len(val_1) != len(val_2)):
+        return False
+
+    if isinstance(val_1, (list, tuple)) and (len(val_1) != 0) and not isinstance(val_1[0], (int, float, np.number)):
+        return all(is_equal(sub_val_1, sub_val_2) for sub_val_1, sub_val_2 in zip(val_1, val_2))
+
+    try:
+        return np.array_equal(np.asarray(val_1), np.asarray(val_2), equal_nan = True)
+    except TypeError:
+        return bool(np.all(np.asarray(val_1) == np.asarray(val_2)))
+
+
+def get_state_diffs(cached_state, fresh_state):
+    '''
+    Returns a list of the trace data (as 'trace key.attribute') and cache entries that differ between two trace states.
+    '''
+    diffs = []
+    for trace_key in sorted(set(cached_state['trace_data'].keys()) | set(fresh_state['trace_data'].keys())):
+        cached_data = cached_state['trace_data'].get(trace_key, {})
+        fresh_data = fresh_state['trace_data'].get(trace_key, {})
+        for attr in sorted(set(cached_data.keys()) | set(fresh_data.keys())):
+            if (attr not in cached_data) or (attr not in fresh_data) or (is_equal(cached_data[attr], fresh_data[attr]) == False):
+                diffs.append(f'{trace_key}.{attr}')
+
+    # Note: the model is a new object in every state, so only its key ('mod_key') is compared
+    for cache_key in sorted((set(cached_state['cache'].keys()) | set(fresh_state['cache'].keys())) - {'mod'}):
+        if ((cache_key not in cached_state['cache']) or (cache_key not in fresh_state['cache']) or
+            (is_equal(cached_state['cache'][cache_key], fresh_state['cache'][cache_key]) == False)):
+            diffs.append(f'cache.{cache_key}')
+
+    return diffs
+
+
+def get_moved_inputs(trace_info, settings_tabs):
+    '''
+    Returns the current trace inputs with the first parameter moved by one slider step (see 'AllTraceInfo._prefetch_neighbours').
+    '''
+    trace_inputs = trace_info.get_trace_inputs()
+    param_name = trace_info.paramztn_info.selected_params[0]
+    slider = settings_tabs.param_sliders[param_name]
+    val = slider.value + slider.step if (slider.value + slider.step <= slider.end) else slider.value - slider.step
+    mod_param_values = dict(trace_inputs['mod_param_values'])
+    mod_param_values[param_name] = np.array([val]) if param_name in trace_info.paramztn_info.selected_phot_params else val
+    return {**trace_inputs, 'mod_param_values': mod_param_values}
+
+
+def check_paramztn(app_module, paramztn):
+    '''
+    Returns the differences (see 'get_state_diffs') between the cached and fresh trace states of a parameterization,
+    after its traces were updated for new inputs around checkbox changes. Each difference starts with the checkbox change it was found after:
+        'ast_checkbox': the extra astrometry traces are hidden after the inputs were read (i.e. while the update "runs"),
+        'dashboard_checkbox': the astrometry plots are hidden before the inputs are read (i.e. after the traces had astrometry).
+    '''
+    diffs = []
+    for checkbox_name in ['ast_checkbox', 'dashboard_checkbox']:
+        session = headless.HeadlessSession(app_module)
+        session.select_paramztn(paramztn)
+        settings_tabs, trace_info = session.settings_tabs, session.dashboard.trace_info
+
+        # Show every extra astrometry trace
+        ast_checkbox = settings_tabs.ast_checkbox
+        session.set_value(ast_checkbox, list(ast_checkbox.values))
+
+        if checkbox_name == 'ast_checkbox':
+            trace_inputs = get_moved_inputs(trace_info, settings_tabs)
+            session.set_value(ast_checkbox, [])
+        else:
+            dashboard_checkbox = settings_tabs.dashboard_checkbox
+            session.set_value(dashboard_checkbox, [name for name in dashboard_checkbox.value if name not in styles.AST_PLOT_NAMES])
+            trace_inputs = get_moved_inputs(trace_info, settings_tabs)
+
+        # Finish the update with the inputs it was started with
+        with session.in_doc():
+            trace_info.clear_caches()
+            trace_info.update_all_traces(trace_inputs)
+
+        cached_state = trace_info.get_cached_state(trace_info.get_state_key(trace_inputs))
+        if cached_state == None:
+            diffs.append(f'{checkbox_name}: no cached state')
+        else:
+            state_diffs = get_state_diffs(cached_state, trace_info.compute_trace_state(trace_inputs))
+            diffs += [f'{checkbox_name}: {diff}' for diff in state_diffs]
+
+    return diffs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Checks that cached BAGLE Calculator trace states match their inputs.')
+    parser.add_argument('--paramztns', nargs = '+', default = None, choices = constants.ALL_MODS, metavar = 'PARAMZTN',
+                        help = 'Parameterizations to check (default: DEFAULT_PARAMZTNS, or STAND_IN_PARAMZTNS with --stand-in)')
+    parser.add_argument('--stand-in', action = 'store_true', help = 'Use the stand-in BAGLE models (see benchmarks.stand_in_bagle)')
+    args = parser.parse_args()
+
+    app_module = headless.load_app(stand_in = args.stand_in)
+    if args.paramztns == None:
+        args.paramztns = STAND_IN_PARAMZTNS if args.stand_in == True else DEFAULT_PARAMZTNS
+
+    num_failed = 0
+    for paramztn in args.paramztns:
+        diffs = check_paramztn(app_module, paramztn)
+        if len(diffs) == 0:
+            print(f'{paramztn:<36}OK')
+        else:
+            num_failed += 1
+            print(f'{paramztn:<36}FAILED: {"; ".join(diffs)}')
+
+    # Note: the exit status is 1 if a cached state doesn't match its inputs, so that the check can be run on CI
+    if num_failed > 0:
+        sys.exit(1)
@@ -0,0 +1,14 @@
+################################################
+# Server Setup
+################################################
+# Setup script that adds the metrics route (see 'app_utils.routes') to the server. This is used with
+    # 'panel serve app.py --setup server_setup.py'
+    # Note: the setup script is run before 'app.py', so the app directory needs to be added to the path for 'app_utils'
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app_utils import routes
+
+routes.add_metrics_route()